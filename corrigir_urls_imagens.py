@@ -8,6 +8,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'imoveis_caixa.settings')
 django.setup()
 
 from propriedades.models import Propriedade
+from propriedades.cache_respostas import incrementar_geracao
 
 # Configuração de logging
 logging.basicConfig(
@@ -56,6 +57,8 @@ def main():
                     if not url_atual or len(url_atual.split('F')[-1].split('.')[0]) != 15:  # 13 dígitos + "21"
                         # Atualizar a URL
                         imovel.imagem_url = nova_url
+                        # A nova URL ainda não foi verificada pelo pré-carregamento de imagens
+                        imovel.imagem_disponivel = None
                         imovel.save()
                         logger.info(f"URL corrigida para o imóvel {imovel.codigo}")
                         logger.info(f"  Antiga: {url_atual}")
@@ -70,6 +73,10 @@ def main():
                 urls_invalidas += 1
                 continue
         
+        # imagem_url e imagem_disponivel fazem parte das respostas cacheadas da API
+        if urls_corrigidas:
+            incrementar_geracao()
+        
         # Relatório final
         logger.info("\n=== Relatório Final ===")
         logger.info(f"Total de imóveis processados: {total_imoveis}")
@@ -155,6 +155,41 @@ HERE_API_KEY_2 = os.environ.get('HERE_API_KEY_2')
 HERE_API_KEY_3 = os.environ.get('HERE_API_KEY_3')
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 
+# Cache do Django (respostas da API de imóveis e contador de geração dos dados).
+# O backend em arquivo é compartilhado entre os workers e o importador, que avança a geração.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache', 'django')),
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('DJANGO_CACHE_MAX_ENTRIES', 5000))},
+    }
+}
+PROPRIEDADES_CACHE_TIMEOUT = int(os.environ.get('PROPRIEDADES_CACHE_TIMEOUT', 3600))
+
+# Cache dos tiles de imóveis do mapa (disco compartilhado entre processos + LRU em memória por worker)
+TILES_CACHE_DIR = os.environ.get('TILES_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'tiles'))
+TILES_CACHE_MEMORIA = int(os.environ.get('TILES_CACHE_MEMORIA', 512))
+# Zoom máximo guardado em disco (acima dele os tiles são gerados a cada requisição) e tamanho máximo do cache
+TILES_ZOOM_MAXIMO_CACHE = int(os.environ.get('TILES_ZOOM_MAXIMO_CACHE', 14))
+TILES_CACHE_TAMANHO_MAXIMO = int(os.environ.get('TILES_CACHE_TAMANHO_MAXIMO_MB', 256)) * 1024 * 1024
+
+# Cache em disco das fotos servidas pelo proxy de imagens (endereçado pelo hash da URL, remoção LRU)
+IMAGENS_CACHE_DIR = os.environ.get('IMAGENS_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'imagens'))
+IMAGENS_CACHE_TAMANHO_MAXIMO = int(os.environ.get('IMAGENS_CACHE_TAMANHO_MAXIMO_MB', 1024)) * 1024 * 1024
+IMAGENS_CACHE_TTL = int(os.environ.get('IMAGENS_CACHE_TTL_DIAS', 30)) * 24 * 60 * 60
+# Qualidade das variantes reduzidas (?w=320|800) geradas pelo proxy de imagens
+IMAGENS_QUALIDADE_WEBP = int(os.environ.get('IMAGENS_QUALIDADE_WEBP', 75))
+IMAGENS_QUALIDADE_JPEG = int(os.environ.get('IMAGENS_QUALIDADE_JPEG', 80))
+# Pré-carregamento das fotos dos imóveis novos após cada importação
+IMAGENS_PREFETCH_APOS_IMPORTACAO = os.environ.get('IMAGENS_PREFETCH_APOS_IMPORTACAO', 'True') == 'True'
+IMAGENS_PREFETCH_WORKERS = int(os.environ.get('IMAGENS_PREFETCH_WORKERS', 4))
+# URLs que deram 404 não voltam à Caixa por este tempo
+IMAGENS_CACHE_TTL_NEGATIVO = int(os.environ.get('IMAGENS_CACHE_TTL_NEGATIVO_MINUTOS', 10)) * 60
+
+# Conexões mantidas abertas com o site da Caixa por processo e validade dos cookies da página principal
+CAIXA_POOL_CONEXOES = int(os.environ.get('CAIXA_POOL_CONEXOES', 10))
+CAIXA_VALIDADE_COOKIES = int(os.environ.get('CAIXA_VALIDADE_COOKIES_MINUTOS', 30)) * 60
+
 # Configurações do Google OAuth
 if IS_DEVELOPMENT:
     GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID_DEV')
@@ -6,12 +6,15 @@ import csv
 from io import StringIO
 from decimal import Decimal
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
 from dotenv import load_dotenv
 from validacao_geografica import ValidadorGeografico
 import urllib3
 import random
+import threading
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Desabilitar avisos de certificado não verificado
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -20,7 +23,15 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'imoveis_caixa.settings')
 django.setup()
 
-from propriedades.models import Propriedade, ImagemPropriedade
+from django.db import connection, transaction
+from django.utils import timezone
+from propriedades.models import Propriedade, ImagemPropriedade, CacheGeocodificacao
+from propriedades.geo import reconstruir_indice_quadkey
+from propriedades.tiles import invalidar_tiles
+from propriedades.cache_respostas import incrementar_geracao
+from propriedades.facetas import materializar_facetas
+from propriedades.aquecimento_imagens import aquecer_imagens
+from django.conf import settings
 
 # Configuração de logging
 log_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'importacao.log')
@@ -59,8 +70,71 @@ logger.info("Iniciando configuração de logging")
 # Carregar variáveis de ambiente
 load_dotenv()
 
+class GravadorLote:
+    """Acumula imóveis processados e grava em lotes com upsert pelo código"""
+
+    def __init__(self, tamanho_lote=500, campos_atualizacao=None):
+        self.tamanho_lote = tamanho_lote
+        # Campos sobrescritos quando o código já existe no banco
+        self.campos_atualizacao = campos_atualizacao
+        self.pendentes = []
+        self.total_gravados = 0
+
+    def adicionar(self, imovel):
+        """Adiciona um imóvel (instância não salva de Propriedade) ao lote atual"""
+        self.pendentes.append(imovel)
+        if len(self.pendentes) >= self.tamanho_lote:
+            self.gravar()
+
+    def gravar(self):
+        """Grava os imóveis pendentes em um único INSERT ... ON CONFLICT"""
+        if not self.pendentes:
+            return 0
+        Propriedade.objects.bulk_create(
+            self.pendentes,
+            update_conflicts=True,
+            unique_fields=['codigo'],
+            update_fields=self.campos_atualizacao,
+        )
+        gravados = len(self.pendentes)
+        self.total_gravados += gravados
+        self.pendentes = []
+        logger.info(f"Lote de {gravados} imóveis gravado no banco")
+        return gravados
+
 class ImportadorCaixa:
-    def __init__(self):
+    # Campos derivados do CSV da Caixa
+    CAMPOS_CSV = [
+        'tipo', 'tipo_imovel', 'endereco', 'bairro', 'cidade', 'estado', 'valor',
+        'valor_avaliacao', 'desconto', 'descricao', 'modalidade_venda', 'area',
+        'area_total', 'area_privativa', 'area_terreno', 'quartos', 'link', 'matricula_url'
+    ]
+    # Campos sobrescritos pelo upsert quando o código já existe no banco
+    CAMPOS_UPSERT = CAMPOS_CSV + ['latitude', 'longitude', 'imagem_url', 'hash_conteudo', 'data_atualizacao']
+    # Campos sobrescritos quando o conteúdo de um imóvel existente muda no CSV
+    CAMPOS_ALTERACAO = CAMPOS_CSV + ['hash_conteudo', 'data_atualizacao']
+    # Campos usados na geocodificação: se mudarem, as coordenadas gravadas deixam de valer
+    CAMPOS_ENDERECO = ['endereco', 'cidade', 'estado']
+    CAMPOS_ALTERACAO_ENDERECO = CAMPOS_ALTERACAO + ['latitude', 'longitude']
+
+    def __init__(self, max_workers=None, max_conexoes_host=None, tamanho_lote=None, validador_geografico=None):
+        """
+        Args:
+            max_workers (int): Número de estados processados em paralelo (1 = sequencial)
+            max_conexoes_host (int): Máximo de downloads simultâneos no site da Caixa
+            tamanho_lote (int): Quantidade de imóveis por INSERT em lote
+            validador_geografico (ValidadorGeografico): Validador já carregado a ser reaproveitado
+        """
+        self.max_workers = max_workers or int(os.environ.get('IMPORTACAO_MAX_WORKERS', 4))
+        self.tamanho_lote = tamanho_lote or int(os.environ.get('IMPORTACAO_TAMANHO_LOTE', 500))
+        self.max_conexoes_host = max_conexoes_host or int(os.environ.get('IMPORTACAO_MAX_CONEXOES_HOST', 2))
+        # Limita as conexões simultâneas ao site da Caixa, independente do número de workers
+        self.semaforo_host = threading.BoundedSemaphore(self.max_conexoes_host)
+        # Limite próprio para a API do Here Maps (cota por segundo diferente da Caixa)
+        self.semaforo_here = threading.BoundedSemaphore(int(os.environ.get('HERE_MAX_CONEXOES', 2)))
+        self.here_max_tentativas = int(os.environ.get('HERE_MAX_TENTATIVAS', 4))
+        # Protege o estado compartilhado da rotação de API keys entre as threads
+        self.lock_api = threading.Lock()
         self.session = requests.Session()
         self.base_url = "https://venda-imoveis.caixa.gov.br/listaweb/Lista_imoveis_{}.csv"
         self.headers = {
@@ -82,9 +156,13 @@ class ImportadorCaixa:
             os.environ.get('HERE_API_KEY_3')
         ]
         self.current_api_key_index = 0
-        self.validador_geografico = ValidadorGeografico()
+        self.validador_geografico = validador_geografico or ValidadorGeografico()
         self.todas_apis_indisponiveis = False  # Nova flag para controlar disponibilidade das APIs
-        self.apis_com_erro = set()  # Conjunto para rastrear quais APIs já retornaram erro
+        self.apis_com_erro = set()  # APIs desabilitadas por chave inválida (401)
+        # Cache persistente de geocodificação (resultados negativos expiram antes)
+        self.ttl_geocodificacao = timedelta(days=int(os.environ.get('GEOCODIFICACAO_TTL_DIAS', 180)))
+        self.ttl_geocodificacao_negativo = timedelta(days=int(os.environ.get('GEOCODIFICACAO_TTL_NEGATIVO_DIAS', 7)))
+        self.estatisticas_geocodificacao = {'hits': 0, 'misses': 0}
         logger.info("Iniciando nova sessão de importação")
 
         # Inicializar a sessão com uma visita à página principal
@@ -358,18 +436,96 @@ class ImportadorCaixa:
         tipo = partes[0].strip()
         return tipo if tipo else None
 
+    def _normalizar_endereco(self, endereco):
+        """Normaliza o endereço usado como chave do cache de geocodificação"""
+        return ' '.join((endereco or '').upper().split())
+
+    def _contar_geocodificacao(self, tipo):
+        """Incrementa o contador de acertos ('hits') ou faltas ('misses') do cache de geocodificação"""
+        with self.lock_api:
+            self.estatisticas_geocodificacao[tipo] += 1
+
+    def _consultar_cache_geocodificacao(self, endereco_normalizado):
+        """Retorna (latitude, longitude) do cache, (None, None) para resultado negativo ou None se ausente/expirado"""
+        try:
+            entrada = CacheGeocodificacao.objects.filter(endereco_normalizado=endereco_normalizado).first()
+        except Exception as e:
+            logger.error(f"Erro ao consultar cache de geocodificação: {str(e)}")
+            return None
+        if not entrada:
+            return None
+
+        ttl = self.ttl_geocodificacao_negativo if entrada.sem_resultado else self.ttl_geocodificacao
+        if entrada.data_consulta < timezone.now() - ttl:
+            logger.debug(f"Entrada expirada no cache de geocodificação: {endereco_normalizado}")
+            return None
+
+        if entrada.sem_resultado:
+            return None, None
+        return float(entrada.latitude), float(entrada.longitude)
+
+    def _gravar_cache_geocodificacao(self, endereco_normalizado, latitude, longitude):
+        """Grava o resultado de uma consulta ao geocodificador (inclusive resultados negativos)"""
+        sem_resultado = not (latitude and longitude)
+        try:
+            CacheGeocodificacao.objects.update_or_create(
+                endereco_normalizado=endereco_normalizado,
+                defaults={
+                    'latitude': None if sem_resultado else Decimal(str(latitude)),
+                    'longitude': None if sem_resultado else Decimal(str(longitude)),
+                    'provedor': 'here',
+                    'sem_resultado': sem_resultado,
+                }
+            )
+        except Exception as e:
+            logger.error(f"Erro ao gravar cache de geocodificação: {str(e)}")
+
     def _obter_coordenadas(self, endereco, cidade, estado):
-        """Obtém as coordenadas de um endereço usando a API do Here Maps"""
+        """Obtém as coordenadas de um endereço, consultando o cache antes da API do Here Maps"""
+        endereco_normalizado = self._normalizar_endereco(endereco)
+        em_cache = self._consultar_cache_geocodificacao(endereco_normalizado)
+
+        if em_cache is not None:
+            self._contar_geocodificacao('hits')
+            latitude, longitude = em_cache
+        else:
+            self._contar_geocodificacao('misses')
+            resultado = self._geocodificar_here(endereco)
+            if resultado is None:
+                # Falha de API não é gravada no cache para ser tentada novamente
+                return None, None
+            latitude, longitude = resultado
+            self._gravar_cache_geocodificacao(endereco_normalizado, latitude, longitude)
+
+        if latitude and longitude:
+            # Validar as coordenadas
+            if self.validador_geografico.validar_coordenadas(latitude, longitude, cidade, estado):
+                return latitude, longitude
+            else:
+                logger.warning(f"Coordenadas inválidas para o endereço: {endereco}")
+                return None, None
+
+        logger.warning(f"Nenhuma coordenada encontrada para o endereço: {endereco}")
+        return None, None
+
+    def _geocodificar_here(self, endereco):
+        """Consulta a API do Here Maps.
+
+        Returns:
+            tuple: (latitude, longitude), (None, None) se o endereço não foi encontrado
+                   ou None em caso de erro da API
+        """
         if self.todas_apis_indisponiveis:
             logger.warning("Todas as APIs do Here Maps estão indisponíveis. Pulando consulta de coordenadas.")
-            return None, None
+            return None
 
         try:
             # Tentar obter coordenadas com a API atual
-            api_key = self.api_keys[self.current_api_key_index]
+            indice_api = self.current_api_key_index
+            api_key = self.api_keys[indice_api]
             if not api_key:
-                logger.error(f"API key {self.current_api_key_index + 1} não configurada")
-                return None, None
+                logger.error(f"API key {indice_api + 1} não configurada")
+                return None
 
             url = f"https://geocode.search.hereapi.com/v1/geocode"
             params = {
@@ -377,45 +533,56 @@ class ImportadorCaixa:
                 'apiKey': api_key
             }
 
-            response = requests.get(url, params=params)
+            for tentativa in range(self.here_max_tentativas):
+                with self.semaforo_here:
+                    response = requests.get(url, params=params, timeout=30)
+                if response.status_code != 429:
+                    break
+                # Limite de requisições excedido: é temporário, aguardar e tentar de novo
+                if tentativa + 1 < self.here_max_tentativas:
+                    espera = self._espera_here(response, tentativa)
+                    logger.warning(f"API {indice_api + 1} retornou 429; nova tentativa em {espera:.1f}s")
+                    time.sleep(espera)
+            else:
+                logger.error(f"API {indice_api + 1} continua retornando 429; endereço fica para a próxima importação")
+                return None
             
-            # Se receber erro 429 (Too Many Requests) ou 401 (Unauthorized)
-            if response.status_code in [429, 401]:
-                logger.error(f"API {self.current_api_key_index + 1} retornou erro {response.status_code}")
-                self.apis_com_erro.add(self.current_api_key_index)
-                
-                # Se todas as APIs já retornaram erro
-                if len(self.apis_com_erro) == len(self.api_keys):
-                    logger.error("Todas as APIs do Here Maps retornaram erro. Desabilitando consultas.")
-                    self.todas_apis_indisponiveis = True
-                    return None, None
-                
-                # Tentar próxima API
-                self.current_api_key_index = (self.current_api_key_index + 1) % len(self.api_keys)
-                return self._obter_coordenadas(endereco, cidade, estado)
+            # Chave inválida ou revogada (401): desabilitar permanentemente e usar a próxima
+            if response.status_code == 401:
+                with self.lock_api:
+                    logger.error(f"API {indice_api + 1} retornou erro {response.status_code}")
+                    self.apis_com_erro.add(indice_api)
+                    
+                    # Se todas as APIs já retornaram erro
+                    if len(self.apis_com_erro) == len(self.api_keys):
+                        logger.error("Todas as APIs do Here Maps retornaram erro. Desabilitando consultas.")
+                        self.todas_apis_indisponiveis = True
+                        return None
+                    
+                    # Tentar próxima API (outra thread pode já ter avançado o índice)
+                    if self.current_api_key_index == indice_api:
+                        self.current_api_key_index = (indice_api + 1) % len(self.api_keys)
+                return self._geocodificar_here(endereco)
 
             response.raise_for_status()
             data = response.json()
 
             if data.get('items'):
                 position = data['items'][0].get('position', {})
-                latitude = position.get('lat')
-                longitude = position.get('lng')
-
-                if latitude and longitude:
-                    # Validar as coordenadas
-                    if self.validador_geografico.validar_coordenadas(latitude, longitude, cidade, estado):
-                        return latitude, longitude
-                    else:
-                        logger.warning(f"Coordenadas inválidas para o endereço: {endereco}")
-                        return None, None
+                return position.get('lat'), position.get('lng')
 
-            logger.warning(f"Nenhuma coordenada encontrada para o endereço: {endereco}")
             return None, None
 
         except requests.exceptions.RequestException as e:
             logger.error(f"Erro ao obter coordenadas: {str(e)}")
-            return None, None
+            return None
+
+    def _espera_here(self, response, tentativa):
+        """Tempo de espera após um 429: Retry-After, se informado, ou backoff exponencial com jitter"""
+        try:
+            return min(float(response.headers['Retry-After']), 60)
+        except (KeyError, ValueError):
+            return 2 ** tentativa + random.random()
 
     def _obter_url_imagem(self, codigo):
         """Obtém a URL da imagem do imóvel usando o padrão F{id_imovel}21 com padding de zeros"""
@@ -430,99 +597,97 @@ class ImportadorCaixa:
             logger.error(f"Erro ao gerar URL da imagem: {str(e)}")
             return None
 
+    def _extrair_dados_csv(self, dados):
+        """Converte uma linha do CSV nos campos do imóvel, sem consultas externas"""
+        codigo = dados.get('N° do imóvel', '').strip()
+        if not codigo:
+            return None
+
+        # Extrair área e quartos da descrição
+        descricao = dados.get('Descrição', '').strip()
+        logger.debug(f"Descrição do imóvel: {descricao[:100]}...")
+        
+        area_total, area_privativa, area_terreno, quartos = self._extrair_area_quartos(descricao)
+        logger.debug(f"Áreas extraídas - Total: {area_total}, Privativa: {area_privativa}, Terreno: {area_terreno}, Quartos: {quartos}")
+
+        # Extrair tipo do imóvel
+        tipo_imovel = self._extrair_tipo_imovel(descricao)
+        logger.debug(f"Tipo do imóvel: {tipo_imovel}")
+
+        # Processar valores monetários
+        valor = self._limpar_valor(dados.get('Preço', '0'))
+        valor_avaliacao = self._limpar_valor(dados.get('Valor de avaliação', '0'))
+        logger.debug(f"Valores processados - Preço: R$ {valor}, Avaliação: R$ {valor_avaliacao}")
+        
+        # Processar desconto
+        desconto_texto = dados.get('Desconto', '0').replace('%', '').strip()
+        try:
+            desconto = Decimal(desconto_texto)
+            logger.debug(f"Desconto processado: {desconto}%")
+        except Exception as e:
+            logger.error(f"Erro ao processar desconto '{desconto_texto}': {str(e)}")
+            desconto = Decimal('0')
+
+        endereco = dados.get('Endereço', '').strip()
+        bairro = dados.get('Bairro', '').strip()
+        cidade = dados.get('Cidade', '').strip()
+        estado = dados.get('UF', '').strip()
+        link = dados.get('Link de acesso', '').strip()
+        
+        logger.debug(f"Endereço completo: {endereco}, {bairro}, {cidade} - {estado}")
+
+        # Gerar URL da matrícula
+        matricula_url = None
+        # Formatar o código com zeros à esquerda se necessário
+        codigo_formatado = codigo.zfill(13)
+        if estado:
+            matricula_url = f"https://venda-imoveis.caixa.gov.br/editais/matricula/{estado}/{codigo_formatado}.pdf"
+            logger.debug(f"URL da matrícula gerada: {matricula_url}")
+
+        # Montar o objeto do imóvel
+        imovel = {
+            'codigo': codigo,
+            'tipo': 'Residencial',  # Valor padrão
+            'tipo_imovel': tipo_imovel,
+            'endereco': endereco,
+            'bairro': bairro,
+            'cidade': cidade,
+            'estado': estado,
+            'valor': valor,
+            'valor_avaliacao': valor_avaliacao,
+            'desconto': desconto,
+            'descricao': descricao,
+            'modalidade_venda': dados.get('Modalidade de venda', '').strip(),
+            'area': area_privativa or area_total or area_terreno or Decimal('0'),
+            'area_total': area_total,
+            'area_privativa': area_privativa,
+            'area_terreno': area_terreno,
+            'quartos': quartos or 0,
+            'link': link,
+            'matricula_url': matricula_url
+        }
+        imovel['hash_conteudo'] = self._calcular_hash_conteudo(imovel)
+        return imovel
+
+    def _calcular_hash_conteudo(self, imovel):
+        """Calcula o hash SHA-256 dos campos do CSV já normalizados de um imóvel"""
+        valores = [imovel['codigo']] + [
+            '' if imovel.get(campo) is None else str(imovel[campo])
+            for campo in self.CAMPOS_CSV
+        ]
+        return hashlib.sha256('\x1f'.join(valores).encode('utf-8')).hexdigest()
+
     def _processar_imovel(self, dados):
         """Processa os dados de um imóvel do CSV"""
         try:
             codigo = dados.get('N° do imóvel', '').strip()
             logger.info(f"\nProcessando imóvel {codigo}")
             
-            if not codigo:
+            imovel = self._extrair_dados_csv(dados)
+            if not imovel:
                 logger.error("Imóvel sem código, ignorando")
                 return None
-
-            # Verificar se o imóvel já existe e tem coordenadas
-            imovel_existente = Propriedade.objects.filter(codigo=codigo).first()
-            if imovel_existente and imovel_existente.latitude is not None and imovel_existente.longitude is not None:
-                logger.info(f"Imóvel {codigo} já possui coordenadas cadastradas. Pulando validação.")
-                return None
-
-            # Extrair área e quartos da descrição
-            descricao = dados.get('Descrição', '').strip()
-            logger.info(f"Descrição do imóvel: {descricao[:100]}...")
-            
-            area_total, area_privativa, area_terreno, quartos = self._extrair_area_quartos(descricao)
-            logger.info(f"Áreas extraídas - Total: {area_total}, Privativa: {area_privativa}, Terreno: {area_terreno}, Quartos: {quartos}")
-
-            # Extrair tipo do imóvel
-            tipo_imovel = self._extrair_tipo_imovel(descricao)
-            logger.info(f"Tipo do imóvel: {tipo_imovel}")
-
-            # Processar valores monetários
-            valor = self._limpar_valor(dados.get('Preço', '0'))
-            valor_avaliacao = self._limpar_valor(dados.get('Valor de avaliação', '0'))
-            logger.info(f"Valores processados - Preço: R$ {valor}, Avaliação: R$ {valor_avaliacao}")
-            
-            # Processar desconto
-            desconto_texto = dados.get('Desconto', '0').replace('%', '').strip()
-            try:
-                desconto = Decimal(desconto_texto)
-                logger.info(f"Desconto processado: {desconto}%")
-            except Exception as e:
-                logger.error(f"Erro ao processar desconto '{desconto_texto}': {str(e)}")
-                desconto = Decimal('0')
-
-            endereco = dados.get('Endereço', '').strip()
-            bairro = dados.get('Bairro', '').strip()
-            cidade = dados.get('Cidade', '').strip()
-            estado = dados.get('UF', '').strip()
-            link = dados.get('Link de acesso', '').strip()
-            
-            logger.info(f"Endereço completo: {endereco}, {bairro}, {cidade} - {estado}")
-
-            # Gerar URL da matrícula
-            matricula_url = None
-            if codigo:
-                # Formatar o código com zeros à esquerda se necessário
-                codigo_formatado = codigo.zfill(13)
-                if estado:
-                    matricula_url = f"https://venda-imoveis.caixa.gov.br/editais/matricula/{estado}/{codigo_formatado}.pdf"
-                    logger.info(f"URL da matrícula gerada: {matricula_url}")
-
-            # Montar o objeto do imóvel
-            imovel = {
-                'codigo': codigo,
-                'tipo': 'Residencial',  # Valor padrão
-                'tipo_imovel': tipo_imovel,
-                'endereco': endereco,
-                'bairro': bairro,
-                'cidade': cidade,
-                'estado': estado,
-                'valor': valor,
-                'valor_avaliacao': valor_avaliacao,
-                'desconto': desconto,
-                'descricao': descricao,
-                'modalidade_venda': dados.get('Modalidade de venda', '').strip(),
-                'area': area_privativa or area_total or area_terreno or Decimal('0'),
-                'area_total': area_total,
-                'area_privativa': area_privativa,
-                'area_terreno': area_terreno,
-                'quartos': quartos or 0,
-                'link': link,
-                'matricula_url': matricula_url
-            }
-
-            # Coletar coordenadas apenas para imóveis novos ou sem coordenadas
-            endereco_completo = f"{endereco}, {cidade}, {estado}, Brasil"
-            logger.info(f"Buscando coordenadas para: {endereco_completo}")
-            
-            latitude, longitude = self._obter_coordenadas(endereco_completo, cidade, estado)
-            imovel['latitude'] = latitude
-            imovel['longitude'] = longitude
-            
-            if latitude and longitude:
-                logger.info(f"Coordenadas obtidas: Latitude={latitude}, Longitude={longitude}")
-            else:
-                logger.warning(f"Não foi possível obter coordenadas para o imóvel {codigo}")
+            self._geocodificar_imovel(imovel)
 
             # Obter URL da imagem usando apenas o código
             logger.info(f"Buscando imagem para o imóvel {codigo}")
@@ -543,55 +708,53 @@ class ImportadorCaixa:
             logger.error(traceback.format_exc())
             return None
 
-    def _salvar_imovel(self, dados_imovel):
-        """Salva ou atualiza um imóvel no banco de dados"""
-        try:
-            if not dados_imovel or not dados_imovel.get('codigo'):
-                logger.warning("Tentativa de salvar imóvel sem código")
-                return None
-
-            # Garantir que os campos numéricos sejam do tipo correto
-            dados_para_salvar = {
-                'codigo': dados_imovel['codigo'],
-                'tipo': dados_imovel.get('tipo', 'Residencial'),
-                'tipo_imovel': dados_imovel.get('tipo_imovel'),
-                'endereco': dados_imovel.get('endereco', ''),
-                'bairro': dados_imovel.get('bairro', ''),
-                'cidade': dados_imovel.get('cidade', ''),
-                'estado': dados_imovel.get('estado', ''),
-                'valor': Decimal(str(dados_imovel.get('valor', '0'))),
-                'valor_avaliacao': Decimal(str(dados_imovel.get('valor_avaliacao', '0'))),
-                'desconto': Decimal(str(dados_imovel.get('desconto', '0'))),
-                'descricao': dados_imovel.get('descricao', ''),
-                'modalidade_venda': dados_imovel.get('modalidade_venda', ''),
-                'area': Decimal(str(dados_imovel.get('area', '0'))),
-                'area_total': Decimal(str(dados_imovel.get('area_total', '0'))) if dados_imovel.get('area_total') else None,
-                'area_privativa': Decimal(str(dados_imovel.get('area_privativa', '0'))) if dados_imovel.get('area_privativa') else None,
-                'area_terreno': Decimal(str(dados_imovel.get('area_terreno', '0'))) if dados_imovel.get('area_terreno') else None,
-                'quartos': int(dados_imovel.get('quartos', 0)),
-                'link': dados_imovel.get('link', ''),
-                'latitude': Decimal(str(dados_imovel.get('latitude', '0'))) if dados_imovel.get('latitude') else None,
-                'longitude': Decimal(str(dados_imovel.get('longitude', '0'))) if dados_imovel.get('longitude') else None,
-                'imagem_url': dados_imovel.get('imagem_url'),
-                'matricula_url': dados_imovel.get('matricula_url'),
-            }
-
-            logger.debug(f"Tentando salvar imóvel com dados: {dados_para_salvar}")
+    @staticmethod
+    def _endereco_geocodificacao(endereco, cidade, estado):
+        """Monta a consulta enviada ao geocodificador (e usada como chave do cache) para um imóvel"""
+        return f"{endereco}, {cidade}, {estado}, Brasil"
 
-            imovel, criado = Propriedade.objects.update_or_create(
-                codigo=dados_para_salvar['codigo'],
-                defaults=dados_para_salvar
-            )
-
-            status = 'criado' if criado else 'atualizado'
-            logger.info(f"Imóvel {dados_para_salvar['codigo']} {status} com sucesso")
-            return imovel
+    def _geocodificar_imovel(self, imovel):
+        """Preenche latitude e longitude do imóvel a partir do endereço (None se não encontradas)"""
+        endereco, cidade, estado = imovel['endereco'], imovel['cidade'], imovel['estado']
+        endereco_completo = self._endereco_geocodificacao(endereco, cidade, estado)
+        logger.info(f"Buscando coordenadas para: {endereco_completo}")
+        
+        latitude, longitude = self._obter_coordenadas(endereco_completo, cidade, estado)
+        imovel['latitude'] = latitude
+        imovel['longitude'] = longitude
+        
+        if latitude and longitude:
+            logger.info(f"Coordenadas obtidas: Latitude={latitude}, Longitude={longitude}")
+        else:
+            logger.warning(f"Não foi possível obter coordenadas para o imóvel {imovel['codigo']}")
 
-        except Exception as e:
-            logger.error(f"Erro ao salvar imóvel {dados_imovel.get('codigo', 'sem código')}: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-            return None
+    def _preparar_dados_para_salvar(self, dados_imovel):
+        """Converte os dados processados de um imóvel para os tipos dos campos do modelo"""
+        return {
+            'codigo': dados_imovel['codigo'],
+            'tipo': dados_imovel.get('tipo', 'Residencial'),
+            'tipo_imovel': dados_imovel.get('tipo_imovel'),
+            'endereco': dados_imovel.get('endereco', ''),
+            'bairro': dados_imovel.get('bairro', ''),
+            'cidade': dados_imovel.get('cidade', ''),
+            'estado': dados_imovel.get('estado', ''),
+            'valor': Decimal(str(dados_imovel.get('valor', '0'))),
+            'valor_avaliacao': Decimal(str(dados_imovel.get('valor_avaliacao', '0'))),
+            'desconto': Decimal(str(dados_imovel.get('desconto', '0'))),
+            'descricao': dados_imovel.get('descricao', ''),
+            'modalidade_venda': dados_imovel.get('modalidade_venda', ''),
+            'area': Decimal(str(dados_imovel.get('area', '0'))),
+            'area_total': Decimal(str(dados_imovel.get('area_total', '0'))) if dados_imovel.get('area_total') else None,
+            'area_privativa': Decimal(str(dados_imovel.get('area_privativa', '0'))) if dados_imovel.get('area_privativa') else None,
+            'area_terreno': Decimal(str(dados_imovel.get('area_terreno', '0'))) if dados_imovel.get('area_terreno') else None,
+            'quartos': int(dados_imovel.get('quartos', 0)),
+            'link': dados_imovel.get('link', ''),
+            'latitude': Decimal(str(dados_imovel.get('latitude', '0'))) if dados_imovel.get('latitude') else None,
+            'longitude': Decimal(str(dados_imovel.get('longitude', '0'))) if dados_imovel.get('longitude') else None,
+            'imagem_url': dados_imovel.get('imagem_url'),
+            'matricula_url': dados_imovel.get('matricula_url'),
+            'hash_conteudo': dados_imovel.get('hash_conteudo'),
+        }
 
     def _validar_csv(self, conteudo):
         """Valida se o conteúdo parece ser um CSV válido"""
@@ -635,6 +798,196 @@ class ImportadorCaixa:
             print(f"Erro ao validar CSV: {str(e)}")
             return False
 
+    def _relatorio_geocodificacao(self):
+        """Registra no log os acertos e faltas do cache de geocodificação"""
+        hits = self.estatisticas_geocodificacao['hits']
+        misses = self.estatisticas_geocodificacao['misses']
+        total = hits + misses
+        taxa = (hits / total * 100) if total else 0
+        logger.info(f"Cache de geocodificação: {hits} acertos, {misses} consultas à API ({taxa:.1f}% de acerto)")
+
+    def _remover_imoveis_ausentes(self, estado, imoveis_existentes, codigos_novos):
+        """Remove de uma vez os imóveis do estado que não constam mais no CSV.
+
+        A diferença de conjuntos é feita em memória sobre os códigos já carregados e
+        a exclusão usa as chaves primárias. Como as relações com Propriedade são CASCADE
+        sem dependentes próprios, o Collector do Django apaga as imagens e favoritos
+        com um DELETE por tabela, sem carregar os registros em memória.
+        """
+        codigos_removidos = imoveis_existentes.keys() - codigos_novos
+        if not codigos_removidos:
+            return 0
+        
+        pks_removidos = [imoveis_existentes[codigo][0] for codigo in codigos_removidos]
+        _, excluidos_por_modelo = Propriedade.objects.filter(pk__in=pks_removidos).delete()
+        total_removidos = excluidos_por_modelo.get(Propriedade._meta.label, 0)
+        
+        logger.info(f"{total_removidos} imóveis não mais disponíveis removidos em {estado}")
+        for modelo, quantidade in excluidos_por_modelo.items():
+            if modelo != Propriedade._meta.label:
+                logger.info(f"  - {quantidade} registros de {modelo} removidos em cascata")
+        return total_removidos
+
+    def _importar_estado(self, estado):
+        """Baixa, processa e grava os imóveis de um estado, retornando os totais do estado"""
+        try:
+            logger.info(f"\n=== Processando estado: {estado} ===")
+            
+            total_atualizados = 0
+            total_removidos = 0
+            total_novos = 0
+            
+            logger.info(f"Baixando dados do estado: {estado}")
+            with self.semaforo_host:
+                conteudo_csv = self._baixar_csv(self.base_url.format(estado))
+            
+            if not conteudo_csv:
+                logger.error(f"Erro: Não foi possível baixar dados para {estado}")
+                return {'estado': estado, 'erro': "Falha ao baixar CSV"}
+                
+            logger.info("Dados baixados com sucesso!")
+            logger.info("Processando CSV...")
+            
+            # Processar dados do CSV
+            dados_novos = self._processar_csv(conteudo_csv)
+            if not dados_novos:
+                logger.error(f"Erro: Nenhum imóvel encontrado para {estado}")
+                return {'estado': estado, 'erro': "Nenhum imóvel encontrado"}
+            
+            logger.info(f"Total de imóveis encontrados no CSV: {len(dados_novos)}")
+            
+            # Obter códigos dos imóveis do CSV
+            codigos_novos = {item['N° do imóvel'] for item in dados_novos}
+            
+            # Buscar imóveis existentes na base em uma única consulta
+            # (código -> id, URL da imagem, hash, quadkey, endereço usado na geocodificação)
+            imoveis_existentes = {
+                codigo: (pk, imagem_url, hash_conteudo, quadkey, tuple(endereco))
+                for codigo, pk, imagem_url, hash_conteudo, quadkey, *endereco
+                in Propriedade.objects.filter(estado=estado).values_list(
+                    'codigo', 'pk', 'imagem_url', 'hash_conteudo', 'quadkey', *self.CAMPOS_ENDERECO
+                )
+            }
+            logger.info(f"Total de imóveis existentes no banco: {len(imoveis_existentes)}")
+            
+            # Processar cada imóvel do CSV (geocodificação fica fora da transação)
+            imoveis_processados = []
+            imoveis_alterados = []
+            imoveis_endereco_alterado = []
+            imoveis_sem_imagem = []
+            imoveis_sem_hash = []
+            total_inalterados = 0
+            codigos_vistos = set()
+            # Imóveis novos ou alterados nesta importação (fotos a pré-carregar)
+            codigos_imagens = set()
+            # Células do mapa cujo conteúdo muda nesta importação (para invalidar os tiles)
+            quadkeys_afetados = {
+                imoveis_existentes[codigo][3] for codigo in imoveis_existentes.keys() - codigos_novos
+            }
+            for item in dados_novos:
+                codigo = item['N° do imóvel']
+                # Um mesmo código não pode aparecer duas vezes no mesmo INSERT ... ON CONFLICT
+                if codigo in codigos_vistos:
+                    logger.warning(f"Imóvel {codigo} duplicado no CSV, ignorando repetição")
+                    continue
+                codigos_vistos.add(codigo)
+                
+                if codigo in imoveis_existentes:
+                    pk, imagem_url, hash_atual, quadkey, endereco_atual = imoveis_existentes[codigo]
+                    # Comparar o hash do conteúdo do CSV com o gravado na última importação
+                    dados_csv = self._extrair_dados_csv(item)
+                    endereco_alterado = dados_csv and tuple(dados_csv[campo] for campo in self.CAMPOS_ENDERECO) != endereco_atual
+                    if dados_csv and hash_atual is None and not endereco_alterado:
+                        # Gravado antes do hash existir: registrar o hash sem tratar o imóvel como alterado
+                        imoveis_sem_hash.append(Propriedade(pk=pk, hash_conteudo=dados_csv['hash_conteudo']))
+                        total_inalterados += 1
+                    elif dados_csv and dados_csv['hash_conteudo'] != hash_atual:
+                        if endereco_alterado:
+                            # Endereço mudou: as coordenadas antigas não valem mais
+                            logger.info(f"Imóvel existente com endereço alterado: {codigo}")
+                            self._geocodificar_imovel(dados_csv)
+                            imoveis_endereco_alterado.append(dados_csv)
+                        else:
+                            logger.info(f"Imóvel existente com conteúdo alterado: {codigo}")
+                            imoveis_alterados.append(dados_csv)
+                        quadkeys_afetados.add(quadkey)
+                        codigos_imagens.add(codigo)
+                    else:
+                        total_inalterados += 1
+                    # Verificar se precisa buscar a URL da imagem
+                    if not imagem_url:
+                        logger.info(f"Imóvel {codigo} não possui URL de imagem. Buscando...")
+                        url_imagem = self._obter_url_imagem(codigo)
+                        if url_imagem:
+                            imoveis_sem_imagem.append(Propriedade(pk=pk, imagem_url=url_imagem))
+                            codigos_imagens.add(codigo)
+                else:
+                    # Importar novo imóvel
+                    logger.info(f"Importando novo imóvel: {codigo}")
+                    imovel_processado = self._processar_imovel(item)
+                    if imovel_processado:
+                        imoveis_processados.append(imovel_processado)
+                        codigos_imagens.add(codigo)
+            
+            # Gravar todas as alterações do estado em uma única transação
+            with transaction.atomic():
+                # Remover imóveis que não estão mais no CSV
+                total_removidos = self._remover_imoveis_ausentes(estado, imoveis_existentes, codigos_novos)
+                
+                gravador = GravadorLote(tamanho_lote=self.tamanho_lote, campos_atualizacao=self.CAMPOS_UPSERT)
+                for imovel_processado in imoveis_processados:
+                    gravador.adicionar(Propriedade(**self._preparar_dados_para_salvar(imovel_processado)))
+                gravador.gravar()
+                total_novos = gravador.total_gravados
+                
+                # Imóveis alterados: reescrever apenas os campos do CSV, preservando coordenadas e imagem
+                gravador_alterados = GravadorLote(tamanho_lote=self.tamanho_lote, campos_atualizacao=self.CAMPOS_ALTERACAO)
+                for dados_csv in imoveis_alterados:
+                    gravador_alterados.adicionar(Propriedade(**self._preparar_dados_para_salvar(dados_csv)))
+                gravador_alterados.gravar()
+                total_atualizados = gravador_alterados.total_gravados
+                
+                # Endereço alterado: gravar também as novas coordenadas (ou limpá-las se não encontradas)
+                gravador_endereco = GravadorLote(tamanho_lote=self.tamanho_lote, campos_atualizacao=self.CAMPOS_ALTERACAO_ENDERECO)
+                for dados_csv in imoveis_endereco_alterado:
+                    gravador_endereco.adicionar(Propriedade(**self._preparar_dados_para_salvar(dados_csv)))
+                gravador_endereco.gravar()
+                total_atualizados += gravador_endereco.total_gravados
+                
+                if imoveis_sem_imagem:
+                    Propriedade.objects.bulk_update(imoveis_sem_imagem, ['imagem_url'], batch_size=self.tamanho_lote)
+                    logger.info(f"URL da imagem atualizada para {len(imoveis_sem_imagem)} imóveis")
+                
+                if imoveis_sem_hash:
+                    Propriedade.objects.bulk_update(imoveis_sem_hash, ['hash_conteudo'], batch_size=self.tamanho_lote)
+                    logger.info(f"Hash de conteúdo registrado para {len(imoveis_sem_hash)} imóveis importados antes do hash")
+            
+            # Relatório do estado
+            logger.info(f"\n=== Relatório do Estado {estado} ===")
+            logger.info(f"Total de imóveis removidos: {total_removidos}")
+            logger.info(f"Total de imóveis atualizados (conteúdo alterado): {total_atualizados}")
+            logger.info(f"Total de imóveis inalterados: {total_inalterados}")
+            logger.info(f"Total de imóveis novos: {total_novos}")
+            
+            return {
+                'estado': estado,
+                'removidos': total_removidos,
+                'atualizados': total_atualizados,
+                'novos': total_novos,
+                'quadkeys': quadkeys_afetados,
+                'codigos_imagens': codigos_imagens,
+            }
+            
+        except Exception as e:
+            logger.error(f"\nErro ao processar estado {estado}: {str(e)}")
+            import traceback
+            logger.error(traceback.format_exc())
+            return {'estado': estado, 'erro': str(e)}
+        finally:
+            # Cada thread abre sua própria conexão com o banco; fechar ao terminar o estado
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+
     def importar(self):
         """Importa dados de todos os estados"""
         logger.info("Iniciando processo de importação")
@@ -651,102 +1004,83 @@ class ImportadorCaixa:
             'novos': 0,
             'estados_com_erro': []
         }
+        quadkeys_afetados = set()
+        codigos_imagens = set()
+        
+        if self.max_workers > 1:
+            logger.info(f"Importação concorrente: {self.max_workers} estados em paralelo, "
+                        f"até {self.max_conexoes_host} downloads simultâneos")
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='importador') as executor:
+                futuros = [executor.submit(self._importar_estado, estado) for estado in estados]
+                resultados = [futuro.result() for futuro in as_completed(futuros)]
+        else:
+            resultados = [self._importar_estado(estado) for estado in estados]
+        
+        # Atualizar totais gerais
+        for resultado in resultados:
+            if 'erro' in resultado:
+                total_geral['estados_com_erro'].append((resultado['estado'], resultado['erro']))
+                continue
+            total_geral['atualizados'] += resultado['atualizados']
+            total_geral['removidos'] += resultado['removidos']
+            total_geral['novos'] += resultado['novos']
+            total_geral['estados_processados'] += 1
+            quadkeys_afetados |= resultado['quadkeys']
+            codigos_imagens |= resultado['codigos_imagens']
+        
+        # Atualizar a grade de clusters do mapa com as coordenadas importadas
+        try:
+            quadkeys_afetados |= reconstruir_indice_quadkey(tamanho_lote=self.tamanho_lote)
+        except Exception as e:
+            logger.error(f"Erro ao reconstruir índice quadkey: {str(e)}")
+        
+        # Descartar do cache apenas os tiles do mapa tocados por esta importação
+        try:
+            invalidar_tiles(quadkeys_afetados)
+        except Exception as e:
+            logger.error(f"Erro ao invalidar cache de tiles: {str(e)}")
+        
+        # Recalcular as facetas (estados, cidades, bairros e tipos) antes de publicar a nova geração
+        try:
+            materializar_facetas(tamanho_lote=self.tamanho_lote)
+        except Exception as e:
+            logger.error(f"Erro ao materializar facetas: {str(e)}")
+        
+        # Nova geração dos dados: as respostas cacheadas da API deixam de ser usadas
+        try:
+            incrementar_geracao()
+        except Exception as e:
+            logger.error(f"Erro ao avançar a geração do cache de respostas: {str(e)}")
         
-        for estado in estados:
+        # Baixar as fotos dos imóveis novos ou alterados para o cache, depois de publicar os dados
+        # (a verificação da base inteira fica com o comando aquecer_imagens)
+        if settings.IMAGENS_PREFETCH_APOS_IMPORTACAO and codigos_imagens:
             try:
-                logger.info(f"\n=== Processando estado: {estado} ===")
-                
-                total_atualizados = 0
-                total_removidos = 0
-                total_novos = 0
-                
-                logger.info(f"Baixando dados do estado: {estado}")
-                conteudo_csv = self._baixar_csv(self.base_url.format(estado))
-                
-                if not conteudo_csv:
-                    logger.error(f"Erro: Não foi possível baixar dados para {estado}")
-                    total_geral['estados_com_erro'].append((estado, "Falha ao baixar CSV"))
-                    continue
-                    
-                logger.info("Dados baixados com sucesso!")
-                logger.info("Processando CSV...")
-                
-                # Processar dados do CSV
-                dados_novos = self._processar_csv(conteudo_csv)
-                if not dados_novos:
-                    logger.error(f"Erro: Nenhum imóvel encontrado para {estado}")
-                    total_geral['estados_com_erro'].append((estado, "Nenhum imóvel encontrado"))
-                    continue
-                
-                logger.info(f"Total de imóveis encontrados no CSV: {len(dados_novos)}")
-                
-                # Obter códigos dos imóveis do CSV
-                codigos_novos = {item['N° do imóvel'] for item in dados_novos}
-                
-                # Buscar imóveis existentes na base
-                from propriedades.models import Propriedade
-                imoveis_existentes = Propriedade.objects.filter(estado=estado)
-                logger.info(f"Total de imóveis existentes no banco: {imoveis_existentes.count()}")
-                
-                # Remover imóveis que não estão mais no CSV
-                for imovel in imoveis_existentes:
-                    if imovel.codigo not in codigos_novos:
-                        logger.info(f"Removendo imóvel não mais disponível: {imovel.codigo}")
-                        imovel.delete()
-                        total_removidos += 1
-                
-                # Processar cada imóvel do CSV
-                for item in dados_novos:
-                    codigo = item['N° do imóvel']
-                    imovel_existente = Propriedade.objects.filter(codigo=codigo).first()
-                    
-                    if imovel_existente:
-                        logger.info(f"Imóvel existente encontrado: {codigo}")
-                        # Verificar se precisa buscar a URL da imagem
-                        if not imovel_existente.imagem_url:
-                            logger.info(f"Imóvel {codigo} não possui URL de imagem. Buscando...")
-                            url_imagem = self._obter_url_imagem(codigo)
-                            if url_imagem:
-                                imovel_existente.imagem_url = url_imagem
-                                imovel_existente.save()
-                                logger.info(f"URL da imagem atualizada para o imóvel {codigo}")
-                    else:
-                        # Importar novo imóvel
-                        logger.info(f"Importando novo imóvel: {codigo}")
-                        imovel_processado = self._processar_imovel(item)
-                        if imovel_processado and self._salvar_imovel(imovel_processado):
-                            total_novos += 1
-                            logger.info(f"Novo imóvel importado com sucesso: {codigo}")
-                
-                # Atualizar totais gerais
-                total_geral['atualizados'] += total_atualizados
-                total_geral['removidos'] += total_removidos
-                total_geral['novos'] += total_novos
-                total_geral['estados_processados'] += 1
-                
-                # Relatório do estado
-                logger.info(f"\n=== Relatório do Estado {estado} ===")
-                logger.info(f"Total de imóveis removidos: {total_removidos}")
-                logger.info(f"Total de imóveis atualizados (coordenadas): {total_atualizados}")
-                logger.info(f"Total de imóveis novos: {total_novos}")
-                
+                total_geral['imagens'] = aquecer_imagens(
+                    queryset=Propriedade.objects.filter(imagem_url__isnull=False),
+                    codigos=codigos_imagens,
+                    tamanho_lote=self.tamanho_lote,
+                )
+                if total_geral['imagens']['disponiveis'] or total_geral['imagens']['ausentes']:
+                    # imagem_disponivel mudou: invalidar as respostas cacheadas de novo
+                    incrementar_geracao()
             except Exception as e:
-                logger.error(f"\nErro ao processar estado {estado}: {str(e)}")
-                total_geral['estados_com_erro'].append((estado, str(e)))
-                import traceback
-                logger.error(traceback.format_exc())
+                logger.error(f"Erro ao pré-carregar imagens: {str(e)}")
         
         # Relatório final geral
         logger.info("\n=== Relatório Final Geral ===")
         logger.info(f"Estados processados com sucesso: {total_geral['estados_processados']}")
         logger.info(f"Total geral de imóveis:")
         logger.info(f"- Removidos: {total_geral['removidos']}")
-        logger.info(f"- Atualizados (coordenadas): {total_geral['atualizados']}")
+        logger.info(f"- Atualizados (conteúdo alterado): {total_geral['atualizados']}")
         logger.info(f"- Novos: {total_geral['novos']}")
+        self._relatorio_geocodificacao()
         if total_geral['estados_com_erro']:
             logger.error("\nEstados com erro:")
-            for estado, erro in total_geral['estados_com_erro']:
+            for estado, erro in sorted(total_geral['estados_com_erro']):
                 logger.error(f"- {estado}: {erro}")
+        
+        return total_geral
 
 def main():
     importador = ImportadorCaixa()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Propriedade, ImagemPropriedade
+from .models import Propriedade, ImagemPropriedade, CacheGeocodificacao, Faceta
 
 class ImagemPropriedadeInline(admin.TabularInline):
     model = ImagemPropriedade
@@ -18,3 +18,15 @@ class ImagemPropriedadeAdmin(admin.ModelAdmin):
     list_display = ['propriedade', 'url', 'ordem']
     list_filter = ['propriedade__cidade', 'propriedade__estado']
     search_fields = ['propriedade__codigo', 'url']
+
+@admin.register(CacheGeocodificacao)
+class CacheGeocodificacaoAdmin(admin.ModelAdmin):
+    list_display = ['endereco_normalizado', 'latitude', 'longitude', 'provedor', 'sem_resultado', 'data_consulta']
+    list_filter = ['provedor', 'sem_resultado']
+    search_fields = ['endereco_normalizado']
+
+@admin.register(Faceta)
+class FacetaAdmin(admin.ModelAdmin):
+    list_display = ['estado', 'cidade', 'bairro', 'tipo_imovel', 'quantidade']
+    list_filter = ['estado', 'tipo_imovel']
+    search_fields = ['cidade', 'bairro']
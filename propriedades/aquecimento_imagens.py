@@ -0,0 +1,87 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from django.conf import settings
+
+from .models import Propriedade
+from .imagens import LARGURAS_VARIANTES, FORMATOS_VARIANTES, obter_variante
+from .cliente_caixa import buscar_imagem, ImagemNaoEncontrada, ImagemInvalida
+
+logger = logging.getLogger(__name__)
+
+
+def _aquecer_imagem(url):
+    """
+    Baixa a foto para o cache em disco e gera as variantes reduzidas.
+    
+    Returns:
+        bool ou None: True se disponível, False se a Caixa respondeu 404, None se não foi possível
+        verificar (erro temporário ou resposta que não é imagem)
+    """
+    try:
+        caminho, metadados = buscar_imagem(url)
+        for largura in LARGURAS_VARIANTES:
+            for formato in FORMATOS_VARIANTES:
+                obter_variante(url, largura, formato, caminho, metadados)
+        return True
+    except ImagemNaoEncontrada:
+        return False
+    except ImagemInvalida as e:
+        # Página de erro ou bloqueio no lugar da foto: não prova que a imagem não existe
+        logger.warning(f"Resposta inválida ao pré-carregar {url}: {str(e)}")
+        return None
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Erro temporário ao pré-carregar {url}: {str(e)}")
+        return None
+
+
+def aquecer_imagens(queryset=None, codigos=None, max_workers=None, tamanho_lote=500):
+    """
+    Pré-carrega no cache de imagens as fotos ainda não verificadas, com concorrência limitada,
+    e grava em imagem_disponivel quais existem na Caixa.
+    
+    Args:
+        queryset: imóveis a verificar (padrão: com imagem_url e imagem_disponivel nulo)
+        codigos: restringe a verificação a estes códigos de imóvel (ex.: novos ou alterados na importação)
+        max_workers: downloads simultâneos (padrão: settings.IMAGENS_PREFETCH_WORKERS)
+    
+    Returns:
+        dict: contagem de imagens disponíveis, ausentes e com erro
+    """
+    if queryset is None:
+        queryset = Propriedade.objects.filter(imagem_url__isnull=False, imagem_disponivel__isnull=True)
+    max_workers = max_workers or settings.IMAGENS_PREFETCH_WORKERS
+    queryset = queryset.exclude(imagem_url='')
+    if codigos is None:
+        imoveis = list(queryset.values_list('pk', 'imagem_url'))
+    else:
+        codigos = list(codigos)
+        imoveis = []
+        for inicio in range(0, len(codigos), tamanho_lote):
+            imoveis.extend(queryset.filter(codigo__in=codigos[inicio:inicio + tamanho_lote]).values_list('pk', 'imagem_url'))
+    logger.info(f"Pré-carregando {len(imoveis)} imagens com {max_workers} downloads simultâneos")
+    
+    resultado = {True: [], False: [], None: []}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='aquecimento-imagens') as executor:
+        futuros = {executor.submit(_aquecer_imagem, url): pk for pk, url in imoveis}
+        for futuro in as_completed(futuros):
+            try:
+                resultado[futuro.result()].append(futuros[futuro])
+            except Exception as e:
+                logger.error(f"Erro ao pré-carregar imagem do imóvel {futuros[futuro]}: {str(e)}")
+                resultado[None].append(futuros[futuro])
+    
+    for disponivel in (True, False):
+        pks = resultado[disponivel]
+        for inicio in range(0, len(pks), tamanho_lote):
+            Propriedade.objects.filter(pk__in=pks[inicio:inicio + tamanho_lote]).update(imagem_disponivel=disponivel)
+    
+    estatisticas = {
+        'disponiveis': len(resultado[True]),
+        'ausentes': len(resultado[False]),
+        'erros': len(resultado[None]),
+    }
+    logger.info(f"Imagens pré-carregadas: {estatisticas['disponiveis']} disponíveis, "
+                f"{estatisticas['ausentes']} ausentes, {estatisticas['erros']} com erro (tentadas de novo na próxima vez)")
+    return estatisticas
@@ -0,0 +1,111 @@
+import os
+import threading
+
+# Gravação e limpeza comuns aos caches em disco (tiles, imagens, geometrias dos municípios).
+# Sem dependência do Django: o validador geográfico também usa este módulo.
+
+# Fração do tamanho máximo gravada por um processo entre duas verificações do tamanho total
+FRACAO_VERIFICACAO = 20
+# A limpeza remove arquivos até o cache ficar abaixo desta fração do tamanho máximo
+FRACAO_APOS_LIMPEZA = 0.9
+
+
+def gravar_atomicamente(caminho, blocos):
+    """
+    Grava um arquivo via arquivo temporário + rename, seguro com processos e threads concorrentes.
+
+    Quem lê o caminho encontra o arquivo antigo ou o novo completo, nunca um arquivo pela metade.
+
+    Args:
+        caminho: arquivo de destino (os diretórios são criados se preciso)
+        blocos: conteúdo em bytes ou um iterável de blocos de bytes
+
+    Returns:
+        int: número de bytes gravados
+    """
+    if isinstance(blocos, (bytes, bytearray)):
+        blocos = [blocos]
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    tamanho = 0
+    try:
+        with open(temporario, 'wb') as f:
+            for bloco in blocos:
+                f.write(bloco)
+                tamanho += len(bloco)
+        os.replace(temporario, caminho)
+    except BaseException:
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        raise
+    return tamanho
+
+
+def limpar_por_tamanho(diretorio, extensao, tamanho_maximo, extensoes_associadas=()):
+    """
+    Remove os arquivos com a data de modificação mais antiga até o diretório ficar abaixo
+    de FRACAO_APOS_LIMPEZA do tamanho máximo (LRU quando a leitura atualiza o mtime).
+
+    Args:
+        diretorio: raiz do cache (percorrida recursivamente)
+        extensao: extensão dos arquivos contabilizados e removidos
+        tamanho_maximo: tamanho máximo em bytes
+        extensoes_associadas: arquivos com o mesmo nome e estas extensões são removidos junto
+            (ex.: metadados de cada imagem)
+
+    Returns:
+        tuple: (arquivos removidos, bytes restantes)
+    """
+    arquivos = []
+    total = 0
+    for raiz, _, nomes in os.walk(diretorio):
+        for nome in nomes:
+            if not nome.endswith(extensao):
+                continue
+            caminho = os.path.join(raiz, nome)
+            try:
+                info = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            arquivos.append((info.st_mtime, info.st_size, caminho))
+            total += info.st_size
+
+    if total <= tamanho_maximo:
+        return 0, total
+
+    removidos = 0
+    limite = tamanho_maximo * FRACAO_APOS_LIMPEZA
+    for _, tamanho, caminho in sorted(arquivos):
+        if total <= limite:
+            break
+        base = caminho[:-len(extensao)]
+        for arquivo in (caminho, *(base + associada for associada in extensoes_associadas)):
+            try:
+                os.remove(arquivo)
+            except FileNotFoundError:
+                pass
+        total -= tamanho
+        removidos += 1
+    return removidos, total
+
+
+class ContadorGravacoes:
+    """
+    Soma os bytes gravados por este processo em um cache em disco e indica quando verificar o
+    tamanho total: a cada 1/FRACAO_VERIFICACAO do tamanho máximo, em vez de a cada gravação.
+    """
+
+    def __init__(self):
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def registrar(self, tamanho, tamanho_maximo):
+        """Registra uma gravação; retorna True (e zera a contagem) quando é hora de limpar o cache"""
+        with self._lock:
+            self._bytes += tamanho
+            if self._bytes < tamanho_maximo // FRACAO_VERIFICACAO:
+                return False
+            self._bytes = 0
+            return True
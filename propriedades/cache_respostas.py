@@ -0,0 +1,181 @@
+import time
+import hashlib
+import logging
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+
+logger = logging.getLogger(__name__)
+
+CHAVE_GERACAO = 'propriedades:geracao'
+CHAVE_ULTIMA_ALTERACAO = 'propriedades:ultima_alteracao'
+
+# Acertos e falhas do cache de respostas: contados em memória por processo e somados aos
+# totais compartilhados (lidos pelo comando estatisticas_cache) a cada N consultas, em vez
+# de uma escrita no cache por requisição
+CHAVE_ACERTOS = 'propriedades:cache:acertos'
+CHAVE_FALHAS = 'propriedades:cache:falhas'
+INTERVALO_PUBLICACAO_ESTATISTICAS = 100
+_pendentes = {'acertos': 0, 'falhas': 0}
+_lock_estatisticas = threading.Lock()
+
+# Filtros com listas separadas por vírgula cuja ordem não altera o resultado
+FILTROS_LISTA = ('estado', 'cidade', 'bairro', 'tipo_imovel', 'quartos')
+
+
+def _nova_geracao():
+    # Marca de tempo em nanossegundos: nunca repete um valor anterior, mesmo se a chave
+    # for perdida (limpeza ou descarte do cache) e recriada
+    return time.time_ns()
+
+
+def obter_geracao():
+    """Retorna a geração atual dos dados de imóveis (muda a cada escrita relevante)"""
+    geracao = cache.get(CHAVE_GERACAO)
+    if geracao is None:
+        # add evita sobrescrever a geração criada ao mesmo tempo por outro processo
+        cache.add(CHAVE_GERACAO, _nova_geracao(), timeout=None)
+        geracao = cache.get(CHAVE_GERACAO)
+    return geracao
+
+
+def incrementar_geracao():
+    """
+    Avança a geração dos dados, invalidando todas as respostas cacheadas.
+    
+    Deve ser chamada por quem altera imóveis (importação, revalidação, análise de matrícula).
+    """
+    geracao = _nova_geracao()
+    cache.set(CHAVE_GERACAO, geracao, timeout=None)
+    cache.set(CHAVE_ULTIMA_ALTERACAO, timezone.now(), timeout=None)
+    logger.info(f"Geração dos dados de imóveis avançada para {geracao}")
+    return geracao
+
+
+def obter_ultima_alteracao():
+    """Momento em que a geração dos dados avançou pela última vez"""
+    ultima = cache.get(CHAVE_ULTIMA_ALTERACAO)
+    if ultima is None:
+        # Cache vazio (primeiro acesso ou limpeza): o instante atual nunca é anterior a uma
+        # alteração já vista pelos clientes. Max(data_atualizacao) não serviria, pois não
+        # avança quando imóveis são removidos.
+        cache.add(CHAVE_ULTIMA_ALTERACAO, timezone.now(), timeout=None)
+        ultima = cache.get(CHAVE_ULTIMA_ALTERACAO)
+    return ultima
+
+
+def normalizar_parametros(params):
+    """Gera uma representação canônica da query string (ordem dos parâmetros e das listas)"""
+    itens = []
+    for nome in sorted(params):
+        valor = params.get(nome)
+        if nome in FILTROS_LISTA:
+            valor = ','.join(sorted({parte.strip() for parte in valor.split(',') if parte.strip()}))
+        if valor:
+            itens.append(f"{nome}={valor}")
+    return '&'.join(itens)
+
+
+def chave_resposta(prefixo, params, geracao=None):
+    geracao = obter_geracao() if geracao is None else geracao
+    resumo = hashlib.sha256(normalizar_parametros(params).encode('utf-8')).hexdigest()
+    return f"propriedades:resposta:{prefixo}:{geracao}:{resumo}"
+
+
+def cachear_resposta(prefixo):
+    """
+    Decorator que guarda no cache as respostas 200 da view, por filtros normalizados e geração.
+    
+    Como a geração faz parte da chave, respostas antigas simplesmente deixam de ser
+    lidas após uma importação e expiram pelo timeout do cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # Respostas em streaming não são guardadas (não cabem inteiras na memória)
+            if request.GET.get('stream'):
+                return view(request, *args, **kwargs)
+            
+            chave = chave_resposta(prefixo, request.GET)
+            em_cache = cache.get(chave)
+            _contar('acertos' if em_cache is not None else 'falhas')
+            if em_cache is not None:
+                conteudo, content_type = em_cache
+                return HttpResponse(conteudo, content_type=content_type)
+            
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(chave, (response.content, response['Content-Type']), settings.PROPRIEDADES_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+def _etag_dados(request, *args, **kwargs):
+    conteudo = (f"{obter_geracao()}|{obter_ultima_alteracao().isoformat()}|"
+                f"{request.path}|{normalizar_parametros(request.GET)}")
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+def _ultima_alteracao_dados(request, *args, **kwargs):
+    return obter_ultima_alteracao()
+
+
+def resposta_condicional(view):
+    """
+    Decorator que responde 304 Not Modified sem consultar o banco quando o cliente
+    já tem a resposta da geração atual (ETag) e exige que o navegador revalide.
+    """
+    view_condicional = condition(etag_func=_etag_dados, last_modified_func=_ultima_alteracao_dados)(view)
+    return cache_control(no_cache=True)(view_condicional)
+
+
+def _contar(tipo):
+    with _lock_estatisticas:
+        _pendentes[tipo] += 1
+        publicar = _pendentes['acertos'] + _pendentes['falhas'] >= INTERVALO_PUBLICACAO_ESTATISTICAS
+    if publicar:
+        publicar_estatisticas()
+
+
+def publicar_estatisticas():
+    """
+    Soma as contagens pendentes deste processo aos totais compartilhados.
+    
+    A soma é leitura + escrita (incr do FileBasedCache regrava a chave com o timeout
+    padrão e a faria expirar): publicações simultâneas de dois workers podem perder um
+    lote, o que é aceitável para uma estatística.
+    """
+    with _lock_estatisticas:
+        acertos, falhas = _pendentes['acertos'], _pendentes['falhas']
+        _pendentes['acertos'] = _pendentes['falhas'] = 0
+    for chave, quantidade in ((CHAVE_ACERTOS, acertos), (CHAVE_FALHAS, falhas)):
+        if quantidade:
+            cache.set(chave, cache.get(chave, 0) + quantidade, timeout=None)
+
+
+def estatisticas():
+    """Retorna acertos, falhas e taxa de acerto do cache de respostas somados entre os processos"""
+    publicar_estatisticas()
+    acertos = cache.get(CHAVE_ACERTOS, 0)
+    falhas = cache.get(CHAVE_FALHAS, 0)
+    total = acertos + falhas
+    return {
+        'geracao': obter_geracao(),
+        'acertos': acertos,
+        'falhas': falhas,
+        'taxa_acerto': acertos / total if total else 0.0,
+    }
+
+
+def zerar_estatisticas():
+    with _lock_estatisticas:
+        _pendentes['acertos'] = _pendentes['falhas'] = 0
+    cache.delete_many([CHAVE_ACERTOS, CHAVE_FALHAS])
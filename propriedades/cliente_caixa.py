@@ -0,0 +1,253 @@
+import time
+import random
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.cache import cache
+
+from .imagens import obter_imagem, gravar_imagem
+
+logger = logging.getLogger(__name__)
+
+URL_PRINCIPAL = 'https://venda-imoveis.caixa.gov.br/'
+# Únicos hosts de onde o proxy de imagens aceita buscar fotos
+HOSTS_PERMITIDOS = {'venda-imoveis.caixa.gov.br'}
+
+def url_permitida(url):
+    """Verifica se a URL aponta para o site da Caixa (evita usar o proxy para buscar qualquer endereço)"""
+    try:
+        partes = urlsplit(url)
+        return partes.scheme in ('http', 'https') and partes.hostname in HOSTS_PERMITIDOS and partes.port in (None, 80, 443)
+    except ValueError:
+        return False
+
+
+# Lista de User-Agents para rotação
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Edge/122.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) Gecko/20100101 Firefox/123.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+]
+
+# Headers mais completos para simular um navegador real
+HEADERS = {
+    'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
+    'Accept-Language': 'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Referer': URL_PRINCIPAL,
+    'Origin': 'https://venda-imoveis.caixa.gov.br',
+    'Sec-Fetch-Dest': 'image',
+    'Sec-Fetch-Mode': 'no-cors',
+    'Sec-Fetch-Site': 'same-origin',
+    'Pragma': 'no-cache',
+    'Cache-Control': 'no-cache',
+    'DNT': '1',  # Do Not Track
+    'Sec-Ch-Ua': '"Chromium";v="122", "Not(A:Brand";v="24", "Google Chrome";v="122"',
+    'Sec-Ch-Ua-Mobile': '?0',
+    'Sec-Ch-Ua-Platform': '"Windows"',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+TIMEOUT = 15
+ESPERA_NOVA_TENTATIVA = 2
+# Pior caso da busca feita pela primeira requisição: renovar cookies, GET, nova renovação após 403
+# e novo GET, cada um limitado por TIMEOUT, mais uma espera pelo lock de uma renovação em outra thread
+ESPERA_MAXIMA_BUSCA = 5 * TIMEOUT
+
+
+class ImagemNaoEncontrada(Exception):
+    """A Caixa respondeu 404 (agora ou há pouco tempo, segundo o cache negativo)"""
+
+
+class ImagemInvalida(Exception):
+    """A Caixa respondeu com algo que não é imagem (página de erro ou bloqueio)"""
+
+
+class SessaoCaixa:
+    """
+    Sessão HTTP compartilhada pelo processo para buscar imagens no site da Caixa.
+    
+    Mantém as conexões abertas (keep-alive, pool dimensionado pelo número de threads)
+    e reaproveita os cookies da página principal, que só é visitada de novo quando os
+    cookies expiram ou a Caixa responde 403.
+    """
+
+    def __init__(self, tamanho_pool=None, validade_cookies=None):
+        self.tamanho_pool = tamanho_pool or settings.CAIXA_POOL_CONEXOES
+        self.validade_cookies = validade_cookies or settings.CAIXA_VALIDADE_COOKIES
+        self._lock_sessao = threading.Lock()
+        self._lock_cookies = threading.Lock()
+        self._sessao = None
+        self._cookies_obtidos_em = None
+
+    def _criar_sessao(self):
+        sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=self.tamanho_pool, pool_maxsize=self.tamanho_pool)
+        sessao.mount('https://', adaptador)
+        sessao.mount('http://', adaptador)
+        sessao.headers.update(HEADERS)
+        sessao.headers['User-Agent'] = random.choice(USER_AGENTS)
+        sessao.verify = False
+        return sessao
+
+    @property
+    def sessao(self):
+        if self._sessao is None:
+            with self._lock_sessao:
+                if self._sessao is None:
+                    self._sessao = self._criar_sessao()
+        return self._sessao
+
+    def _cookies_validos(self):
+        if self._cookies_obtidos_em is None or time.time() - self._cookies_obtidos_em > self.validade_cookies:
+            return False
+        agora = time.time()
+        return not any(cookie.expires and cookie.expires <= agora for cookie in self.sessao.cookies)
+
+    def renovar_cookies(self, forcar=False):
+        """Visita a página principal da Caixa para obter cookies novos (uma thread por vez)"""
+        with self._lock_cookies:
+            if not forcar and self._cookies_validos():
+                return
+            self.sessao.cookies.clear()
+            self.sessao.get(URL_PRINCIPAL, timeout=TIMEOUT)
+            self._cookies_obtidos_em = time.time()
+            logger.info("Cookies da Caixa renovados")
+
+    def baixar(self, url, user_agent=None):
+        """
+        Busca a URL com stream=True, renovando os cookies uma vez se a Caixa responder 403.
+        
+        Returns:
+            requests.Response: resposta com status de sucesso (o chamador consome o corpo)
+        """
+        if not self._cookies_validos():
+            self.renovar_cookies()
+        
+        headers = {'User-Agent': user_agent} if user_agent else None
+        response = self.sessao.get(url, headers=headers, stream=True, timeout=TIMEOUT)
+        if response.status_code == 403:
+            response.close()
+            logger.info("Caixa respondeu 403, renovando cookies")
+            self.renovar_cookies(forcar=True)
+            response = self.sessao.get(url, headers=headers, stream=True, timeout=TIMEOUT)
+        response.raise_for_status()
+        return response
+
+
+sessao_caixa = SessaoCaixa()
+
+
+class _BuscaEmAndamento:
+    def __init__(self):
+        self.concluida = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+# URL -> busca em andamento neste processo (single-flight)
+_buscas_em_andamento = {}
+_lock_buscas = threading.Lock()
+
+
+def _chave_nao_encontrada(url):
+    return 'proxy_imagem:404:' + hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def _baixar_para_cache(url):
+    try:
+        response = sessao_caixa.baixar(url)
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            # Cache negativo compartilhado entre os processos
+            cache.set(_chave_nao_encontrada(url), True, settings.IMAGENS_CACHE_TTL_NEGATIVO)
+            raise ImagemNaoEncontrada(url) from e
+        raise
+    with response:
+        content_type = response.headers.get('content-type', '')
+        if not content_type.startswith('image/'):
+            raise ImagemInvalida(f"{url} retornou {content_type or 'conteúdo sem tipo'}")
+        return gravar_imagem(url, response)
+
+
+def buscar_imagem(url):
+    """
+    Retorna a imagem do cache em disco, baixando-a da Caixa se necessário.
+    
+    Requisições simultâneas para a mesma URL esperam uma única busca e compartilham
+    o resultado; URLs que deram 404 recentemente nem chegam a ir à Caixa.
+    
+    Returns:
+        tuple: (caminho do arquivo, metadados)
+    
+    Raises:
+        ImagemNaoEncontrada, ImagemInvalida ou requests.exceptions.RequestException
+    """
+    if em_cache := obter_imagem(url):
+        return em_cache
+    if cache.get(_chave_nao_encontrada(url)):
+        raise ImagemNaoEncontrada(url)
+    
+    with _lock_buscas:
+        busca = _buscas_em_andamento.get(url)
+        lider = busca is None
+        if lider:
+            busca = _buscas_em_andamento[url] = _BuscaEmAndamento()
+    
+    if not lider:
+        if not busca.concluida.wait(ESPERA_MAXIMA_BUSCA):
+            raise requests.exceptions.Timeout(f"Tempo esgotado aguardando a busca de {url}")
+        if busca.erro:
+            raise busca.erro
+        return busca.resultado
+    
+    try:
+        busca.resultado = _baixar_para_cache(url)
+        return busca.resultado
+    except Exception as e:
+        busca.erro = e
+        raise
+    finally:
+        with _lock_buscas:
+            _buscas_em_andamento.pop(url, None)
+        busca.concluida.set()
+
+# Novas tentativas rodam fora da requisição do usuário e gravam a imagem no cache em disco
+_executor_tentativas = ThreadPoolExecutor(max_workers=2, thread_name_prefix='proxy-imagem')
+_tentativas_pendentes = set()
+_lock_tentativas = threading.Lock()
+
+
+def _tentar_novamente(url, user_agent):
+    try:
+        time.sleep(ESPERA_NOVA_TENTATIVA)
+        if obter_imagem(url):
+            return
+        response = sessao_caixa.baixar(url, user_agent=user_agent)
+        with response:
+            if response.headers.get('content-type', '').startswith('image/'):
+                gravar_imagem(url, response)
+                logger.info(f"Imagem obtida na nova tentativa: {url}")
+    except Exception as e:
+        logger.warning(f"Nova tentativa falhou para {url}: {str(e)}")
+    finally:
+        with _lock_tentativas:
+            _tentativas_pendentes.discard(url)
+
+
+def agendar_nova_tentativa(url, user_agent_anterior=None):
+    """Agenda, em segundo plano, uma nova busca da imagem com outro User-Agent"""
+    with _lock_tentativas:
+        if url in _tentativas_pendentes:
+            return
+        _tentativas_pendentes.add(url)
+    user_agent = random.choice([ua for ua in USER_AGENTS if ua != user_agent_anterior])
+    _executor_tentativas.submit(_tentar_novamente, url, user_agent)
@@ -0,0 +1,125 @@
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Propriedade, Faceta, COM_COORDENADAS
+from .cache_respostas import obter_geracao
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_FACETA = ('estado', 'cidade', 'bairro', 'tipo_imovel')
+
+# Facetas carregadas neste processo, recarregadas quando a geração dos dados muda
+_facetas = {'geracao': None}
+_lock_facetas = threading.Lock()
+
+
+def _agregar_propriedades():
+    return Propriedade.objects.filter(COM_COORDENADAS).values(*CAMPOS_FACETA).annotate(
+        quantidade=Count('id')
+    ).order_by()
+
+
+def materializar_facetas(tamanho_lote=1000):
+    """
+    Recalcula a tabela de facetas a partir dos imóveis com coordenadas.
+    
+    Deve rodar antes de avançar a geração, para que os processos recarreguem a versão nova.
+    """
+    linhas = list(_agregar_propriedades())
+    with transaction.atomic():
+        Faceta.objects.all().delete()
+        Faceta.objects.bulk_create([Faceta(**linha) for linha in linhas], batch_size=tamanho_lote)
+    logger.info(f"Facetas materializadas: {len(linhas)} combinações de estado/cidade/bairro/tipo")
+    return len(linhas)
+
+
+def _ordenar(contagens, campo):
+    """Lista [{campo: valor, 'quantidade': n}] em ordem alfabética, com vazios no fim"""
+    return [
+        {campo: valor, 'quantidade': quantidade}
+        for valor, quantidade in sorted(contagens.items(), key=lambda item: (item[0] is None, item[0] or ''))
+    ]
+
+
+def _montar_facetas(linhas):
+    """Monta a hierarquia estado -> cidade -> bairro e as contagens por tipo de imóvel"""
+    arvore = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    tipos = defaultdict(int)
+    for linha in linhas:
+        arvore[linha['estado']][linha['cidade']][linha['bairro']] += linha['quantidade']
+        tipos[linha['tipo_imovel']] += linha['quantidade']
+    
+    estados = []
+    for estado, cidades in sorted(arvore.items()):
+        lista_cidades = []
+        for cidade, bairros in sorted(cidades.items()):
+            lista_cidades.append({
+                'cidade': cidade,
+                'quantidade': sum(bairros.values()),
+                'bairros': _ordenar(bairros, 'bairro'),
+            })
+        estados.append({
+            'estado': estado,
+            'quantidade': sum(cidade['quantidade'] for cidade in lista_cidades),
+            'cidades': lista_cidades,
+        })
+    
+    return {
+        'total': sum(tipos.values()),
+        'estados': estados,
+        'tipos_imovel': _ordenar(tipos, 'tipo_imovel'),
+    }
+
+
+def _carregar():
+    """Garante que as facetas em memória são da geração atual e retorna o dicionário interno"""
+    geracao = obter_geracao()
+    with _lock_facetas:
+        if _facetas['geracao'] != geracao:
+            linhas = list(Faceta.objects.values(*CAMPOS_FACETA, 'quantidade'))
+            if not linhas:
+                # Tabela ainda não materializada (nenhuma importação desde a migração)
+                linhas = list(_agregar_propriedades())
+            dados = _montar_facetas(linhas)
+            
+            bairros_por_cidade = defaultdict(set)
+            for estado in dados['estados']:
+                for cidade in estado['cidades']:
+                    bairros_por_cidade[cidade['cidade']].update(bairro['bairro'] for bairro in cidade['bairros'])
+            
+            _facetas.update(
+                geracao=geracao,
+                dados=dados,
+                json=json.dumps(dados, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                cidades_por_estado={
+                    estado['estado']: [cidade['cidade'] for cidade in estado['cidades']] for estado in dados['estados']
+                },
+                bairros_por_cidade={
+                    cidade: sorted(bairros, key=lambda bairro: (bairro is None, bairro or ''))
+                    for cidade, bairros in bairros_por_cidade.items()
+                },
+            )
+        return _facetas
+
+
+def obter_facetas():
+    """Retorna a hierarquia de facetas com contagens (servida da memória)"""
+    return _carregar()['dados']
+
+
+def obter_facetas_json():
+    """Retorna as facetas já serializadas em JSON (bytes)"""
+    return _carregar()['json']
+
+
+def cidades_do_estado(estado):
+    return _carregar()['cidades_por_estado'].get(estado, [])
+
+
+def bairros_da_cidade(cidade):
+    return _carregar()['bairros_por_cidade'].get(cidade, [])
@@ -0,0 +1,95 @@
+import sys
+import json
+import math
+import struct
+from array import array
+
+# Campos numéricos são enviados como float (null/NaN quando vazios)
+CAMPOS_NUMERICOS = {'valor', 'valor_avaliacao', 'desconto', 'area', 'quartos', 'latitude', 'longitude'}
+# Campos com poucos valores distintos são codificados por dicionário (lista de valores + índices)
+CAMPOS_DICIONARIO = {'estado', 'cidade', 'bairro', 'tipo_imovel'}
+
+FORMATOS = ('json', 'columnar', 'binary')
+
+
+def _codificar_dicionario(valores):
+    """Retorna (valores distintos na ordem de aparição, índice de cada linha no dicionário)"""
+    posicoes = {}
+    indices = [posicoes.setdefault(valor, len(posicoes)) for valor in valores]
+    return list(posicoes), indices
+
+
+def _montar_colunas(linhas, campos):
+    """Transpõe as linhas (tuplas na ordem de campos) em colunas"""
+    colunas = list(zip(*linhas)) if linhas else [()] * len(campos)
+    for campo, valores in zip(campos, colunas):
+        if campo in CAMPOS_NUMERICOS:
+            yield campo, 'numero', [None if valor is None else float(valor) for valor in valores]
+        elif campo in CAMPOS_DICIONARIO:
+            yield campo, 'dicionario', _codificar_dicionario(valores)
+        else:
+            yield campo, 'texto', list(valores)
+
+
+def serializar_colunar(linhas, campos, **metadados):
+    """
+    Serializa as linhas em JSON colunar: um array por campo, sem repetir as chaves.
+    
+    Campos de CAMPOS_DICIONARIO trazem índices em 'colunas' e os valores em 'dicionarios'.
+    """
+    colunas = {}
+    dicionarios = {}
+    for campo, tipo, valores in _montar_colunas(linhas, campos):
+        if tipo == 'dicionario':
+            dicionarios[campo], colunas[campo] = valores
+        else:
+            colunas[campo] = valores
+    
+    return json.dumps({
+        **metadados,
+        'formato': 'columnar',
+        'quantidade': len(linhas),
+        'colunas': colunas,
+        'dicionarios': dicionarios,
+    }, ensure_ascii=False).encode('utf-8')
+
+
+def serializar_binario(linhas, campos, **metadados):
+    """
+    Serializa as linhas em um buffer binário lido com typed arrays no navegador.
+    
+    Layout: uint32 (little-endian) com o tamanho do cabeçalho, cabeçalho JSON em UTF-8
+    e, alinhados a 8 bytes, os buffers das colunas. Campos numéricos são Float64
+    (NaN para vazio), campos de dicionário são índices Uint32 e os demais textos
+    seguem no próprio cabeçalho.
+    """
+    descricao_colunas = []
+    buffers = []
+    deslocamento = 0
+    for campo, tipo, valores in _montar_colunas(linhas, campos):
+        if tipo == 'numero':
+            buffer = array('d', (math.nan if valor is None else valor for valor in valores))
+            descricao_colunas.append({'campo': campo, 'tipo': 'float64', 'offset': deslocamento})
+        elif tipo == 'dicionario':
+            dicionario, indices = valores
+            buffer = array('I', indices)
+            descricao_colunas.append({'campo': campo, 'tipo': 'uint32', 'offset': deslocamento, 'dicionario': dicionario})
+        else:
+            descricao_colunas.append({'campo': campo, 'tipo': 'texto', 'valores': valores})
+            continue
+        if sys.byteorder == 'big':
+            buffer.byteswap()
+        dados = buffer.tobytes()
+        dados += b'\0' * (-len(dados) % 8)
+        buffers.append(dados)
+        deslocamento += len(dados)
+    
+    cabecalho = json.dumps({
+        **metadados,
+        'formato': 'binary',
+        'quantidade': len(linhas),
+        'colunas': descricao_colunas,
+    }, ensure_ascii=False).encode('utf-8')
+    # Os offsets das colunas contam a partir do fim do cabeçalho alinhado
+    cabecalho += b' ' * (-(4 + len(cabecalho)) % 8)
+    return b''.join([struct.pack('<I', len(cabecalho)), cabecalho, *buffers])
@@ -0,0 +1,127 @@
+import math
+import logging
+
+from django.db.models import Q, Count, Avg, Min, Max
+from django.db.models.functions import Substr
+
+from .models import Propriedade
+
+logger = logging.getLogger(__name__)
+
+# Nível do quadkey gravado em cada imóvel (~150 m por célula no equador)
+NIVEL_QUADKEY = 18
+# Latitude máxima representável na projeção Web Mercator
+LATITUDE_MAXIMA = 85.05112878
+# A partir deste zoom o mapa mostra imóveis individuais em vez de clusters
+ZOOM_PONTOS_INDIVIDUAIS = 14
+# Cada tile do mapa é dividido em 2^3 x 2^3 células de cluster (~32 px)
+NIVEIS_SUBDIVISAO_CLUSTER = 3
+
+
+def coordenadas_para_tile(lat, lon, zoom):
+    """Converte uma coordenada no (x, y) do tile Web Mercator (slippy map) do zoom informado"""
+    lat = max(min(float(lat), LATITUDE_MAXIMA), -LATITUDE_MAXIMA)
+    seno_lat = math.sin(math.radians(lat))
+    x = (float(lon) + 180) / 360
+    y = 0.5 - math.log((1 + seno_lat) / (1 - seno_lat)) / (4 * math.pi)
+    n = 1 << zoom
+    return min(max(int(x * n), 0), n - 1), min(max(int(y * n), 0), n - 1)
+
+
+def tile_para_quadkey(x, y, zoom):
+    """Quadkey do tile (x, y, zoom): cada caractere escolhe um quadrante do nível anterior"""
+    digitos = []
+    for nivel in range(zoom, 0, -1):
+        mascara = 1 << (nivel - 1)
+        digito = 0
+        if x & mascara:
+            digito += 1
+        if y & mascara:
+            digito += 2
+        digitos.append(str(digito))
+    return ''.join(digitos)
+
+
+def calcular_quadkey(lat, lon, nivel=NIVEL_QUADKEY):
+    """
+    Quadkey da coordenada no nível informado.
+    
+    O quadkey é hierárquico: os primeiros z caracteres identificam o tile do zoom z
+    que contém o ponto, então agrupar por prefixo agrega os imóveis em uma grade
+    de qualquer resolução usando um único índice.
+    """
+    x, y = coordenadas_para_tile(lat, lon, nivel)
+    return tile_para_quadkey(x, y, nivel)
+
+
+def quadkey_para_tile(quadkey):
+    """Converte um quadkey de volta em (x, y, zoom)"""
+    x = y = 0
+    zoom = len(quadkey)
+    for nivel, digito in zip(range(zoom, 0, -1), quadkey):
+        mascara = 1 << (nivel - 1)
+        if digito in '13':
+            x |= mascara
+        if digito in '23':
+            y |= mascara
+    return x, y, zoom
+
+
+def limites_tile(x, y, zoom):
+    """Retorna (minLon, minLat, maxLon, maxLat) do tile Web Mercator"""
+    n = 1 << zoom
+
+    def latitude(linha):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * linha / n))))
+
+    return x / n * 360 - 180, latitude(y + 1), (x + 1) / n * 360 - 180, latitude(y)
+
+
+def agregar_por_quadkey(queryset, zoom):
+    """
+    Agrupa os imóveis pelo prefixo do quadkey (grade de clusters do zoom informado).
+    
+    Returns:
+        list: dicts com celula, quantidade, centróide (lat_media, lon_media), valor_min e desconto_max
+    """
+    nivel = min(max(zoom, 0) + NIVEIS_SUBDIVISAO_CLUSTER, NIVEL_QUADKEY)
+    return list(queryset.filter(quadkey__isnull=False).annotate(
+        celula=Substr('quadkey', 1, nivel)
+    ).values('celula').annotate(
+        quantidade=Count('id'),
+        lat_media=Avg('latitude'),
+        lon_media=Avg('longitude'),
+        valor_min=Min('valor'),
+        desconto_max=Max('desconto'),
+    ).order_by())
+
+
+def reconstruir_indice_quadkey(tamanho_lote=1000):
+    """
+    Recalcula o quadkey dos imóveis cujas coordenadas mudaram.
+    
+    Returns:
+        set: quadkeys (antigos e novos) das células afetadas, para invalidar caches por região
+    """
+    alterados = []
+    afetados = set()
+    imoveis = Propriedade.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).values_list('pk', 'latitude', 'longitude', 'quadkey')
+    for pk, latitude, longitude, quadkey in imoveis.iterator(chunk_size=5000):
+        novo_quadkey = calcular_quadkey(latitude, longitude)
+        if novo_quadkey != quadkey:
+            alterados.append(Propriedade(pk=pk, quadkey=novo_quadkey))
+            afetados.update(filter(None, (quadkey, novo_quadkey)))
+    
+    Propriedade.objects.bulk_update(alterados, ['quadkey'], batch_size=tamanho_lote)
+    
+    # Imóveis que perderam as coordenadas saem do índice
+    sem_coordenadas = Propriedade.objects.filter(
+        Q(latitude__isnull=True) | Q(longitude__isnull=True), quadkey__isnull=False
+    )
+    afetados.update(sem_coordenadas.values_list('quadkey', flat=True))
+    removidos = sem_coordenadas.update(quadkey=None)
+    
+    logger.info(f"Índice quadkey reconstruído: {len(alterados)} imóveis atualizados, {removidos} removidos")
+    return afetados
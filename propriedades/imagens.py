@@ -0,0 +1,136 @@
+import os
+import io
+import json
+import time
+import hashlib
+import logging
+
+from django.conf import settings
+
+from .cache_disco import gravar_atomicamente, limpar_por_tamanho, ContadorGravacoes
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow é opcional: sem ele as variantes caem para a imagem original
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_BLOCO_DOWNLOAD = 64 * 1024
+
+# Larguras (px) das variantes reduzidas: popups e cards usam 320, a página do imóvel 800
+LARGURAS_VARIANTES = (320, 800)
+FORMATOS_VARIANTES = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg')}
+
+# Bytes gravados desde a última verificação do tamanho total do cache (por processo)
+_gravacoes = ContadorGravacoes()
+
+
+def _caminhos(url):
+    """Retorna (arquivo da imagem, arquivo de metadados) para a URL, endereçados pelo SHA-256"""
+    chave = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    base = os.path.join(settings.IMAGENS_CACHE_DIR, chave[:2], chave)
+    return f'{base}.bin', f'{base}.json'
+
+
+def obter_imagem(url):
+    """
+    Procura a imagem no cache em disco.
+    
+    Returns:
+        tuple: (caminho do arquivo, metadados) ou None se ausente ou expirada
+    """
+    caminho, caminho_meta = _caminhos(url)
+    try:
+        with open(caminho_meta, encoding='utf-8') as f:
+            metadados = json.load(f)
+        if time.time() - metadados['data_busca'] > settings.IMAGENS_CACHE_TTL or not os.path.exists(caminho):
+            return None
+        # A data de modificação marca o último acesso, usada na remoção LRU
+        os.utime(caminho)
+        return caminho, metadados
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def gravar_imagem(url, response):
+    """
+    Grava no cache o corpo de uma resposta do requests (stream=True) sem carregá-lo inteiro na memória.
+    
+    Returns:
+        tuple: (caminho do arquivo, metadados)
+    """
+    return _gravar(
+        url, response.iter_content(TAMANHO_BLOCO_DOWNLOAD),
+        url=url, content_type=response.headers.get('content-type', 'image/jpeg')
+    )
+
+
+def _gravar(chave, blocos, **metadados):
+    caminho, caminho_meta = _caminhos(chave)
+    # Imagem antes dos metadados: quem lê os metadados sempre encontra a imagem completa
+    tamanho = gravar_atomicamente(caminho, blocos)
+    metadados.update(tamanho=tamanho, data_busca=time.time())
+    gravar_atomicamente(caminho_meta, json.dumps(metadados).encode('utf-8'))
+    
+    if _gravacoes.registrar(tamanho, settings.IMAGENS_CACHE_TAMANHO_MAXIMO):
+        limpar_cache()
+    
+    return caminho, metadados
+
+
+def _chave_variante(url, largura, formato):
+    return f'{url}#w={largura}.{formato}'
+
+
+def obter_variante(url, largura, formato, caminho_original, metadados_original):
+    """
+    Retorna a versão reduzida da imagem (largura em px, formato 'webp' ou 'jpeg'),
+    gerando-a a partir do original em disco na primeira vez.
+    
+    Sem Pillow, ou se o original não puder ser decodificado, devolve o original.
+    
+    Returns:
+        tuple: (caminho do arquivo, metadados)
+    """
+    chave = _chave_variante(url, largura, formato)
+    if em_cache := obter_imagem(chave):
+        return em_cache
+    if Image is None:
+        logger.warning("Pillow não instalado, servindo imagem original no lugar da variante")
+        return caminho_original, metadados_original
+    
+    formato_pil, content_type = FORMATOS_VARIANTES[formato]
+    try:
+        with Image.open(caminho_original) as imagem:
+            imagem.load()
+            if imagem.width > largura:
+                altura = max(1, round(imagem.height * largura / imagem.width))
+                imagem = imagem.resize((largura, altura), Image.LANCZOS)
+            if formato == 'jpeg' and imagem.mode != 'RGB':
+                imagem = imagem.convert('RGB')
+            elif formato == 'webp' and imagem.mode not in ('RGB', 'RGBA'):
+                imagem = imagem.convert('RGBA' if 'A' in imagem.getbands() else 'RGB')
+            
+            saida = io.BytesIO()
+            qualidade = settings.IMAGENS_QUALIDADE_WEBP if formato == 'webp' else settings.IMAGENS_QUALIDADE_JPEG
+            imagem.save(saida, formato_pil, quality=qualidade, optimize=formato == 'jpeg')
+    except (OSError, ValueError) as e:
+        logger.warning(f"Não foi possível gerar a variante {largura}px de {url}: {str(e)}")
+        return caminho_original, metadados_original
+    
+    return _gravar(chave, [saida.getvalue()], url=url, content_type=content_type, largura=largura)
+
+
+def limpar_cache(tamanho_maximo=None):
+    """
+    Remove as imagens acessadas há mais tempo até o cache ficar abaixo de 90% do tamanho máximo.
+    
+    Returns:
+        int: número de imagens removidas
+    """
+    tamanho_maximo = settings.IMAGENS_CACHE_TAMANHO_MAXIMO if tamanho_maximo is None else tamanho_maximo
+    removidos, restantes = limpar_por_tamanho(settings.IMAGENS_CACHE_DIR, '.bin', tamanho_maximo, extensoes_associadas=('.json',))
+    if removidos:
+        logger.info(f"Cache de imagens: {removidos} imagens removidas, {restantes / 1024 / 1024:.1f} MB em uso")
+    return removidos
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from propriedades.models import Propriedade
+from propriedades.aquecimento_imagens import aquecer_imagens
+from propriedades.cache_respostas import incrementar_geracao
+
+
+class Command(BaseCommand):
+    help = 'Baixa para o cache as fotos dos imóveis e registra quais não existem na Caixa'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', action='store_true', help='Verifica de novo também as imagens já verificadas')
+        parser.add_argument('--max-workers', type=int, default=None, help='Downloads simultâneos')
+
+    def handle(self, *args, **options):
+        queryset = Propriedade.objects.filter(imagem_url__isnull=False) if options['todos'] else None
+        estatisticas = aquecer_imagens(queryset=queryset, max_workers=options['max_workers'])
+        if estatisticas['disponiveis'] or estatisticas['ausentes']:
+            incrementar_geracao()
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Disponíveis: {estatisticas['disponiveis']} | Ausentes: {estatisticas['ausentes']} | Erros: {estatisticas['erros']}"
+        ))
@@ -0,0 +1,80 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.http import QueryDict
+
+from propriedades.models import Propriedade
+from propriedades.views import _filtrar_propriedades, LIMITE_PADRAO_PROPRIEDADES
+
+
+class Command(BaseCommand):
+    help = 'Mostra o plano de execução (EXPLAIN ANALYZE) e o tempo das consultas típicas do mapa'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5, help='Execuções de cada consulta para medir o tempo')
+        parser.add_argument('--sem-plano', action='store_true', help='Mostra apenas os tempos, sem o plano de execução')
+
+    def _consultas(self):
+        """Combinações de filtros mais usadas no mapa, com os valores mais frequentes da base"""
+        mais_frequente = lambda campo: (
+            Propriedade.objects.exclude(**{f'{campo}__isnull': True}).values(campo)
+            .annotate(total=Count('id')).order_by('-total').values_list(campo, flat=True).first()
+        )
+        estado = mais_frequente('estado') or 'SP'
+        cidade = Propriedade.objects.filter(estado=estado).values('cidade').annotate(
+            total=Count('id')).order_by('-total').values_list('cidade', flat=True).first() or ''
+        tipo_imovel = mais_frequente('tipo_imovel') or 'Casa'
+        
+        filtros = [
+            ('Sem filtros', ''),
+            ('Estado', f'estado={estado}'),
+            ('Estado + desconto', f'estado={estado}&desconto_min=30'),
+            ('Cidade + tipo', f'cidade={cidade}&tipo_imovel={tipo_imovel}'),
+            ('Valor máximo + quartos', 'valor_max=200000&quartos=2'),
+        ]
+        for descricao, query in filtros:
+            queryset = _filtrar_propriedades(QueryDict(query))
+            yield f'Lista: {descricao}', queryset.order_by('id').values_list('id', 'codigo', 'latitude', 'longitude', 'tipo_imovel')[:LIMITE_PADRAO_PROPRIEDADES]
+            # O total é medido com count(); o plano mostrado é o da varredura equivalente
+            yield f'Total: {descricao}', queryset.values('id')
+        
+        yield 'Estados (mapa)', Propriedade.objects.values_list('estado', flat=True).distinct().order_by('estado')
+        yield 'Tipos de imóvel (mapa)', Propriedade.objects.values_list('tipo_imovel', flat=True).distinct().order_by('tipo_imovel')
+        yield 'Cidades do estado', Propriedade.objects.filter(
+            estado=estado, latitude__isnull=False, longitude__isnull=False
+        ).values_list('cidade', flat=True).distinct().order_by('cidade')
+        yield 'Bairros da cidade', Propriedade.objects.filter(
+            cidade=cidade, latitude__isnull=False, longitude__isnull=False
+        ).values_list('bairro', flat=True).distinct().order_by('bairro')
+
+    def handle(self, *args, **options):
+        postgres = connection.vendor == 'postgresql'
+        if not postgres:
+            self.stdout.write(self.style.WARNING(
+                f'Banco {connection.vendor}: EXPLAIN ANALYZE só está disponível no PostgreSQL, mostrando o plano simples'
+            ))
+        
+        resumo = []
+        for descricao, queryset in self._consultas():
+            tempos = []
+            contar = descricao.startswith('Total')
+            for _ in range(max(options['repeticoes'], 1)):
+                inicio = time.perf_counter()
+                # all() gera um queryset novo, sem o cache de resultados da execução anterior
+                queryset.all().count() if contar else list(queryset.all())
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            tempos.sort()
+            mediana = tempos[len(tempos) // 2]
+            resumo.append((descricao, mediana, tempos[0]))
+            
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n=== {descricao} ==='))
+            self.stdout.write(f'Mediana: {mediana:.2f} ms | Melhor: {tempos[0]:.2f} ms')
+            if not options['sem_plano']:
+                plano = queryset.explain(analyze=True, buffers=True) if postgres else queryset.explain()
+                self.stdout.write(plano)
+        
+        self.stdout.write(self.style.MIGRATE_HEADING('\n=== Resumo ==='))
+        for descricao, mediana, melhor in resumo:
+            self.stdout.write(f'{descricao:<35} {mediana:>10.2f} ms {melhor:>10.2f} ms')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from propriedades.cache_respostas import (
+    estatisticas, obter_ultima_alteracao, zerar_estatisticas, incrementar_geracao, INTERVALO_PUBLICACAO_ESTATISTICAS
+)
+
+
+class Command(BaseCommand):
+    help = 'Mostra a taxa de acerto e a geração atual do cache de respostas da API de imóveis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--zerar', action='store_true', help='Zera os contadores de acertos e falhas')
+        parser.add_argument('--invalidar', action='store_true', help='Avança a geração, descartando as respostas cacheadas')
+
+    def handle(self, *args, **options):
+        dados = estatisticas()
+        self.stdout.write(f"Geração dos dados: {dados['geracao']}")
+        self.stdout.write(f"Última alteração: {obter_ultima_alteracao()}")
+        self.stdout.write(f"Acertos: {dados['acertos']}")
+        self.stdout.write(f"Falhas: {dados['falhas']}")
+        self.stdout.write(f"Taxa de acerto: {dados['taxa_acerto']:.1%}")
+        self.stdout.write(f"(cada worker publica suas contagens a cada {INTERVALO_PUBLICACAO_ESTATISTICAS} consultas)")
+        
+        if options['zerar']:
+            zerar_estatisticas()
+            self.stdout.write(self.style.SUCCESS("Contadores zerados"))
+        if options['invalidar']:
+            self.stdout.write(self.style.SUCCESS(f"Nova geração: {incrementar_geracao()}"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('propriedades', '0008_propriedade_analise_matricula_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='propriedade',
+            name='hash_conteudo',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='Hash do conteúdo do CSV'),
+        ),
+    ]
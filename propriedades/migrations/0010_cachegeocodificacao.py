@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('propriedades', '0009_propriedade_hash_conteudo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheGeocodificacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endereco_normalizado', models.CharField(max_length=500, unique=True)),
+                ('latitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('longitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('provedor', models.CharField(default='here', max_length=50)),
+                ('sem_resultado', models.BooleanField(default=False)),
+                ('data_consulta', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Cache de Geocodificação',
+                'verbose_name_plural': 'Cache de Geocodificação',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('propriedades', '0010_cachegeocodificacao'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='propriedade',
+            index=models.Index(fields=['latitude', 'longitude'], name='propriedade_lat_lon_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.1 on 2026-10-18 15:02
+
+import math
+
+from django.db import migrations, models
+
+
+def _calcular_quadkey(lat, lon, nivel=18):
+    # Cópia de propriedades.geo.calcular_quadkey no momento desta migração: migrações
+    # não devem depender de código da aplicação, que pode mudar depois
+    lat = max(min(float(lat), 85.05112878), -85.05112878)
+    seno_lat = math.sin(math.radians(lat))
+    n = 1 << nivel
+    x = min(max(int((float(lon) + 180) / 360 * n), 0), n - 1)
+    y = min(max(int((0.5 - math.log((1 + seno_lat) / (1 - seno_lat)) / (4 * math.pi)) * n), 0), n - 1)
+    digitos = []
+    for bit in range(nivel, 0, -1):
+        mascara = 1 << (bit - 1)
+        digitos.append(str((1 if x & mascara else 0) + (2 if y & mascara else 0)))
+    return ''.join(digitos)
+
+
+def preencher_quadkey(apps, schema_editor):
+    Propriedade = apps.get_model('propriedades', 'Propriedade')
+    imoveis = Propriedade.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).values_list('pk', 'latitude', 'longitude')
+    lote = []
+    for pk, latitude, longitude in imoveis.iterator(chunk_size=2000):
+        lote.append(Propriedade(pk=pk, quadkey=_calcular_quadkey(latitude, longitude)))
+        if len(lote) >= 1000:
+            Propriedade.objects.bulk_update(lote, ['quadkey'])
+            lote = []
+    Propriedade.objects.bulk_update(lote, ['quadkey'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('propriedades', '0011_propriedade_lat_lon_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='propriedade',
+            name='quadkey',
+            field=models.CharField(blank=True, max_length=18, null=True, verbose_name='Quadkey da localização'),
+        ),
+        migrations.AddIndex(
+            model_name='propriedade',
+            index=models.Index(fields=['quadkey'], name='propriedade_quadkey_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(preencher_quadkey, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('propriedades', '0012_propriedade_quadkey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='propriedade',
+            index=models.Index(fields=['estado', 'cidade'], name='propriedade_estado_cidade_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propriedade',
+            index=models.Index(fields=['tipo_imovel'], name='propriedade_tipo_imovel_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propriedade',
+            index=models.Index(condition=models.Q(('latitude__isnull', False), ('longitude__isnull', False)), fields=['cidade', 'bairro'], name='propriedade_cidade_bairro_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propriedade',
+            index=models.Index(condition=models.Q(('latitude__isnull', False), ('longitude__isnull', False)), fields=['estado', 'desconto'], name='propriedade_mapa_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propriedade',
+            index=models.Index(condition=models.Q(('latitude__isnull', False), ('longitude__isnull', False)), fields=['valor'], name='propriedade_mapa_valor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propriedade',
+            index=models.Index(condition=models.Q(('latitude__isnull', False), ('longitude__isnull', False)), fields=['quartos'], name='propriedade_mapa_quartos_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propriedade',
+            index=models.Index(condition=models.Q(('latitude__isnull', False), ('longitude__isnull', False)), fields=['id'], name='propriedade_mapa_id_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('propriedades', '0013_indices_consultas_mapa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Faceta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(max_length=2)),
+                ('cidade', models.CharField(max_length=100)),
+                ('bairro', models.CharField(blank=True, max_length=100, null=True)),
+                ('tipo_imovel', models.CharField(blank=True, max_length=50, null=True)),
+                ('quantidade', models.IntegerField()),
+            ],
+            options={
+                'verbose_name': 'Faceta',
+                'verbose_name_plural': 'Facetas',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('propriedades', '0014_faceta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='propriedade',
+            name='imagem_disponivel',
+            field=models.BooleanField(blank=True, null=True, verbose_name='Imagem disponível'),
+        ),
+    ]
@@ -2,6 +2,9 @@ from django.db import models
 
 # Create your models here.
 
+# Condição dos índices parciais usados pelas consultas do mapa
+COM_COORDENADAS = models.Q(latitude__isnull=False, longitude__isnull=False)
+
 class Propriedade(models.Model):
     codigo = models.CharField(max_length=50, unique=True)
     tipo = models.CharField(max_length=100)
@@ -27,8 +30,12 @@ class Propriedade(models.Model):
     imagem_url = models.URLField(max_length=500, null=True, blank=True)
     imagem_cloudinary_url = models.URLField(max_length=500, null=True, blank=True)
     imagem_cloudinary_id = models.CharField(max_length=100, null=True, blank=True)
+    # None: ainda não verificada; True: foto baixada para o cache; False: a Caixa não tem a foto
+    imagem_disponivel = models.BooleanField(null=True, blank=True, verbose_name='Imagem disponível')
     matricula_url = models.URLField(blank=True, null=True, verbose_name='URL da Matrícula')
     analise_matricula = models.TextField(blank=True, null=True, verbose_name='Análise da Matrícula')
+    hash_conteudo = models.CharField(max_length=64, blank=True, null=True, verbose_name='Hash do conteúdo do CSV')
+    quadkey = models.CharField(max_length=18, blank=True, null=True, verbose_name='Quadkey da localização')
 
     def __str__(self):
         return f"{self.codigo} - {self.endereco}"
@@ -36,6 +43,20 @@ class Propriedade(models.Model):
     class Meta:
         verbose_name = "Propriedade"
         verbose_name_plural = "Propriedades"
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='propriedade_lat_lon_idx'),
+            # varchar_pattern_ops permite que o PostgreSQL use o índice em buscas por prefixo (LIKE 'abc%')
+            models.Index(fields=['quadkey'], name='propriedade_quadkey_idx', opclasses=['varchar_pattern_ops']),
+            # DISTINCT ... ORDER BY da página do mapa e da API de cidades
+            models.Index(fields=['estado', 'cidade'], name='propriedade_estado_cidade_idx'),
+            models.Index(fields=['tipo_imovel'], name='propriedade_tipo_imovel_idx'),
+            # Índices parciais: a API do mapa só consulta imóveis com coordenadas
+            models.Index(fields=['cidade', 'bairro'], name='propriedade_cidade_bairro_idx', condition=COM_COORDENADAS),
+            models.Index(fields=['estado', 'desconto'], name='propriedade_mapa_estado_idx', condition=COM_COORDENADAS),
+            models.Index(fields=['valor'], name='propriedade_mapa_valor_idx', condition=COM_COORDENADAS),
+            models.Index(fields=['quartos'], name='propriedade_mapa_quartos_idx', condition=COM_COORDENADAS),
+            models.Index(fields=['id'], name='propriedade_mapa_id_idx', condition=COM_COORDENADAS),
+        ]
 
 class ImagemPropriedade(models.Model):
     propriedade = models.ForeignKey(Propriedade, on_delete=models.CASCADE, related_name='imagens')
@@ -49,3 +70,33 @@ class ImagemPropriedade(models.Model):
         verbose_name = "Imagem da Propriedade"
         verbose_name_plural = "Imagens da Propriedade"
         ordering = ['ordem']
+
+class CacheGeocodificacao(models.Model):
+    endereco_normalizado = models.CharField(max_length=500, unique=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    provedor = models.CharField(max_length=50, default='here')
+    sem_resultado = models.BooleanField(default=False)
+    data_consulta = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.endereco_normalizado
+
+    class Meta:
+        verbose_name = "Cache de Geocodificação"
+        verbose_name_plural = "Cache de Geocodificação"
+
+class Faceta(models.Model):
+    """Contagem de imóveis com coordenadas por estado, cidade, bairro e tipo, materializada após a importação"""
+    estado = models.CharField(max_length=2)
+    cidade = models.CharField(max_length=100)
+    bairro = models.CharField(max_length=100, null=True, blank=True)
+    tipo_imovel = models.CharField(max_length=50, null=True, blank=True)
+    quantidade = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.estado} / {self.cidade} / {self.bairro} / {self.tipo_imovel}: {self.quantidade}"
+
+    class Meta:
+        verbose_name = "Faceta"
+        verbose_name_plural = "Facetas"
@@ -0,0 +1,138 @@
+import json
+from decimal import Decimal
+from unittest import mock
+
+from django.test import override_settings
+
+from propriedades import views
+from propriedades.views import CAMPOS_PADRAO_LISTA, CAMPOS_PROPRIEDADE
+from .utils import TestCaseImoveis, criar_imovel
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BboxCursorTests(TestCaseImoveis):
+    @classmethod
+    def setUpTestData(cls):
+        # São Paulo (3), Rio de Janeiro (2) e um imóvel sem coordenadas
+        for codigo, latitude, longitude in [
+            ('1', '-23.55', '-46.63'), ('2', '-23.56', '-46.64'), ('3', '-23.57', '-46.65'),
+            ('4', '-22.90', '-43.17'), ('5', '-22.91', '-43.18'),
+        ]:
+            criar_imovel(codigo, latitude=Decimal(latitude), longitude=Decimal(longitude))
+        criar_imovel('6', latitude=None, longitude=None)
+
+    def _codigos(self, **params):
+        response = self.client.get('/api/propriedades/', params)
+        self.assertEqual(response.status_code, 200)
+        dados = response.json()
+        return [imovel['codigo'] for imovel in dados['propriedades']], dados
+
+    def test_bbox_restringe_aos_imoveis_visiveis(self):
+        codigos, dados = self._codigos(bbox='-47,-24,-46,-23')
+        self.assertEqual(codigos, ['1', '2', '3'])
+        self.assertEqual(dados['total'], 3)
+
+        codigos, _ = self._codigos(bbox='-43.175,-22.905,-43.0,-22.0')
+        self.assertEqual(codigos, ['4'])
+
+    def test_cursor_percorre_todas_as_paginas(self):
+        codigos, cursor, paginas = [], 0, 0
+        while cursor is not None:
+            pagina, dados = self._codigos(limit=2, cursor=cursor)
+            self.assertEqual(dados['total'], 5)
+            codigos.extend(pagina)
+            cursor = dados['proximo_cursor']
+            paginas += 1
+        self.assertEqual(codigos, ['1', '2', '3', '4', '5'])
+        self.assertEqual(paginas, 3)
+
+    def test_pagina_exata_termina_com_cursor_vazio(self):
+        _, primeira = self._codigos(limit=5)
+        self.assertIsNotNone(primeira['proximo_cursor'])
+        codigos, segunda = self._codigos(limit=5, cursor=primeira['proximo_cursor'])
+        self.assertEqual((codigos, segunda['proximo_cursor']), ([], None))
+
+    def test_parametros_invalidos(self):
+        invalidos = [
+            {'bbox': 'nan,-24,-46,-23'},
+            {'bbox': '-47,-24,inf,-23'},
+            {'bbox': '-47,-24,-46'},
+            {'bbox': '-47,-24,-46,-23,0'},
+            {'bbox': 'a,b,c,d'},
+            {'bbox': '-46,-24,-47,-23'},
+            {'bbox': '-47,-95,-46,-23'},
+            {'bbox': '-181,-24,-46,-23'},
+            {'limit': '0'},
+            {'limit': 'dez'},
+            {'cursor': '1.5'},
+        ]
+        for params in invalidos:
+            with self.subTest(**params):
+                self.assertEqual(self.client.get('/api/propriedades/', params).status_code, 400)
+        self.assertEqual(self.client.get('/api/propriedades/clusters/', {'bbox': 'nan,nan,nan,nan'}).status_code, 400)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PayloadEnxutoTests(TestCaseImoveis):
+    @classmethod
+    def setUpTestData(cls):
+        criar_imovel('1', endereco='Rua A, 1', valor=Decimal('150000.50'))
+
+    def test_lista_traz_so_os_campos_do_marcador(self):
+        imovel = self.client.get('/api/propriedades/').json()['propriedades'][0]
+        self.assertEqual(list(imovel), list(CAMPOS_PADRAO_LISTA))
+
+    def test_lista_com_campos_escolhidos(self):
+        imovel = self.client.get('/api/propriedades/', {'fields': 'codigo, valor,codigo'}).json()['propriedades'][0]
+        self.assertEqual(imovel, {'codigo': '1', 'valor': '150000.50'})
+
+    def test_campo_desconhecido(self):
+        for fields in ('codigo,senha', ','):
+            with self.subTest(fields=fields):
+                self.assertEqual(self.client.get('/api/propriedades/', {'fields': fields}).status_code, 400)
+        self.assertEqual(self.client.get('/api/propriedades/1/', {'fields': 'id'}).status_code, 400)
+
+    def test_detalhe_traz_todos_os_campos(self):
+        imovel = self.client.get('/api/propriedades/1/').json()
+        self.assertEqual(list(imovel), list(CAMPOS_PROPRIEDADE))
+        self.assertEqual(imovel['endereco'], 'Rua A, 1')
+
+        self.assertEqual(self.client.get('/api/propriedades/1/', {'fields': 'codigo,cidade'}).json(), {'codigo': '1', 'cidade': 'SAO PAULO'})
+        self.assertEqual(self.client.get('/api/propriedades/999/').status_code, 404)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StreamingTests(TestCaseImoveis):
+    @classmethod
+    def setUpTestData(cls):
+        for codigo in range(1, 8):
+            criar_imovel(str(codigo), valor=Decimal(f'{codigo}0000.50'))
+
+    def _stream(self, **params):
+        response = self.client.get('/api/propriedades/', {'stream': '1', **params})
+        self.assertTrue(response.streaming)
+        blocos = list(response.streaming_content)
+        return json.loads(b''.join(blocos)), blocos
+
+    def test_mesmo_conteudo_da_lista_paginada(self):
+        with mock.patch.object(views, 'TAMANHO_BLOCO_STREAMING', 3):
+            dados, blocos = self._stream(fields='codigo,valor')
+
+        # Abertura, blocos de 3, 3 e 1 imóveis e fechamento
+        self.assertEqual(len(blocos), 5)
+        paginado = self.client.get('/api/propriedades/', {'fields': 'codigo,valor'}).json()
+        self.assertEqual(dados, {**paginado, 'proximo_cursor': None})
+        self.assertEqual(len(dados['propriedades']), 7)
+
+    def test_stream_a_partir_do_cursor(self):
+        primeira = self.client.get('/api/propriedades/', {'limit': 2}).json()
+        dados, _ = self._stream(cursor=primeira['proximo_cursor'])
+        self.assertEqual([imovel['codigo'] for imovel in dados['propriedades']], ['3', '4', '5', '6', '7'])
+        self.assertEqual(dados['total'], 7)
+
+    def test_stream_vazio(self):
+        dados, _ = self._stream(estado='AC')
+        self.assertEqual(dados, {'total': 0, 'proximo_cursor': None, 'propriedades': []})
+
+    def test_stream_so_em_json(self):
+        self.assertEqual(self.client.get('/api/propriedades/', {'stream': '1', 'format': 'columnar'}).status_code, 400)
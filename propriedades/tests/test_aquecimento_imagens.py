@@ -0,0 +1,65 @@
+import logging
+from unittest import mock
+
+import requests
+
+from propriedades import aquecimento_imagens
+from propriedades.cliente_caixa import ImagemInvalida, ImagemNaoEncontrada
+from propriedades.models import Propriedade
+from propriedades.tests.utils import TestCaseImoveis, criar_imovel
+
+
+def _url(codigo):
+    return f"https://venda-imoveis.caixa.gov.br/fotos/F{codigo.zfill(13)}21.jpg"
+
+
+class AquecimentoImagensTests(TestCaseImoveis):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        # Resposta da Caixa por imóvel: caminho no cache ou exceção
+        self.respostas = {
+            '1': ('/tmp/1.bin', {'content_type': 'image/jpeg'}),
+            '2': ImagemNaoEncontrada(_url('2')),
+            '3': requests.exceptions.ConnectionError(),
+            '4': ImagemInvalida(_url('4')),
+        }
+        for codigo in self.respostas:
+            criar_imovel(codigo, imagem_url=_url(codigo))
+        criar_imovel('5', imagem_url=None)
+
+        self.buscar = mock.patch.object(aquecimento_imagens, 'buscar_imagem', side_effect=self._buscar).start()
+        self.variante = mock.patch.object(aquecimento_imagens, 'obter_variante').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _buscar(self, url):
+        resposta = self.respostas[url.split('/F')[-1][:-6].lstrip('0')]
+        if isinstance(resposta, Exception):
+            raise resposta
+        return resposta
+
+    def _disponibilidade(self):
+        return dict(Propriedade.objects.values_list('codigo', 'imagem_disponivel'))
+
+    def test_marca_disponiveis_e_ausentes(self):
+        estatisticas = aquecimento_imagens.aquecer_imagens(max_workers=2)
+
+        self.assertEqual(estatisticas, {'disponiveis': 1, 'ausentes': 1, 'erros': 2})
+        # Erro temporário e resposta inválida ficam sem marcação para a próxima tentativa
+        self.assertEqual(self._disponibilidade(), {'1': True, '2': False, '3': None, '4': None, '5': None})
+        # Variantes geradas só para a foto baixada
+        self.assertTrue(all(chamada.args[0] == _url('1') for chamada in self.variante.call_args_list))
+        self.assertTrue(self.variante.called)
+
+    def test_restrito_aos_codigos_informados(self):
+        aquecimento_imagens.aquecer_imagens(codigos=['1', '2'], max_workers=2, tamanho_lote=1)
+
+        self.assertEqual(sorted(chamada.args[0] for chamada in self.buscar.call_args_list), [_url('1'), _url('2')])
+        self.assertEqual(self._disponibilidade(), {'1': True, '2': False, '3': None, '4': None, '5': None})
+
+    def test_imagens_ja_verificadas_nao_sao_baixadas_de_novo(self):
+        Propriedade.objects.filter(codigo__in=['1', '2']).update(imagem_disponivel=True)
+
+        aquecimento_imagens.aquecer_imagens(max_workers=2)
+
+        self.assertEqual(sorted(chamada.args[0] for chamada in self.buscar.call_args_list), [_url('3'), _url('4')])
@@ -0,0 +1,115 @@
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+
+from propriedades import cache_respostas
+from propriedades.cache_respostas import (
+    obter_geracao, incrementar_geracao, normalizar_parametros, estatisticas, CHAVE_GERACAO
+)
+from .utils import TestCaseImoveis, criar_imovel
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheRespostasTests(TestCaseImoveis):
+    @classmethod
+    def setUpTestData(cls):
+        criar_imovel('1')
+        criar_imovel('2', estado='RJ')
+
+    def setUp(self):
+        cache.clear()
+        cache_respostas.zerar_estatisticas()
+
+    def test_geracao_nao_repete_apos_perder_a_chave(self):
+        geracao = obter_geracao()
+        self.assertEqual(obter_geracao(), geracao)
+        cache.delete(CHAVE_GERACAO)
+        self.assertNotEqual(obter_geracao(), geracao)
+
+    def test_geracao_nao_expira_com_o_timeout_padrao(self):
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'TIMEOUT': 1}}):
+            geracao = incrementar_geracao()
+            agora = time.time()
+            with mock.patch('django.core.cache.backends.locmem.time.time', return_value=agora + 3600):
+                self.assertEqual(obter_geracao(), geracao)
+
+    def test_parametros_normalizados_independem_da_ordem(self):
+        self.assertEqual(
+            normalizar_parametros({'estado': 'SP,RJ', 'valor_max': '1'}),
+            normalizar_parametros({'valor_max': '1', 'estado': 'RJ,SP'}),
+        )
+
+    def test_resposta_cacheada_ate_a_proxima_geracao(self):
+        self.assertEqual(self.client.get('/api/propriedades/').json()['total'], 2)
+        criar_imovel('3')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/propriedades/').json()['total'], 2)
+        
+        incrementar_geracao()
+        self.assertEqual(self.client.get('/api/propriedades/').json()['total'], 3)
+
+    def test_estatisticas_somadas_e_mostradas_pelo_comando(self):
+        self.client.get('/api/propriedades/', {'estado': 'SP'})
+        self.client.get('/api/propriedades/', {'estado': 'SP'})
+        self.client.get('/api/propriedades/', {'estado': 'RJ'})
+        dados = estatisticas()
+        self.assertEqual((dados['acertos'], dados['falhas']), (1, 2))
+        
+        saida = StringIO()
+        call_command('estatisticas_cache', stdout=saida)
+        self.assertIn('Acertos: 1', saida.getvalue())
+        self.assertIn('Falhas: 2', saida.getvalue())
+        self.assertIn('33.3%', saida.getvalue())
+
+    def test_contagens_publicadas_a_cada_intervalo(self):
+        for _ in range(cache_respostas.INTERVALO_PUBLICACAO_ESTATISTICAS):
+            cache_respostas._contar('falhas')
+        self.assertEqual(cache.get(cache_respostas.CHAVE_FALHAS), cache_respostas.INTERVALO_PUBLICACAO_ESTATISTICAS)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RespostaCondicionalTests(TestCaseImoveis):
+    URLS = ['/api/propriedades/', '/api/propriedades/clusters/', '/api/propriedades/1/', '/api/cidades/SP/', '/api/facetas/']
+
+    @classmethod
+    def setUpTestData(cls):
+        criar_imovel('1')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_etag_igual_responde_304(self):
+        for url in self.URLS:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertTrue(response.has_header('Last-Modified'))
+
+                # O 304 sai sem consultar o banco
+                with self.assertNumQueries(0):
+                    revalidacao = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(revalidacao.status_code, 304)
+                self.assertEqual(revalidacao.content, b'')
+
+    def test_last_modified_responde_304(self):
+        response = self.client.get('/api/propriedades/')
+        revalidacao = self.client.get('/api/propriedades/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(revalidacao.status_code, 304)
+
+    def test_etag_depende_dos_parametros(self):
+        sp = self.client.get('/api/propriedades/', {'estado': 'SP'})
+        rj = self.client.get('/api/propriedades/', {'estado': 'RJ'})
+        self.assertNotEqual(sp['ETag'], rj['ETag'])
+        self.assertEqual(self.client.get('/api/propriedades/', {'estado': 'RJ'}, HTTP_IF_NONE_MATCH=sp['ETag']).status_code, 200)
+
+    def test_nova_geracao_invalida_o_etag(self):
+        etag = self.client.get('/api/propriedades/')['ETag']
+        incrementar_geracao()
+        response = self.client.get('/api/propriedades/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
@@ -0,0 +1,143 @@
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from propriedades import cliente_caixa
+from .utils import usar_diretorio_temporario
+
+
+class _EventoContado(threading.Event):
+    """Event que avisa (via semáforo) cada thread que começa a esperar a busca em andamento"""
+
+    def __init__(self, esperando, timeouts):
+        super().__init__()
+        self.esperando = esperando
+        self.timeouts = timeouts
+
+    def wait(self, timeout=None):
+        self.timeouts.append(timeout)
+        self.esperando.release()
+        return super().wait(timeout)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BuscaImagemSingleFlightTests(SimpleTestCase):
+    URL = 'https://venda-imoveis.caixa.gov.br/fotos/F000000000000121.jpg'
+    QUANTIDADE = 8
+
+    def setUp(self):
+        usar_diretorio_temporario(self, 'IMAGENS_CACHE_DIR')
+        self.esperando = threading.Semaphore(0)
+        self.timeouts = []
+        self.chamadas = 0
+
+        esperando, timeouts = self.esperando, self.timeouts
+
+        class BuscaContada(cliente_caixa._BuscaEmAndamento):
+            def __init__(self):
+                super().__init__()
+                self.concluida = _EventoContado(esperando, timeouts)
+
+        mock.patch.object(cliente_caixa, '_BuscaEmAndamento', BuscaContada).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _aguardar_as_demais(self):
+        """Segura o download até todas as outras threads estarem esperando por ele"""
+        self.chamadas += 1
+        for _ in range(self.QUANTIDADE - 1):
+            self.assertTrue(self.esperando.acquire(timeout=5))
+
+    def _buscar_em_paralelo(self, download):
+        resultados, erros = [], []
+
+        def buscar():
+            try:
+                resultados.append(cliente_caixa.buscar_imagem(self.URL))
+            except Exception as e:
+                erros.append(e)
+
+        with mock.patch.object(cliente_caixa, '_baixar_para_cache', download):
+            threads = [threading.Thread(target=buscar) for _ in range(self.QUANTIDADE)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+        return resultados, erros
+
+    def test_requisicoes_simultaneas_fazem_um_unico_download(self):
+        def download(url):
+            self._aguardar_as_demais()
+            return '/tmp/imagem.bin', {'content_type': 'image/jpeg'}
+
+        resultados, erros = self._buscar_em_paralelo(download)
+        self.assertEqual(self.chamadas, 1)
+        self.assertEqual(erros, [])
+        self.assertEqual(len(resultados), self.QUANTIDADE)
+        self.assertTrue(all(resultado == resultados[0] for resultado in resultados))
+        self.assertEqual(cliente_caixa._buscas_em_andamento, {})
+
+    def test_erro_do_download_e_compartilhado(self):
+        def download(url):
+            self._aguardar_as_demais()
+            raise cliente_caixa.ImagemNaoEncontrada(url)
+
+        resultados, erros = self._buscar_em_paralelo(download)
+        self.assertEqual(self.chamadas, 1)
+        self.assertEqual(resultados, [])
+        self.assertEqual(len(erros), self.QUANTIDADE)
+        self.assertTrue(all(isinstance(erro, cliente_caixa.ImagemNaoEncontrada) for erro in erros))
+
+    def test_espera_cobre_o_pior_caso_da_busca(self):
+        def download(url):
+            self._aguardar_as_demais()
+            return '/tmp/imagem.bin', {'content_type': 'image/jpeg'}
+
+        self._buscar_em_paralelo(download)
+        # Renovação de cookies + GET + renovação após 403 + GET
+        self.assertGreaterEqual(cliente_caixa.ESPERA_MAXIMA_BUSCA, 4 * cliente_caixa.TIMEOUT)
+        self.assertEqual(self.timeouts, [cliente_caixa.ESPERA_MAXIMA_BUSCA] * (self.QUANTIDADE - 1))
+
+
+class SessaoCaixaTests(SimpleTestCase):
+    URL = 'https://venda-imoveis.caixa.gov.br/fotos/F000000000000121.jpg'
+
+    def setUp(self):
+        self.sessao_caixa = cliente_caixa.SessaoCaixa(tamanho_pool=4, validade_cookies=60)
+        self.get = mock.Mock(side_effect=self._responder)
+        self.sessao_caixa.sessao.get = self.get
+        self.respostas = []
+
+    def _responder(self, url, **kwargs):
+        resposta = mock.Mock(status_code=200)
+        if url != cliente_caixa.URL_PRINCIPAL and self.respostas:
+            resposta.status_code = self.respostas.pop(0)
+        return resposta
+
+    def _visitas_pagina_principal(self):
+        return sum(chamada.args[0] == cliente_caixa.URL_PRINCIPAL for chamada in self.get.call_args_list)
+
+    def test_cookies_reaproveitados_entre_downloads(self):
+        for _ in range(3):
+            self.sessao_caixa.baixar(self.URL)
+        self.assertEqual(self._visitas_pagina_principal(), 1)
+        self.assertEqual(self.get.call_count, 4)
+
+    def test_cookies_expirados_sao_renovados(self):
+        self.sessao_caixa.baixar(self.URL)
+        self.sessao_caixa._cookies_obtidos_em -= 61
+        self.sessao_caixa.baixar(self.URL)
+        self.assertEqual(self._visitas_pagina_principal(), 2)
+
+    def test_403_renova_os_cookies_e_tenta_de_novo(self):
+        self.respostas = [403, 200]
+        resposta = self.sessao_caixa.baixar(self.URL)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(self._visitas_pagina_principal(), 2)
+
+    def test_sessao_unica_com_pool_do_tamanho_configurado(self):
+        sessao_caixa = cliente_caixa.SessaoCaixa(tamanho_pool=7)
+        sessao = sessao_caixa.sessao
+        self.assertIs(sessao_caixa.sessao, sessao)
+        self.assertEqual(sessao.get_adapter('https://venda-imoveis.caixa.gov.br/')._pool_maxsize, 7)
+        self.assertIn(sessao.headers['User-Agent'], cliente_caixa.USER_AGENTS)
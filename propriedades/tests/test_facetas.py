@@ -0,0 +1,76 @@
+from django.core.cache import cache
+from django.test import override_settings
+
+from propriedades import facetas
+from propriedades.cache_respostas import incrementar_geracao
+from propriedades.models import Faceta
+from .utils import TestCaseImoveis, criar_imovel
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FacetasTests(TestCaseImoveis):
+    @classmethod
+    def setUpTestData(cls):
+        criar_imovel('1', bairro='CENTRO', tipo_imovel='Casa')
+        criar_imovel('2', bairro='CENTRO', tipo_imovel='Casa')
+        criar_imovel('3', bairro='MOOCA', tipo_imovel='Apartamento')
+        criar_imovel('4', bairro=None, tipo_imovel=None, cidade='CAMPINAS')
+        criar_imovel('5', estado='RJ', cidade='NITEROI', bairro='ICARAI', tipo_imovel='Casa')
+        criar_imovel('6', latitude=None, longitude=None)  # sem coordenadas: fora das facetas
+
+    def setUp(self):
+        cache.clear()
+
+    def test_materializacao_agrupa_os_imoveis_com_coordenadas(self):
+        # Uma linha por combinação de estado/cidade/bairro/tipo
+        self.assertEqual(facetas.materializar_facetas(), 4)
+
+        contagens = {
+            (faceta.estado, faceta.cidade, faceta.bairro, faceta.tipo_imovel): faceta.quantidade
+            for faceta in Faceta.objects.all()
+        }
+        self.assertEqual(contagens[('SP', 'SAO PAULO', 'CENTRO', 'Casa')], 2)
+        self.assertEqual(contagens[('SP', 'CAMPINAS', None, None)], 1)
+        self.assertEqual(sum(contagens.values()), 5)
+
+        # Rematerializar substitui as linhas em vez de acumular
+        facetas.materializar_facetas()
+        self.assertEqual(Faceta.objects.count(), 4)
+
+    def test_hierarquia_e_tipos(self):
+        facetas.materializar_facetas()
+        incrementar_geracao()
+        dados = facetas.obter_facetas()
+
+        self.assertEqual(dados['total'], 5)
+        self.assertEqual([(estado['estado'], estado['quantidade']) for estado in dados['estados']], [('RJ', 1), ('SP', 4)])
+        sao_paulo = next(cidade for cidade in dados['estados'][1]['cidades'] if cidade['cidade'] == 'SAO PAULO')
+        self.assertEqual(sao_paulo['bairros'], [{'bairro': 'CENTRO', 'quantidade': 2}, {'bairro': 'MOOCA', 'quantidade': 1}])
+        # Valores vazios no fim
+        self.assertEqual(dados['tipos_imovel'][-1], {'tipo_imovel': None, 'quantidade': 1})
+        self.assertEqual(facetas.cidades_do_estado('SP'), ['CAMPINAS', 'SAO PAULO'])
+        self.assertEqual(facetas.bairros_da_cidade('CAMPINAS'), [None])
+
+    def test_facetas_em_memoria_ate_a_proxima_geracao(self):
+        facetas.materializar_facetas()
+        incrementar_geracao()
+        facetas.obter_facetas()
+
+        criar_imovel('7', estado='MG', cidade='BELO HORIZONTE')
+        facetas.materializar_facetas()
+        with self.assertNumQueries(0):
+            self.assertEqual(facetas.cidades_do_estado('MG'), [])
+
+        incrementar_geracao()
+        self.assertEqual(facetas.cidades_do_estado('MG'), ['BELO HORIZONTE'])
+
+    def test_sem_materializacao_agrega_direto_dos_imoveis(self):
+        incrementar_geracao()
+        self.assertEqual(facetas.obter_facetas()['total'], 5)
+
+    def test_api(self):
+        facetas.materializar_facetas()
+        incrementar_geracao()
+        self.assertEqual(self.client.get('/api/facetas/').json()['total'], 5)
+        self.assertEqual(self.client.get('/api/cidades/RJ/').json(), ['NITEROI'])
+        self.assertEqual(self.client.get('/api/bairros/SAO PAULO/').json(), ['CENTRO', 'MOOCA'])
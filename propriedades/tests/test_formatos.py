@@ -0,0 +1,100 @@
+import json
+import math
+import struct
+from array import array
+from decimal import Decimal
+
+from django.test import SimpleTestCase, override_settings
+
+from propriedades.formatos import serializar_colunar, serializar_binario
+from .utils import TestCaseImoveis, criar_imovel
+
+
+CAMPOS = ['codigo', 'estado', 'cidade', 'valor', 'latitude', 'link']
+LINHAS = [
+    ('1001', 'SP', 'SAO PAULO', Decimal('150000.50'), Decimal('-23.550520'), 'https://a'),
+    ('1002', 'RJ', 'RIO DE JANEIRO', Decimal('90000.00'), None, None),
+    ('1003', 'SP', 'CAMPINAS', Decimal('210000.00'), Decimal('-22.909938'), 'https://c'),
+]
+
+
+def _esperado():
+    return [
+        {campo: float(valor) if isinstance(valor, Decimal) else valor for campo, valor in zip(CAMPOS, linha)}
+        for linha in LINHAS
+    ]
+
+
+class FormatosTests(SimpleTestCase):
+    def test_colunar_ida_e_volta(self):
+        dados = json.loads(serializar_colunar(LINHAS, CAMPOS, proximo_cursor=7))
+        self.assertEqual(dados['quantidade'], 3)
+        self.assertEqual(dados['proximo_cursor'], 7)
+        self.assertEqual(dados['dicionarios']['estado'], ['SP', 'RJ'])
+
+        linhas = []
+        for i in range(dados['quantidade']):
+            linha = {}
+            for campo in CAMPOS:
+                valor = dados['colunas'][campo][i]
+                if campo in dados['dicionarios']:
+                    valor = dados['dicionarios'][campo][valor]
+                linha[campo] = valor
+            linhas.append(linha)
+        self.assertEqual(linhas, _esperado())
+
+    def test_binario_ida_e_volta(self):
+        conteudo = serializar_binario(LINHAS, CAMPOS)
+        (tamanho_cabecalho,) = struct.unpack_from('<I', conteudo)
+        cabecalho = json.loads(conteudo[4:4 + tamanho_cabecalho])
+        inicio = 4 + tamanho_cabecalho
+        self.assertEqual(inicio % 8, 0)
+        self.assertEqual(cabecalho['quantidade'], 3)
+
+        colunas = {}
+        for coluna in cabecalho['colunas']:
+            if coluna['tipo'] == 'texto':
+                colunas[coluna['campo']] = coluna['valores']
+                continue
+            tipo, tamanho = ('d', 8) if coluna['tipo'] == 'float64' else ('I', 4)
+            offset = inicio + coluna['offset']
+            valores = array(tipo, conteudo[offset:offset + tamanho * cabecalho['quantidade']]).tolist()
+            if 'dicionario' in coluna:
+                valores = [coluna['dicionario'][indice] for indice in valores]
+            colunas[coluna['campo']] = [None if isinstance(v, float) and math.isnan(v) else v for v in valores]
+
+        linhas = [{campo: colunas[campo][i] for campo in CAMPOS} for i in range(3)]
+        self.assertEqual(linhas, _esperado())
+
+    def test_sem_linhas(self):
+        self.assertEqual(json.loads(serializar_colunar([], CAMPOS))['quantidade'], 0)
+        (tamanho_cabecalho,) = struct.unpack_from('<I', serializar_binario([], CAMPOS))
+        self.assertGreater(tamanho_cabecalho, 0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FormatosApiTests(TestCaseImoveis):
+    @classmethod
+    def setUpTestData(cls):
+        criar_imovel('1', tipo_imovel='Casa')
+        criar_imovel('2', tipo_imovel='Apartamento', latitude=None)
+        criar_imovel('3', tipo_imovel='Apartamento', estado='RJ', cidade='RIO DE JANEIRO')
+
+    def test_colunar(self):
+        response = self.client.get('/api/propriedades/', {'format': 'columnar', 'fields': 'codigo,estado'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        dados = response.json()
+        self.assertEqual((dados['total'], dados['quantidade']), (2, 2))
+        self.assertEqual(dados['colunas']['codigo'], ['1', '3'])
+        self.assertEqual([dados['dicionarios']['estado'][i] for i in dados['colunas']['estado']], ['SP', 'RJ'])
+
+    def test_binario(self):
+        response = self.client.get('/api/propriedades/', {'format': 'binary'})
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        (tamanho_cabecalho,) = struct.unpack_from('<I', response.content)
+        cabecalho = json.loads(response.content[4:4 + tamanho_cabecalho])
+        self.assertEqual(cabecalho['quantidade'], 2)
+        self.assertEqual([coluna['campo'] for coluna in cabecalho['colunas']], ['codigo', 'latitude', 'longitude', 'tipo_imovel'])
+
+    def test_formato_invalido(self):
+        self.assertEqual(self.client.get('/api/propriedades/', {'format': 'xml'}).status_code, 400)
@@ -0,0 +1,90 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from propriedades import views
+from propriedades.geo import (
+    NIVEL_QUADKEY, ZOOM_PONTOS_INDIVIDUAIS, coordenadas_para_tile, tile_para_quadkey, calcular_quadkey,
+    quadkey_para_tile, limites_tile, reconstruir_indice_quadkey
+)
+from propriedades.models import Propriedade
+from .utils import TestCaseImoveis, criar_imovel
+
+
+class GeoTests(SimpleTestCase):
+    def test_quadkey_ida_e_volta(self):
+        for x, y, zoom in [(0, 0, 1), (1, 1, 1), (3, 5, 3), (24197, 37034, 16), (2**18 - 1, 0, 18)]:
+            quadkey = tile_para_quadkey(x, y, zoom)
+            self.assertEqual(len(quadkey), zoom)
+            self.assertEqual(quadkey_para_tile(quadkey), (x, y, zoom))
+
+    def test_quadkey_conhecido(self):
+        # Exemplo da documentação do Bing Maps: tile (3, 5) no nível 3
+        self.assertEqual(tile_para_quadkey(3, 5, 3), '213')
+
+    def test_prefixo_do_quadkey_e_o_tile_de_cada_zoom(self):
+        lat, lon = -23.550520, -46.633308
+        quadkey = calcular_quadkey(lat, lon)
+        self.assertEqual(len(quadkey), NIVEL_QUADKEY)
+        for zoom in range(NIVEL_QUADKEY + 1):
+            x, y = coordenadas_para_tile(lat, lon, zoom)
+            self.assertEqual(quadkey_para_tile(quadkey[:zoom]), (x, y, zoom))
+
+    def test_ponto_dentro_dos_limites_do_tile(self):
+        lat, lon = -3.731862, -38.526670
+        for zoom in (0, 5, 12, 18):
+            x, y = coordenadas_para_tile(lat, lon, zoom)
+            min_lon, min_lat, max_lon, max_lat = limites_tile(x, y, zoom)
+            self.assertTrue(min_lon <= lon < max_lon)
+            self.assertTrue(min_lat < lat <= max_lat)
+
+    def test_coordenadas_extremas_ficam_no_mapa(self):
+        self.assertEqual(coordenadas_para_tile(90, 180, 2), (3, 0))
+        self.assertEqual(coordenadas_para_tile(-90, -180, 2), (0, 3))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ClustersApiTests(TestCaseImoveis):
+    @classmethod
+    def setUpTestData(cls):
+        for codigo, latitude, longitude, valor in [
+            ('1', '-23.550520', '-46.633308', '100000'), ('2', '-23.551000', '-46.634000', '80000'),
+            ('3', '-22.906847', '-43.172897', '120000'),
+        ]:
+            criar_imovel(codigo, latitude=Decimal(latitude), longitude=Decimal(longitude), valor=Decimal(valor))
+        reconstruir_indice_quadkey()
+
+    def test_indice_quadkey_reconstruido(self):
+        imovel = Propriedade.objects.get(codigo='1')
+        self.assertEqual(imovel.quadkey, calcular_quadkey(imovel.latitude, imovel.longitude))
+
+        Propriedade.objects.filter(codigo='1').update(latitude=None)
+        afetados = reconstruir_indice_quadkey()
+        self.assertEqual(afetados, {imovel.quadkey})
+        self.assertIsNone(Propriedade.objects.get(codigo='1').quadkey)
+
+    def test_clusters_agrupam_pela_grade_do_zoom(self):
+        dados = self.client.get('/api/propriedades/clusters/', {'zoom': 5}).json()
+
+        self.assertEqual((dados['modo'], dados['total']), ('clusters', 3))
+        clusters = {cluster['quantidade']: cluster for cluster in dados['clusters']}
+        self.assertEqual(set(clusters), {1, 2})
+        self.assertEqual(len(clusters[2]['celula']), 5 + 3)
+        self.assertEqual(float(clusters[2]['valor_min']), 80000.0)
+        self.assertAlmostEqual(float(clusters[2]['lat_media']), -23.55076, places=4)
+
+    def test_zoom_alto_retorna_pontos(self):
+        dados = self.client.get('/api/propriedades/clusters/', {'zoom': ZOOM_PONTOS_INDIVIDUAIS, 'estado': 'SP'}).json()
+
+        self.assertEqual((dados['modo'], dados['total'], dados['truncado']), ('pontos', 3, False))
+        self.assertEqual(sorted(ponto['codigo'] for ponto in dados['pontos']), ['1', '2', '3'])
+
+    def test_pontos_truncados_informam_o_total(self):
+        with mock.patch.object(views, 'LIMITE_MAXIMO_PROPRIEDADES', 2):
+            dados = self.client.get('/api/propriedades/clusters/', {'zoom': 16}).json()
+
+        self.assertEqual((dados['total'], dados['truncado'], len(dados['pontos'])), (3, True, 2))
+
+    def test_zoom_invalido(self):
+        self.assertEqual(self.client.get('/api/propriedades/clusters/', {'zoom': 'alto'}).status_code, 400)
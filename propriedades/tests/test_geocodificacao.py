@@ -0,0 +1,76 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.utils import timezone
+
+from importadorcaixa import ImportadorCaixa
+from propriedades.models import CacheGeocodificacao
+from propriedades.tests.utils import TestCaseImoveis
+
+
+class CacheGeocodificacaoTests(TestCaseImoveis):
+    """Cache persistente de geocodificação: TTL, resultados negativos e chave compartilhada com a revalidação"""
+
+    def setUp(self):
+        # Sem o __init__ para não abrir sessão HTTP com a Caixa
+        self.importador = ImportadorCaixa.__new__(ImportadorCaixa)
+        self.importador.lock_api = threading.Lock()
+        self.importador.estatisticas_geocodificacao = {'hits': 0, 'misses': 0}
+        self.importador.ttl_geocodificacao = timedelta(days=180)
+        self.importador.ttl_geocodificacao_negativo = timedelta(days=7)
+        self.importador.validador_geografico = mock.Mock()
+        self.importador.validador_geografico.validar_coordenadas.return_value = True
+        self.here = mock.patch.object(self.importador, '_geocodificar_here', return_value=(-23.55, -46.63)).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _envelhecer(self, dias):
+        CacheGeocodificacao.objects.update(data_consulta=timezone.now() - timedelta(days=dias))
+
+    def test_segunda_consulta_vem_do_cache(self):
+        self.assertEqual(self.importador._obter_coordenadas('Rua A, 1', 'SAO PAULO', 'SP'), (-23.55, -46.63))
+        self.assertEqual(self.importador._obter_coordenadas('  rua a,   1 ', 'SAO PAULO', 'SP'), (-23.55, -46.63))
+
+        self.assertEqual(self.here.call_count, 1)
+        self.assertEqual(self.importador.estatisticas_geocodificacao, {'hits': 1, 'misses': 1})
+
+    def test_entrada_expirada_consulta_a_api_novamente(self):
+        self.importador._obter_coordenadas('Rua A, 1', 'SAO PAULO', 'SP')
+        self._envelhecer(181)
+
+        self.importador._obter_coordenadas('Rua A, 1', 'SAO PAULO', 'SP')
+
+        self.assertEqual(self.here.call_count, 2)
+        self.assertEqual(CacheGeocodificacao.objects.count(), 1)
+
+    def test_resultado_negativo_expira_antes(self):
+        self.here.return_value = (None, None)
+
+        self.assertEqual(self.importador._obter_coordenadas('Rua B, 2', 'SAO PAULO', 'SP'), (None, None))
+        self.assertTrue(CacheGeocodificacao.objects.get().sem_resultado)
+
+        self._envelhecer(6)
+        self.importador._obter_coordenadas('Rua B, 2', 'SAO PAULO', 'SP')
+        self.assertEqual(self.here.call_count, 1)
+
+        self._envelhecer(8)
+        self.importador._obter_coordenadas('Rua B, 2', 'SAO PAULO', 'SP')
+        self.assertEqual(self.here.call_count, 2)
+
+    def test_falha_da_api_nao_e_gravada(self):
+        self.here.return_value = None
+
+        self.assertEqual(self.importador._obter_coordenadas('Rua C, 3', 'SAO PAULO', 'SP'), (None, None))
+
+        self.assertFalse(CacheGeocodificacao.objects.exists())
+
+    def test_revalidacao_reaproveita_a_chave_da_importacao(self):
+        imovel = {'codigo': '1', 'endereco': 'Rua D, 4', 'cidade': 'SAO PAULO', 'estado': 'SP'}
+        self.importador._geocodificar_imovel(imovel)
+
+        # Mesma consulta montada por revalidar_coordenadas.py
+        consulta = self.importador._endereco_geocodificacao('Rua D, 4', 'SAO PAULO', 'SP')
+        self.assertEqual(self.importador._obter_coordenadas(consulta, 'SAO PAULO', 'SP'), (-23.55, -46.63))
+
+        self.here.assert_called_once_with('Rua D, 4, SAO PAULO, SP, Brasil')
+        self.assertEqual(CacheGeocodificacao.objects.get().endereco_normalizado, 'RUA D, 4, SAO PAULO, SP, BRASIL')
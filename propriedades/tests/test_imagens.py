@@ -0,0 +1,185 @@
+import io
+import os
+import json
+import logging
+from unittest import mock, skipIf
+
+import requests
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from propriedades import imagens, cliente_caixa
+from propriedades.imagens import Image
+from .utils import usar_diretorio_temporario
+
+
+def _url(numero):
+    return f"https://venda-imoveis.caixa.gov.br/fotos/F{str(numero).zfill(13)}21.jpg"
+
+
+class _RespostaFalsa:
+    """Resposta do requests (stream=True) com o corpo informado"""
+
+    def __init__(self, conteudo, status_code=200, content_type='image/jpeg'):
+        self.conteudo = conteudo
+        self.status_code = status_code
+        self.headers = {'content-type': content_type}
+
+    def iter_content(self, tamanho):
+        for inicio in range(0, len(self.conteudo), tamanho):
+            yield self.conteudo[inicio:inicio + tamanho]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(response=self)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheImagensTests(SimpleTestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.diretorio = usar_diretorio_temporario(self, 'IMAGENS_CACHE_DIR')['IMAGENS_CACHE_DIR']
+        cache.clear()
+
+    def _gravar(self, numero, tamanho=100):
+        return imagens.gravar_imagem(_url(numero), _RespostaFalsa(b'x' * tamanho))
+
+    def test_gravar_e_obter(self):
+        caminho, metadados = self._gravar(1)
+
+        self.assertEqual(imagens.obter_imagem(_url(1)), (caminho, metadados))
+        self.assertEqual((metadados['tamanho'], metadados['content_type']), (100, 'image/jpeg'))
+        self.assertIsNone(imagens.obter_imagem(_url(2)))
+        # Nenhum arquivo temporário fica para trás
+        self.assertFalse([nome for _, _, nomes in os.walk(self.diretorio) for nome in nomes if nome.endswith('.tmp')])
+
+    def test_entrada_expirada(self):
+        caminho, metadados = self._gravar(1)
+        with open(caminho[:-len('.bin')] + '.json', 'w', encoding='utf-8') as f:
+            json.dump({**metadados, 'data_busca': 0}, f)
+        self.assertIsNone(imagens.obter_imagem(_url(1)))
+
+    def test_limpeza_remove_as_acessadas_ha_mais_tempo(self):
+        caminhos = [self._gravar(numero)[0] for numero in range(4)]
+        for ordem, caminho in enumerate(caminhos):
+            os.utime(caminho, (1_000_000 + ordem, 1_000_000 + ordem))
+        # O acesso atualiza a data de modificação: a imagem 0 passa a ser a mais recente
+        imagens.obter_imagem(_url(0))
+
+        self.assertEqual(imagens.limpar_cache(tamanho_maximo=300), 2)
+
+        self.assertEqual([imagens.obter_imagem(_url(numero)) is not None for numero in range(4)], [True, False, False, True])
+        # Metadados removidos junto com a imagem
+        self.assertFalse(os.path.exists(caminhos[1][:-len('.bin')] + '.json'))
+
+    def test_tamanho_limitado_durante_as_gravacoes(self):
+        with self.settings(IMAGENS_CACHE_TAMANHO_MAXIMO=1000):
+            for numero in range(30):
+                self._gravar(numero)
+        tamanho = sum(
+            os.path.getsize(os.path.join(raiz, nome))
+            for raiz, _, nomes in os.walk(self.diretorio) for nome in nomes if nome.endswith('.bin')
+        )
+        self.assertLessEqual(tamanho, 1000)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProxyImagemTests(SimpleTestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        usar_diretorio_temporario(self, 'IMAGENS_CACHE_DIR')
+        cache.clear()
+        self.baixar = mock.patch.object(cliente_caixa.sessao_caixa, 'baixar').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_host_nao_permitido(self):
+        for url in ['https://exemplo.com/foto.jpg', 'http://169.254.169.254/', 'file:///etc/passwd',
+                    'https://venda-imoveis.caixa.gov.br:8080/foto.jpg']:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get('/api/proxy-imagem/', {'url': url}).status_code, 400)
+        self.assertFalse(self.baixar.called)
+
+    def test_imagem_baixada_uma_vez_e_servida_do_cache(self):
+        self.baixar.return_value = _RespostaFalsa(b'jpeg')
+
+        for _ in range(2):
+            response = self.client.get('/api/proxy-imagem/', {'url': _url(1)})
+            self.assertEqual(b''.join(response.streaming_content), b'jpeg')
+            self.assertEqual(response['Content-Type'], 'image/jpeg')
+            self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertEqual(self.baixar.call_count, 1)
+
+    def test_404_guardado_no_cache_negativo(self):
+        self.baixar.side_effect = requests.exceptions.HTTPError(response=_RespostaFalsa(b'', status_code=404))
+
+        for _ in range(2):
+            response = self.client.get('/api/proxy-imagem/', {'url': _url(1)})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(self.baixar.call_count, 1)
+
+
+def _jpeg(largura, altura):
+    saida = io.BytesIO()
+    Image.new('RGB', (largura, altura), (200, 30, 30)).save(saida, 'JPEG')
+    return saida.getvalue()
+
+
+@skipIf(Image is None, 'Pillow não instalado')
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class VariantesTests(SimpleTestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        usar_diretorio_temporario(self, 'IMAGENS_CACHE_DIR')
+        cache.clear()
+        self.original = imagens.gravar_imagem(_url(1), _RespostaFalsa(_jpeg(1000, 500)))
+
+    def _abrir(self, caminho):
+        with Image.open(caminho) as imagem:
+            return imagem.format, imagem.size
+
+    def test_variante_reduzida_em_cada_formato(self):
+        for formato, (formato_pil, content_type) in imagens.FORMATOS_VARIANTES.items():
+            for largura in imagens.LARGURAS_VARIANTES:
+                with self.subTest(formato=formato, largura=largura):
+                    caminho, metadados = imagens.obter_variante(_url(1), largura, formato, *self.original)
+                    self.assertEqual(self._abrir(caminho), (formato_pil, (largura, largura // 2)))
+                    self.assertEqual((metadados['content_type'], metadados['largura']), (content_type, largura))
+
+    def test_variante_gerada_uma_vez(self):
+        primeira = imagens.obter_variante(_url(1), 320, 'webp', *self.original)
+        with mock.patch.object(imagens.Image, 'open', side_effect=AssertionError('variante gerada de novo')):
+            self.assertEqual(imagens.obter_variante(_url(1), 320, 'webp', *self.original), primeira)
+
+    def test_imagem_menor_nao_e_ampliada(self):
+        original = imagens.gravar_imagem(_url(2), _RespostaFalsa(_jpeg(200, 100)))
+        caminho, _ = imagens.obter_variante(_url(2), 800, 'jpeg', *original)
+        self.assertEqual(self._abrir(caminho), ('JPEG', (200, 100)))
+
+    def test_sem_pillow_ou_original_invalido_serve_o_original(self):
+        with mock.patch.object(imagens, 'Image', None):
+            self.assertEqual(imagens.obter_variante(_url(1), 320, 'webp', *self.original), self.original)
+
+        invalida = imagens.gravar_imagem(_url(3), _RespostaFalsa(b'<html>bloqueado</html>'))
+        self.assertEqual(imagens.obter_variante(_url(3), 320, 'webp', *invalida), invalida)
+
+    def test_proxy_escolhe_o_formato_pelo_accept(self):
+        with mock.patch.object(cliente_caixa.sessao_caixa, 'baixar', side_effect=AssertionError('fora do cache')):
+            webp = self.client.get('/api/proxy-imagem/', {'url': _url(1), 'w': 320}, HTTP_ACCEPT='image/webp,*/*')
+            jpeg = self.client.get('/api/proxy-imagem/', {'url': _url(1), 'w': 320}, HTTP_ACCEPT='image/*')
+
+        self.assertEqual((webp['Content-Type'], jpeg['Content-Type']), ('image/webp', 'image/jpeg'))
+        self.assertIn('Accept', webp['Vary'])
+        self.assertEqual(self.client.get('/api/proxy-imagem/', {'url': _url(1), 'w': 500}).status_code, 400)
@@ -0,0 +1,126 @@
+import logging
+import threading
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+
+from importadorcaixa import ImportadorCaixa
+from propriedades.models import ImagemPropriedade, Propriedade
+from propriedades.tests.utils import TestCaseImoveis
+from usuarios.models import Favorito
+
+
+CABECALHO_CSV = ("N° do imóvel;UF;Cidade;Bairro;Endereço;Preço;Valor de avaliação;Desconto;"
+                 "Descrição;Modalidade de venda;Link de acesso")
+COORDENADAS = {
+    'RUA A, 1': (-23.5, -46.6),
+    'RUA B, 2': (-23.6, -46.7),
+    'RUA C, 3': (-23.7, -46.8),
+    'RUA E, 5': (-23.9, -47.0),
+    'RUA Z, 30': (-22.9, -47.1),
+    'RUA D, 4': (-23.8, -46.9),
+}
+
+
+def _endereco(endereco_completo):
+    # O importador geocodifica "{endereço}, {cidade}, {UF}, Brasil"
+    return endereco_completo.removesuffix(', SAO PAULO, SP, Brasil')
+
+
+def _csv(*imoveis):
+    linhas = [
+        f"{codigo};SP;SAO PAULO;CENTRO;{endereco};{preco};300.000,00;10;"
+        f"Casa, 80,00 de área total, 2 qto(s);Venda Online;https://venda-imoveis.caixa.gov.br/{codigo}"
+        for codigo, endereco, preco in imoveis
+    ]
+    return '\n'.join(['Lista de Imóveis da Caixa', '', CABECALHO_CSV, *linhas])
+
+
+class ImportadorClassificacaoTests(TestCaseImoveis):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        # Sem __init__: nada de visita ao site da Caixa nem carga do GeoJSON dos municípios
+        self.importador = ImportadorCaixa.__new__(ImportadorCaixa)
+        self.importador.semaforo_host = threading.BoundedSemaphore(1)
+        self.importador.tamanho_lote = 100
+        self.importador.base_url = '{}'
+        self.importador._obter_coordenadas = mock.Mock(side_effect=lambda endereco, cidade, estado: COORDENADAS[_endereco(endereco)])
+        self.importador._obter_url_imagem = lambda codigo: f"https://venda-imoveis.caixa.gov.br/fotos/F{codigo.zfill(13)}21.jpg"
+
+    def _importar(self, conteudo_csv):
+        self.importador._baixar_csv = lambda url: conteudo_csv
+        return self.importador._importar_estado('SP')
+
+    def _coordenadas(self, codigo):
+        imovel = Propriedade.objects.get(codigo=codigo)
+        return (float(imovel.latitude), float(imovel.longitude)) if imovel.latitude is not None else None
+
+    def test_novos_alterados_inalterados_e_removidos(self):
+        primeira = self._importar(_csv(
+            ('1', 'RUA A, 1', '100.000,00'),
+            ('2', 'RUA B, 2', '100.000,00'),
+            ('3', 'RUA C, 3', '100.000,00'),
+            ('5', 'RUA E, 5', '100.000,00'),
+        ))
+        self.assertEqual((primeira['novos'], primeira['atualizados'], primeira['removidos']), (4, 0, 0))
+        self.assertEqual(primeira['codigos_imagens'], {'1', '2', '3', '5'})
+
+        self.importador._obter_coordenadas.reset_mock()
+        segunda = self._importar(_csv(
+            ('1', 'RUA A, 1', '100.000,00'),   # inalterado
+            ('2', 'RUA B, 2', '95.000,00'),    # preço alterado
+            ('3', 'RUA Z, 30', '100.000,00'),  # endereço alterado
+            ('4', 'RUA D, 4', '100.000,00'),   # novo
+        ))                                     # 5 saiu do CSV
+        self.assertEqual((segunda['novos'], segunda['atualizados'], segunda['removidos']), (1, 2, 1))
+        self.assertEqual(segunda['codigos_imagens'], {'2', '3', '4'})
+
+        # Só o imóvel novo e o de endereço alterado vão para a geocodificação
+        geocodificados = {_endereco(chamada.args[0]) for chamada in self.importador._obter_coordenadas.call_args_list}
+        self.assertEqual(geocodificados, {'RUA Z, 30', 'RUA D, 4'})
+
+        self.assertFalse(Propriedade.objects.filter(codigo='5').exists())
+        self.assertEqual(Propriedade.objects.get(codigo='2').valor, Decimal('95000.00'))
+        self.assertEqual(self._coordenadas('2'), COORDENADAS['RUA B, 2'])
+        self.assertEqual(self._coordenadas('3'), COORDENADAS['RUA Z, 30'])
+        self.assertEqual(self._coordenadas('4'), COORDENADAS['RUA D, 4'])
+
+    def test_endereco_alterado_sem_coordenadas_limpa_as_antigas(self):
+        self._importar(_csv(('1', 'RUA A, 1', '100.000,00')))
+        self.importador._obter_coordenadas.side_effect = lambda *args: (None, None)
+        self._importar(_csv(('1', 'RUA Z, 30', '100.000,00')))
+        self.assertIsNone(self._coordenadas('1'))
+
+    def test_removidos_levam_imagens_e_favoritos(self):
+        self._importar(_csv(('1', 'RUA A, 1', '100.000,00'), ('5', 'RUA E, 5', '100.000,00')))
+        removido, mantido = Propriedade.objects.get(codigo='5'), Propriedade.objects.get(codigo='1')
+        perfil = User.objects.create_user('comprador').perfilusuario
+        for imovel in (removido, mantido):
+            ImagemPropriedade.objects.create(propriedade=imovel, url=f'https://venda-imoveis.caixa.gov.br/{imovel.codigo}.jpg')
+            Favorito.objects.create(usuario=perfil, propriedade=imovel)
+
+        resultado = self._importar(_csv(('1', 'RUA A, 1', '100.000,00')))
+
+        self.assertEqual(resultado['removidos'], 1)
+        self.assertEqual(list(Propriedade.objects.values_list('codigo', flat=True)), ['1'])
+        self.assertEqual(list(ImagemPropriedade.objects.values_list('propriedade', flat=True)), [mantido.pk])
+        self.assertEqual(list(Favorito.objects.values_list('propriedade', flat=True)), [mantido.pk])
+
+    def test_imovel_sem_hash_registra_o_hash_sem_contar_como_alterado(self):
+        self._importar(_csv(('1', 'RUA A, 1', '100.000,00'), ('2', 'RUA B, 2', '100.000,00')))
+        # Imóveis gravados antes da coluna hash_conteudo existir
+        Propriedade.objects.update(hash_conteudo=None)
+        self.importador._obter_coordenadas.reset_mock()
+
+        resultado = self._importar(_csv(('1', 'RUA A, 1', '100.000,00'), ('2', 'RUA Z, 30', '100.000,00')))
+
+        # Só o de endereço alterado conta como alteração e entra no pré-carregamento
+        self.assertEqual((resultado['novos'], resultado['atualizados'], resultado['removidos']), (0, 1, 0))
+        self.assertEqual(resultado['codigos_imagens'], {'2'})
+        self.assertFalse(Propriedade.objects.filter(hash_conteudo__isnull=True).exists())
+        self.assertEqual(self._coordenadas('2'), COORDENADAS['RUA Z, 30'])
+
+        terceira = self._importar(_csv(('1', 'RUA A, 1', '100.000,00'), ('2', 'RUA Z, 30', '100.000,00')))
+        self.assertEqual((terceira['atualizados'], terceira['codigos_imagens']), (0, set()))
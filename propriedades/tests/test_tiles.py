@@ -0,0 +1,86 @@
+import os
+import json
+import logging
+from decimal import Decimal
+
+from propriedades import tiles
+from propriedades.geo import ZOOM_PONTOS_INDIVIDUAIS, calcular_quadkey, coordenadas_para_tile
+from propriedades.models import Propriedade
+from .utils import TestCaseImoveis, criar_imovel, usar_diretorio_temporario
+
+
+def _criar(codigo, latitude, longitude, **campos):
+    return criar_imovel(
+        codigo, latitude=Decimal(latitude), longitude=Decimal(longitude),
+        quadkey=calcular_quadkey(latitude, longitude), **campos
+    )
+
+
+class TilesTests(TestCaseImoveis):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.diretorio = usar_diretorio_temporario(self, 'TILES_CACHE_DIR')['TILES_CACHE_DIR']
+        tiles._cache_memoria.clear()
+        self.addCleanup(tiles._cache_memoria.clear)
+        self.sao_paulo = _criar('1', '-23.550520', '-46.633308', valor=Decimal('100000'))
+        _criar('2', '-23.551000', '-46.634000', valor=Decimal('80000'))
+        _criar('3', '-22.906847', '-43.172897', valor=Decimal('120000'))
+
+    def _tile(self, z, x, y):
+        return json.loads(tiles.obter_tile(z, x, y))['features']
+
+    def _tile_do_imovel(self, z):
+        x, y = coordenadas_para_tile(self.sao_paulo.latitude, self.sao_paulo.longitude, z)
+        return z, x, y
+
+    def test_zoom_baixo_agrega_em_clusters(self):
+        features = self._tile(0, 0, 0)
+
+        self.assertEqual(sum(feature['properties']['quantidade'] for feature in features), 3)
+        self.assertTrue(all('codigo' not in feature['properties'] for feature in features))
+        valores = {feature['properties']['quantidade']: feature['properties']['valor_min'] for feature in features}
+        self.assertEqual(valores, {2: 80000.0, 1: 120000.0})
+
+    def test_zoom_de_pontos_traz_os_imoveis(self):
+        features = self._tile(*self._tile_do_imovel(ZOOM_PONTOS_INDIVIDUAIS))
+        self.assertEqual(sorted(feature['properties']['codigo'] for feature in features), ['1', '2'])
+
+    def test_tile_vazio_nao_e_gravado(self):
+        self.assertEqual(tiles.obter_tile(3, 0, 0), tiles.TILE_VAZIO)
+        self.assertFalse(os.path.exists(tiles._caminho_tile(3, 0, 0)))
+
+    def test_invalidacao_remove_os_tiles_afetados(self):
+        z, x, y = self._tile_do_imovel(ZOOM_PONTOS_INDIVIDUAIS)
+        self._tile(z, x, y)
+        self._tile(0, 0, 0)
+        x_rio, y_rio = coordenadas_para_tile(Decimal('-22.906847'), Decimal('-43.172897'), z)
+        self._tile(z, x_rio, y_rio)
+        Propriedade.objects.filter(codigo='1').update(valor=Decimal('50000'))
+
+        # Sem invalidação o tile continua vindo do cache
+        self.assertEqual(self._tile(z, x, y)[0]['properties']['valor'], 100000.0)
+
+        tiles.invalidar_tiles({self.sao_paulo.quadkey})
+
+        self.assertEqual(
+            {f['properties']['codigo']: f['properties']['valor'] for f in self._tile(z, x, y)},
+            {'1': 50000.0, '2': 80000.0}
+        )
+        self.assertEqual(min(f['properties']['valor_min'] for f in self._tile(0, 0, 0)), 50000.0)
+        # Tile de outra região não é afetado
+        self.assertTrue(os.path.exists(tiles._caminho_tile(z, x_rio, y_rio)))
+
+    def test_limpeza_remove_os_tiles_mais_antigos(self):
+        caminhos = [tiles._caminho_tile(15, x, 0) for x in range(4)]
+        # Do mais antigo ao mais recente
+        for ordem, caminho in enumerate(caminhos):
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, 'wb') as f:
+                f.write(b'x' * 100)
+            os.utime(caminho, (1_000_000 + ordem, 1_000_000 + ordem))
+
+        self.assertEqual(tiles.limpar_tiles(tamanho_maximo=400), 0)
+        # 90% de 300 bytes: sobram 2 tiles
+        self.assertEqual(tiles.limpar_tiles(tamanho_maximo=300), 2)
+        self.assertEqual([os.path.exists(caminho) for caminho in caminhos], [False, False, True, True])
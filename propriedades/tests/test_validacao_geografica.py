@@ -0,0 +1,187 @@
+import os
+import json
+import logging
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from validacao_geografica import ValidadorGeografico
+
+# Municípios sintéticos: um quadrado, um "L" (não convexo) e um município em duas partes
+MUNICIPIOS = {
+    'type': 'FeatureCollection',
+    'features': [
+        {
+            'type': 'Feature',
+            'properties': {'name': 'SÃO PAULO', 'UF': 'SP'},
+            'geometry': {'type': 'Polygon', 'coordinates': [[[-47, -24], [-46, -24], [-46, -23], [-47, -23], [-47, -24]]]},
+        },
+        {
+            'type': 'Feature',
+            'properties': {'name': 'CAMPINAS', 'UF': 'SP'},
+            'geometry': {'type': 'Polygon', 'coordinates': [[
+                [-48, -23], [-47, -23], [-47, -22.5], [-47.5, -22.5], [-47.5, -22], [-48, -22], [-48, -23]
+            ]]},
+        },
+        {
+            'type': 'Feature',
+            'properties': {'name': 'RIO DE JANEIRO', 'UF': 'RJ'},
+            'geometry': {'type': 'MultiPolygon', 'coordinates': [
+                [[[-43.5, -23], [-43, -23], [-43, -22.5], [-43.5, -22.5], [-43.5, -23]]],
+                [[[-42.5, -23], [-42, -23], [-42, -22.5], [-42.5, -22.5], [-42.5, -23]]],
+            ]},
+        },
+    ],
+}
+
+
+class ValidadorTestCase(SimpleTestCase):
+    """Validador sobre o GeoJSON sintético, com o cache binário em um diretório temporário"""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.caminho_geojson = os.path.join(diretorio.name, 'municipios.geojson')
+        with open(self.caminho_geojson, 'w', encoding='utf-8') as f:
+            json.dump(MUNICIPIOS, f)
+
+    def _validador(self, **kwargs):
+        return ValidadorGeografico(caminho_geojson=self.caminho_geojson, **kwargs)
+
+
+class IndiceMunicipiosTests(ValidadorTestCase):
+    def test_nome_normalizado_encontra_o_municipio(self):
+        validador = self._validador()
+        self.assertEqual(validador._encontrar_municipio_similar('São Paulo', 'SP'), ('SÃO PAULO', 'SP'))
+        self.assertEqual(validador._encontrar_municipio_similar('sao paulo', 'SP'), ('SÃO PAULO', 'SP'))
+
+    def test_nome_aproximado_restrito_a_uf(self):
+        validador = self._validador()
+        self.assertEqual(validador._encontrar_municipio_similar('CAMPINA', 'SP'), ('CAMPINAS', 'SP'))
+        self.assertIsNone(validador._encontrar_municipio_similar('CAMPINAS', 'RJ'))
+        self.assertIsNone(validador._encontrar_municipio_similar('CAMPINAS', 'MG'))
+
+    def test_busca_memorizada(self):
+        validador = self._validador()
+        validador._encontrar_municipio_similar('CAMPINA', 'SP')
+        validador.indice_municipios['SP'].clear()
+        self.assertEqual(validador._encontrar_municipio_similar('CAMPINA', 'SP'), ('CAMPINAS', 'SP'))
+
+
+class IndiceEspacialTests(ValidadorTestCase):
+    def test_municipio_do_ponto(self):
+        validador = self._validador()
+        self.assertEqual(validador.municipio_do_ponto(-23.5, -46.5), ('SÃO PAULO', 'SP'))
+        self.assertEqual(validador.municipio_do_ponto(-22.2, -47.8), ('CAMPINAS', 'SP'))
+        # Segunda parte do município em duas partes
+        self.assertEqual(validador.municipio_do_ponto(-22.7, -42.2), ('RIO DE JANEIRO', 'RJ'))
+        # Recorte do "L": dentro do retângulo envolvente de Campinas, fora do polígono
+        self.assertIsNone(validador.municipio_do_ponto(-22.2, -47.2))
+        self.assertIsNone(validador.municipio_do_ponto(-10, -50))
+
+    def test_so_os_candidatos_tem_o_poligono_carregado(self):
+        validador = self._validador()
+        validador.municipio_do_ponto(-23.5, -46.5)
+        self.assertEqual(set(validador.cache_municipios), {('SÃO PAULO', 'SP')})
+
+    def test_coordenada_fora_do_municipio_e_substituida(self):
+        validador = self._validador(semente=1)
+        self.assertEqual(validador.validar_coordenadas(-23.5, -46.5, 'SAO PAULO', 'SP'), (-23.5, -46.5))
+
+        lat, lon = validador.validar_coordenadas(-22.7, -42.2, 'SAO PAULO', 'SP')
+        self.assertEqual(validador.municipio_do_ponto(lat, lon), ('SÃO PAULO', 'SP'))
+        self.assertEqual(validador.validar_coordenadas(-23.5, -46.5, 'INEXISTENTE', 'AC'), (None, None))
+
+
+class ValidacaoLoteTests(ValidadorTestCase):
+    def test_lote_igual_a_validacao_ponto_a_ponto(self):
+        validador = self._validador()
+        pontos = [
+            (-23.5, -46.5, 'SAO PAULO', 'SP'),       # dentro
+            (-22.2, -47.8, 'CAMPINAS', 'SP'),        # dentro
+            (-22.2, -47.2, 'CAMPINAS', 'SP'),        # no recorte do "L"
+            (-23.5, -46.5, 'CAMPINAS', 'SP'),        # em outro município
+            (-22.7, -42.2, 'RIO DE JANEIRO', 'RJ'),  # segunda parte
+            (-23.5, -46.5, 'INEXISTENTE', 'AC'),     # município desconhecido
+            (-23.9, -46.1, 'SAO PAULO', 'SP'),       # dentro
+        ]
+        lats, lons, cidades, ufs = zip(*pontos)
+
+        validos = validador.validar_lote(lats, lons, cidades, ufs)
+
+        self.assertEqual(validos.tolist(), [True, True, False, False, True, False, True])
+        for (lat, lon, cidade, uf), valido in zip(pontos, validos):
+            if municipio := validador._encontrar_municipio_similar(cidade, uf):
+                self.assertEqual(validador._ponto_dentro_poligono(lat, lon, validador._obter_poligono(municipio)), valido)
+
+    def test_lote_vazio(self):
+        self.assertEqual(self._validador().validar_lote([], [], [], []).tolist(), [])
+
+
+class CacheBinarioTests(ValidadorTestCase):
+    def test_cache_reaproveitado_sem_ler_o_geojson(self):
+        primeiro = self._validador()
+        self.assertTrue(os.path.exists(os.path.join(primeiro.caminho_cache, 'indice.json')))
+        self.assertEqual(sorted(os.listdir(primeiro.caminho_cache)), ['RJ.wkb', 'SP.wkb', 'indice.json'])
+
+        with mock.patch.object(ValidadorGeografico, '_carregar_geojson', side_effect=AssertionError('GeoJSON lido')):
+            segundo = self._validador()
+            self.assertEqual(segundo.municipio_do_ponto(-22.2, -47.8), ('CAMPINAS', 'SP'))
+            self.assertTrue(segundo._obter_poligono(('RIO DE JANEIRO', 'RJ')).equals(
+                primeiro._obter_poligono(('RIO DE JANEIRO', 'RJ'))
+            ))
+
+    def test_cache_recriado_quando_o_geojson_muda(self):
+        self._validador()
+        municipios = json.loads(json.dumps(MUNICIPIOS))
+        municipios['features'][0]['properties']['name'] = 'GUARULHOS'
+        with open(self.caminho_geojson, 'w', encoding='utf-8') as f:
+            json.dump(municipios, f, indent=1)
+
+        validador = self._validador()
+
+        self.assertEqual(validador.municipio_do_ponto(-23.5, -46.5), ('GUARULHOS', 'SP'))
+
+    def test_sem_permissao_de_escrita_usa_a_memoria(self):
+        # Um arquivo no lugar do diretório do cache faz a gravação falhar
+        caminho_cache = os.path.join(os.path.dirname(self.caminho_geojson), 'bloqueado')
+        open(caminho_cache, 'w').close()
+
+        validador = self._validador(caminho_cache=caminho_cache)
+
+        self.assertEqual(set(validador.geometrias_uf), {'SP', 'RJ'})
+        self.assertEqual(validador.validar_lote([-22.2], [-47.8], ['CAMPINAS'], ['SP']).tolist(), [True])
+
+
+class AmostragemTests(ValidadorTestCase):
+    def _pontos(self, validador, municipio, quantidade=200):
+        return [validador._gerar_ponto_aleatorio_no_municipio(municipio) for _ in range(quantidade)]
+
+    def test_mesma_semente_mesmos_pontos(self):
+        municipio = ('CAMPINAS', 'SP')
+        self.assertEqual(self._pontos(self._validador(semente=42), municipio), self._pontos(self._validador(semente=42), municipio))
+        self.assertNotEqual(self._pontos(self._validador(semente=42), municipio), self._pontos(self._validador(semente=7), municipio))
+
+    def test_pontos_dentro_do_municipio(self):
+        validador = self._validador(semente=3)
+        for municipio in [('CAMPINAS', 'SP'), ('RIO DE JANEIRO', 'RJ')]:
+            lats, lons = zip(*self._pontos(validador, municipio))
+            validos = validador.validar_lote(lats, lons, [municipio[0]] * len(lats), [municipio[1]] * len(lats))
+            self.assertTrue(validos.all(), municipio)
+
+    def test_pedacos_cobrem_o_poligono(self):
+        validador = self._validador()
+        for municipio in validador.entradas_municipios:
+            pedacos, areas_acumuladas = validador._obter_amostragem(municipio)
+            self.assertAlmostEqual(sum(pedaco.area for pedaco, _ in pedacos), validador._obter_poligono(municipio).area)
+            self.assertAlmostEqual(areas_acumuladas[-1], 1.0)
+
+    def test_amostragem_proporcional_a_area(self):
+        # As duas partes do Rio de Janeiro têm a mesma área
+        validador = self._validador(semente=5)
+        lons = [lon for _, lon in self._pontos(validador, ('RIO DE JANEIRO', 'RJ'), quantidade=2000)]
+        fracao_oeste = sum(lon < -42.75 for lon in lons) / len(lons)
+        self.assertAlmostEqual(fracao_oeste, 0.5, delta=0.05)
@@ -0,0 +1,67 @@
+import tempfile
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from propriedades.models import Propriedade
+
+
+def criar_colunas_sem_migracao():
+    """
+    Cria no banco de testes as colunas do modelo que não têm migração.
+    
+    analise_matricula e matricula_url existem no banco de produção, mas foram
+    criadas fora das migrações.
+    """
+    with connection.cursor() as cursor:
+        colunas = {coluna.name for coluna in connection.introspection.get_table_description(cursor, Propriedade._meta.db_table)}
+    with connection.schema_editor() as editor:
+        for campo in Propriedade._meta.local_fields:
+            if campo.column not in colunas:
+                editor.add_field(Propriedade, campo)
+
+
+class TestCaseImoveis(TestCase):
+    """TestCase com o esquema de Propriedade completo"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Alteração de esquema fora da transação que o TestCase abre para a classe
+        criar_colunas_sem_migracao()
+        super().setUpClass()
+
+
+def usar_diretorio_temporario(test_case, *nomes_settings):
+    """Aponta as settings informadas para diretórios temporários, removidos ao fim do teste"""
+    valores = {}
+    for nome in nomes_settings:
+        diretorio = tempfile.TemporaryDirectory()
+        test_case.addCleanup(diretorio.cleanup)
+        valores[nome] = diretorio.name
+    configuracao = override_settings(**valores)
+    configuracao.enable()
+    test_case.addCleanup(configuracao.disable)
+    return valores
+
+
+def criar_imovel(codigo, **campos):
+    """Cria um imóvel com valores padrão para os campos obrigatórios"""
+    dados = {
+        'tipo': 'Residencial',
+        'tipo_imovel': 'Casa',
+        'endereco': f'Rua {codigo}',
+        'bairro': 'Centro',
+        'cidade': 'SAO PAULO',
+        'estado': 'SP',
+        'valor': Decimal('100000'),
+        'valor_avaliacao': Decimal('200000'),
+        'desconto': Decimal('50'),
+        'descricao': 'Casa',
+        'area': Decimal('50'),
+        'quartos': 2,
+        'latitude': Decimal('-23.550520'),
+        'longitude': Decimal('-46.633308'),
+    }
+    dados.update(campos)
+    return Propriedade.objects.create(codigo=codigo, **dados)
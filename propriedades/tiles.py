@@ -0,0 +1,176 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .geo import NIVEL_QUADKEY, ZOOM_PONTOS_INDIVIDUAIS, tile_para_quadkey, quadkey_para_tile, limites_tile, agregar_por_quadkey
+from .models import Propriedade
+from .cache_disco import gravar_atomicamente, limpar_por_tamanho, ContadorGravacoes
+
+logger = logging.getLogger(__name__)
+
+# Tiles acima deste zoom (configurável, nunca acima do nível do quadkey) são gerados sob demanda, sem cache
+ZOOM_MAXIMO_CACHE = min(settings.TILES_ZOOM_MAXIMO_CACHE, NIVEL_QUADKEY)
+# GeoJSON de um tile sem imóveis: não é gravado em disco
+TILE_VAZIO = json.dumps({'type': 'FeatureCollection', 'features': []}, ensure_ascii=False).encode('utf-8')
+
+_cache_memoria = OrderedDict()  # (z, x, y) -> (mtime_ns do arquivo em disco, conteúdo)
+_lock_cache = threading.Lock()
+_gravacoes = ContadorGravacoes()
+
+
+def _caminho_tile(z, x, y):
+    return os.path.join(settings.TILES_CACHE_DIR, str(z), str(x), f'{y}.geojson')
+
+
+def renderizar_tile(z, x, y):
+    """
+    Gera o GeoJSON (bytes) com os imóveis cujas coordenadas caem no tile.
+    
+    Abaixo de ZOOM_PONTOS_INDIVIDUAIS um tile cobre regiões com milhares de imóveis:
+    em vez de um ponto por imóvel, cada feature é uma célula da grade de clusters
+    (quantidade, centróide, menor valor e maior desconto), como na API de clusters.
+    """
+    queryset = Propriedade.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    if z < ZOOM_PONTOS_INDIVIDUAIS:
+        features = [
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [float(cluster['lon_media']), float(cluster['lat_media'])]},
+                'properties': {
+                    'quadkey': cluster['celula'],
+                    'quantidade': cluster['quantidade'],
+                    'valor_min': float(cluster['valor_min']),
+                    'desconto_max': float(cluster['desconto_max']) if cluster['desconto_max'] is not None else None,
+                },
+            }
+            for cluster in agregar_por_quadkey(queryset.filter(quadkey__startswith=tile_para_quadkey(x, y, z)), z)
+        ]
+        return json.dumps({'type': 'FeatureCollection', 'features': features}, ensure_ascii=False).encode('utf-8')
+    
+    if z <= NIVEL_QUADKEY:
+        queryset = queryset.filter(quadkey__startswith=tile_para_quadkey(x, y, z))
+    else:
+        min_lon, min_lat, max_lon, max_lat = limites_tile(x, y, z)
+        queryset = queryset.filter(
+            latitude__gte=min_lat, latitude__lte=max_lat,
+            longitude__gte=min_lon, longitude__lte=max_lon
+        )
+    
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [float(longitude), float(latitude)]},
+            'properties': {
+                'codigo': codigo,
+                'tipo_imovel': tipo_imovel,
+                'valor': float(valor),
+                'desconto': float(desconto) if desconto is not None else None,
+            },
+        }
+        for codigo, tipo_imovel, latitude, longitude, valor, desconto in queryset.order_by('id').values_list(
+            'codigo', 'tipo_imovel', 'latitude', 'longitude', 'valor', 'desconto'
+        )
+    ]
+    return json.dumps({'type': 'FeatureCollection', 'features': features}, ensure_ascii=False).encode('utf-8')
+
+
+def _guardar_em_memoria(chave, mtime, conteudo):
+    with _lock_cache:
+        _cache_memoria[chave] = (mtime, conteudo)
+        _cache_memoria.move_to_end(chave)
+        while len(_cache_memoria) > settings.TILES_CACHE_MEMORIA:
+            _cache_memoria.popitem(last=False)
+
+
+def obter_tile(z, x, y):
+    """
+    Retorna o GeoJSON do tile, usando o cache em memória (LRU) e em disco.
+    
+    O arquivo em disco é a fonte da verdade: a entrada em memória só é usada se o
+    arquivo ainda existir com a mesma data de modificação, então a invalidação feita
+    pelo importador (outro processo) vale para todos os workers. Tiles vazios não
+    são gravados, então coordenadas arbitrárias não enchem o disco; o tamanho total
+    é limitado por settings.TILES_CACHE_TAMANHO_MAXIMO.
+    """
+    if z > ZOOM_MAXIMO_CACHE:
+        return renderizar_tile(z, x, y)
+    
+    chave = (z, x, y)
+    caminho = _caminho_tile(z, x, y)
+    try:
+        mtime = os.stat(caminho).st_mtime_ns
+    except OSError:
+        mtime = None
+    
+    if mtime is not None:
+        with _lock_cache:
+            em_memoria = _cache_memoria.get(chave)
+            if em_memoria and em_memoria[0] == mtime:
+                _cache_memoria.move_to_end(chave)
+                return em_memoria[1]
+        try:
+            with open(caminho, 'rb') as f:
+                conteudo = f.read()
+            _guardar_em_memoria(chave, mtime, conteudo)
+            return conteudo
+        except OSError:
+            pass  # Invalidado entre o stat e a leitura
+    
+    conteudo = renderizar_tile(z, x, y)
+    if conteudo == TILE_VAZIO:
+        return conteudo
+    try:
+        gravar_atomicamente(caminho, conteudo)
+        _guardar_em_memoria(chave, os.stat(caminho).st_mtime_ns, conteudo)
+    except OSError as e:
+        logger.warning(f"Não foi possível gravar o tile {z}/{x}/{y} em disco: {str(e)}")
+        return conteudo
+    
+    if _gravacoes.registrar(len(conteudo), settings.TILES_CACHE_TAMANHO_MAXIMO):
+        limpar_tiles()
+    return conteudo
+
+
+def limpar_tiles(tamanho_maximo=None):
+    """
+    Remove os tiles gravados há mais tempo até o cache em disco ficar abaixo de 90% do tamanho máximo.
+    
+    Returns:
+        int: número de tiles removidos
+    """
+    tamanho_maximo = settings.TILES_CACHE_TAMANHO_MAXIMO if tamanho_maximo is None else tamanho_maximo
+    removidos, restantes = limpar_por_tamanho(settings.TILES_CACHE_DIR, '.geojson', tamanho_maximo)
+    if removidos:
+        logger.info(f"{removidos} tiles removidos do cache em disco ({restantes / 1024 / 1024:.1f} MB restantes)")
+    return removidos
+
+
+def invalidar_tiles(quadkeys):
+    """
+    Remove do cache em disco todos os tiles que contêm alguma das células informadas.
+    
+    Cada quadkey afeta um tile por nível de zoom (os seus prefixos).
+    
+    Returns:
+        int: número de arquivos removidos
+    """
+    # Todos os níveis até o do quadkey: o zoom máximo em cache pode ter sido maior em outra configuração
+    prefixos = {quadkey[:z] for quadkey in quadkeys if quadkey for z in range(NIVEL_QUADKEY + 1)}
+    removidos = 0
+    for prefixo in prefixos:
+        try:
+            os.remove(_caminho_tile(*_tile_do_prefixo(prefixo)))
+            removidos += 1
+        except FileNotFoundError:
+            continue
+    logger.info(f"{removidos} tiles invalidados no cache ({len(prefixos)} tiles afetados)")
+    return removidos
+
+
+def _tile_do_prefixo(prefixo):
+    x, y, z = quadkey_para_tile(prefixo)
+    return z, x, y
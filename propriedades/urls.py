@@ -6,9 +6,12 @@ urlpatterns = [
     path('', RedirectView.as_view(url='mapa/', permanent=True), name='index'),
     path('mapa/', views.mapa_view, name='mapa'),
     path('api/propriedades/', views.propriedades_api, name='propriedades_api'),
+    path('api/propriedades/clusters/', views.clusters_api, name='clusters_api'),
     path('api/propriedades/<str:codigo>/', views.get_propriedade, name='get_propriedade'),
+    path('api/tiles/<int:z>/<int:x>/<int:y>', views.tile_api, name='tile_api'),
     path('api/cidades/<str:estado>/', views.cidades_api, name='cidades_api'),
     path('api/bairros/<str:cidade>/', views.bairros_api, name='bairros_api'),
+    path('api/facetas/', views.facetas_api, name='facetas_api'),
     path('api/analisar-matricula/', views.analisar_matricula, name='analisar_matricula'),
     path('api/proxy-imagem/', views.proxy_imagem, name='proxy_imagem'),
     path('favoritos/', views.favoritos_view, name='favoritos'),
@@ -1,38 +1,75 @@
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, FileResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from .models import Propriedade
+from .geo import ZOOM_PONTOS_INDIVIDUAIS, agregar_por_quadkey
+from .tiles import obter_tile
+from .formatos import FORMATOS, serializar_colunar, serializar_binario
+from .cache_respostas import cachear_resposta, incrementar_geracao, resposta_condicional
+from .facetas import obter_facetas, obter_facetas_json, cidades_do_estado, bairros_da_cidade
+from .cliente_caixa import sessao_caixa, buscar_imagem, agendar_nova_tentativa, url_permitida, ImagemNaoEncontrada
+from .imagens import LARGURAS_VARIANTES, obter_variante
 from django.db.models import Q
 import requests
 import json
+import math
 from django.conf import settings
 import os
 import uuid
 from datetime import datetime
-import time
+import logging
 from django.contrib.auth.decorators import login_required
 from django.http import Http404
-import random
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
 def mapa_view(request):
     """View para renderizar a página do mapa"""
-    # Obter lista de estados únicos
-    estados = Propriedade.objects.values_list('estado', flat=True).distinct().order_by('estado')
-    
-    # Obter tipos de imóveis únicos
-    tipos_imovel = Propriedade.objects.values_list('tipo_imovel', flat=True).distinct().order_by('tipo_imovel')
+    # Estados e tipos de imóveis vêm das facetas em memória (sem DISTINCT na tabela)
+    facetas = obter_facetas()
+    estados = [estado['estado'] for estado in facetas['estados']]
+    tipos_imovel = [tipo['tipo_imovel'] for tipo in facetas['tipos_imovel']]
     
     context = {
         'estados': estados,
         'tipos_imovel': tipos_imovel,
+        'zoom_pontos_individuais': ZOOM_PONTOS_INDIVIDUAIS,
     }
     return render(request, 'propriedades/mapa.html', context)
 
-def propriedades_api(request):
-    """API para retornar imóveis filtrados"""
+# Paginação da API de propriedades (os clientes seguem o cursor até o fim)
+LIMITE_PADRAO_PROPRIEDADES = 2000
+LIMITE_MAXIMO_PROPRIEDADES = 10000
+
+# Campos que podem ser pedidos via fields= (API de lista e de detalhe)
+CAMPOS_PROPRIEDADE = (
+    'codigo', 'tipo_imovel', 'endereco', 'bairro', 'cidade', 'estado',
+    'valor', 'valor_avaliacao', 'area', 'quartos', 'latitude', 'longitude', 'link',
+    'imagem_url', 'imagem_cloudinary_url', 'imagem_disponivel', 'desconto', 'matricula_url', 'analise_matricula'
+)
+# O mapa só precisa da posição e do ícone; o restante vem do detalhe ao abrir o popup
+CAMPOS_PADRAO_LISTA = ('codigo', 'latitude', 'longitude', 'tipo_imovel')
+
+# Linhas lidas do banco (e enviadas ao cliente) por vez no modo stream=1
+TAMANHO_BLOCO_STREAMING = 2000
+
+def _ler_campos(valor, padrao):
+    """Converte fields=a,b,c em uma lista de campos permitidos (ValueError se desconhecido)"""
+    if not valor:
+        return list(padrao)
+    campos = list(dict.fromkeys(campo.strip() for campo in valor.split(',') if campo.strip()))
+    desconhecidos = [campo for campo in campos if campo not in CAMPOS_PROPRIEDADE]
+    if desconhecidos or not campos:
+        raise ValueError(f"Campos inválidos: {', '.join(desconhecidos)}")
+    return campos
+
+def _filtrar_propriedades(params):
+    """Aplica os filtros da query string ao queryset de imóveis com coordenadas"""
     # Iniciar queryset apenas com imóveis que têm coordenadas
     queryset = Propriedade.objects.filter(
         latitude__isnull=False,
@@ -40,29 +77,29 @@ def propriedades_api(request):
     )
     
     # Aplicar filtros
-    if estado := request.GET.get('estado'):
+    if estado := params.get('estado'):
         estados = estado.split(',')
         queryset = queryset.filter(estado__in=estados)
         
-    if cidade := request.GET.get('cidade'):
+    if cidade := params.get('cidade'):
         cidades = cidade.split(',')
         queryset = queryset.filter(cidade__in=cidades)
         
-    if bairro := request.GET.get('bairro'):
+    if bairro := params.get('bairro'):
         bairros = bairro.split(',')
         queryset = queryset.filter(bairro__in=bairros)
         
-    if tipo_imovel := request.GET.get('tipo_imovel'):
+    if tipo_imovel := params.get('tipo_imovel'):
         tipos = tipo_imovel.split(',')
         queryset = queryset.filter(tipo_imovel__in=tipos)
         
-    if valor_max := request.GET.get('valor_max'):
+    if valor_max := params.get('valor_max'):
         queryset = queryset.filter(valor__lte=valor_max)
         
-    if desconto_min := request.GET.get('desconto_min'):
+    if desconto_min := params.get('desconto_min'):
         queryset = queryset.filter(desconto__gte=desconto_min)
         
-    if quartos := request.GET.get('quartos'):
+    if quartos := params.get('quartos'):
         quartos_list = quartos.split(',')
         if quartos_list:
             quartos_q = Q()
@@ -70,37 +107,199 @@ def propriedades_api(request):
                 quartos_q |= Q(quartos__gte=q)
             queryset = queryset.filter(quartos_q)
 
-    if codigo := request.GET.get('codigo'):
+    if codigo := params.get('codigo'):
         queryset = queryset.filter(codigo=codigo)
     
+    return queryset
+
+def _ler_bbox(valor):
+    """Converte 'minLon,minLat,maxLon,maxLat' em uma tupla de floats (ValueError se inválido)"""
+    partes = [float(v) for v in valor.split(',')]
+    if len(partes) != 4:
+        raise ValueError('bbox deve ter 4 valores')
+    if not all(math.isfinite(v) for v in partes):
+        raise ValueError('bbox com valores não finitos')
+    min_lon, min_lat, max_lon, max_lat = partes
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180 and -90 <= min_lat <= 90 and -90 <= max_lat <= 90):
+        raise ValueError('bbox fora dos limites de latitude e longitude')
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError('bbox com limites invertidos')
+    return min_lon, min_lat, max_lon, max_lat
+
+def _filtrar_bbox(queryset, bbox):
+    """Restringe o queryset aos imóveis dentro do retângulo (minLon, minLat, maxLon, maxLat)"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return queryset.filter(
+        latitude__gte=min_lat, latitude__lte=max_lat,
+        longitude__gte=min_lon, longitude__lte=max_lon
+    )
+
+def _gerar_json_streaming(queryset, campos, total):
+    """Gera o JSON da API de propriedades em blocos, lendo o banco com um cursor no servidor"""
+    yield f'{{"total": {total}, "proximo_cursor": null, "propriedades": ['.encode('utf-8')
+    
+    separador = ''
+    bloco = []
+    for linha in queryset.values_list(*campos).iterator(chunk_size=TAMANHO_BLOCO_STREAMING):
+        bloco.append(json.dumps(dict(zip(campos, linha)), cls=DjangoJSONEncoder))
+        if len(bloco) >= TAMANHO_BLOCO_STREAMING:
+            yield (separador + ', '.join(bloco)).encode('utf-8')
+            separador = ', '
+            bloco = []
+    if bloco:
+        yield (separador + ', '.join(bloco)).encode('utf-8')
+    
+    yield b']}'
+
+@resposta_condicional
+@cachear_resposta('propriedades')
+def propriedades_api(request):
+    """
+    API para retornar imóveis filtrados.
+    
+    Além dos filtros, aceita bbox=minLon,minLat,maxLon,maxLat (área visível do mapa),
+    limit e cursor (paginação por id) e fields=campo1,campo2 (padrão: apenas os
+    campos usados para desenhar os marcadores). A resposta traz o total de imóveis
+    que atendem aos filtros e o cursor da próxima página (null na última).
+    
+    format=columnar devolve um array por campo e format=binary um buffer com
+    typed arrays (ver propriedades.formatos), ambos menores que a lista de objetos.
+    
+    stream=1 ignora limit e envia todos os imóveis a partir do cursor em um único
+    JSON gerado aos poucos, com memória constante no worker (exportações grandes).
+    """
+    queryset = _filtrar_propriedades(request.GET)
+    
+    try:
+        campos = _ler_campos(request.GET.get('fields'), CAMPOS_PADRAO_LISTA)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    formato = request.GET.get('format', 'json')
+    if formato not in FORMATOS:
+        return JsonResponse({'error': f"format deve ser um de: {', '.join(FORMATOS)}"}, status=400)
+    
+    if bbox := request.GET.get('bbox'):
+        try:
+            queryset = _filtrar_bbox(queryset, _ler_bbox(bbox))
+        except ValueError:
+            return JsonResponse({'error': 'bbox inválido, use minLon,minLat,maxLon,maxLat'}, status=400)
+    
+    try:
+        limite = min(int(request.GET.get('limit', LIMITE_PADRAO_PROPRIEDADES)), LIMITE_MAXIMO_PROPRIEDADES)
+        cursor = int(request.GET.get('cursor', 0))
+    except ValueError:
+        return JsonResponse({'error': 'limit e cursor devem ser números inteiros'}, status=400)
+    if limite < 1:
+        return JsonResponse({'error': 'limit deve ser maior que zero'}, status=400)
+    
+    total = queryset.count()
+    
+    if request.GET.get('stream') in ('1', 'true'):
+        if formato != 'json':
+            return JsonResponse({'error': 'stream=1 só está disponível com format=json'}, status=400)
+        return StreamingHttpResponse(
+            _gerar_json_streaming(queryset.filter(id__gt=cursor).order_by('id'), campos, total),
+            content_type='application/json'
+        )
+    
     # Converter queryset para lista de dicionários
-    propriedades = list(queryset.values(
-        'codigo', 'tipo_imovel', 'endereco', 'bairro', 'cidade', 'estado',
-        'valor', 'valor_avaliacao', 'area', 'quartos', 'latitude', 'longitude', 'link',
-        'imagem_url', 'desconto', 'matricula_url', 'analise_matricula'
-    ))
+    linhas = list(queryset.filter(id__gt=cursor).order_by('id').values_list('id', *campos)[:limite])
+    
+    proximo_cursor = linhas[-1][0] if len(linhas) == limite else None
+    linhas = [linha[1:] for linha in linhas]
+    
+    if formato == 'columnar':
+        return HttpResponse(
+            serializar_colunar(linhas, campos, total=total, proximo_cursor=proximo_cursor),
+            content_type='application/json'
+        )
+    if formato == 'binary':
+        return HttpResponse(
+            serializar_binario(linhas, campos, total=total, proximo_cursor=proximo_cursor),
+            content_type='application/octet-stream'
+        )
+    
+    pagina = [dict(zip(campos, linha)) for linha in linhas]
+    return JsonResponse({
+        'total': total,
+        'proximo_cursor': proximo_cursor,
+        'propriedades': pagina,
+    })
+
+@resposta_condicional
+@cachear_resposta('clusters')
+def clusters_api(request):
+    """
+    API com os imóveis filtrados agregados em clusters para o zoom do mapa.
+    
+    Abaixo de ZOOM_PONTOS_INDIVIDUAIS agrupa os imóveis pelo prefixo do quadkey
+    (grade hierárquica) e retorna quantidade, centróide, menor valor e maior
+    desconto de cada célula; a partir dele retorna os imóveis individuais.
+    """
+    try:
+        zoom = int(request.GET.get('zoom', 4))
+    except ValueError:
+        return JsonResponse({'error': 'zoom deve ser um número inteiro'}, status=400)
+    
+    queryset = _filtrar_propriedades(request.GET)
+    if bbox := request.GET.get('bbox'):
+        try:
+            queryset = _filtrar_bbox(queryset, _ler_bbox(bbox))
+        except ValueError:
+            return JsonResponse({'error': 'bbox inválido, use minLon,minLat,maxLon,maxLat'}, status=400)
+    
+    if zoom >= ZOOM_PONTOS_INDIVIDUAIS:
+        # Um registro além do limite indica se a lista foi cortada; só então contar o total real
+        pontos = list(queryset.order_by('id').values(
+            'codigo', 'tipo_imovel', 'latitude', 'longitude', 'valor', 'desconto'
+        )[:LIMITE_MAXIMO_PROPRIEDADES + 1])
+        truncado = len(pontos) > LIMITE_MAXIMO_PROPRIEDADES
+        total = queryset.count() if truncado else len(pontos)
+        return JsonResponse({
+            'modo': 'pontos',
+            'zoom': zoom,
+            'total': total,
+            'truncado': truncado,
+            'pontos': pontos[:LIMITE_MAXIMO_PROPRIEDADES],
+        })
+    
+    clusters = agregar_por_quadkey(queryset, zoom)
     
-    return JsonResponse(propriedades, safe=False)
+    return JsonResponse({
+        'modo': 'clusters',
+        'zoom': zoom,
+        'total': sum(cluster['quantidade'] for cluster in clusters),
+        'clusters': clusters,
+    })
 
+@require_http_methods(["GET"])
+def tile_api(request, z, x, y):
+    """API de tiles (slippy map) com os imóveis em GeoJSON, cacheáveis por navegador e CDN"""
+    if z > 22 or x >= (1 << z) or y >= (1 << z):
+        return JsonResponse({'error': 'Tile inválido'}, status=400)
+    
+    return HttpResponse(
+        obter_tile(z, x, y),
+        content_type='application/geo+json',
+        headers={'Cache-Control': 'public, max-age=300'}
+    )
+
+@resposta_condicional
 def cidades_api(request, estado):
     """API para retornar cidades de um estado"""
-    cidades = Propriedade.objects.filter(
-        estado=estado,
-        latitude__isnull=False,
-        longitude__isnull=False
-    ).values_list('cidade', flat=True).distinct().order_by('cidade')
-    
-    return JsonResponse(list(cidades), safe=False)
+    return JsonResponse(cidades_do_estado(estado), safe=False)
 
+@resposta_condicional
 def bairros_api(request, cidade):
     """API para retornar bairros de uma cidade"""
-    bairros = Propriedade.objects.filter(
-        cidade=cidade,
-        latitude__isnull=False,
-        longitude__isnull=False
-    ).values_list('bairro', flat=True).distinct().order_by('bairro')
-    
-    return JsonResponse(list(bairros), safe=False)
+    return JsonResponse(bairros_da_cidade(cidade), safe=False)
+
+@require_http_methods(["GET"])
+@resposta_condicional
+def facetas_api(request):
+    """API com a hierarquia estado -> cidade -> bairro e os tipos de imóvel, com contagens"""
+    return HttpResponse(obter_facetas_json(), content_type='application/json')
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -190,6 +389,7 @@ def analisar_matricula(request):
                 # Salvar a análise no banco de dados
                 propriedade.analise_matricula = analise
                 propriedade.save()
+                incrementar_geracao()
                 
                 return JsonResponse({'success': True, 'analise': analise})
             else:
@@ -205,133 +405,70 @@ def analisar_matricula(request):
         return JsonResponse({'error': f'Erro interno do servidor: {str(e)}'}, status=500)
 
 @require_http_methods(["GET"])
+@resposta_condicional
 def get_propriedade(request, codigo):
+    """API de detalhe de um imóvel; aceita fields= para trazer só parte dos campos"""
     try:
-        propriedade = Propriedade.objects.get(codigo=codigo)
-        return JsonResponse({
-            'codigo': propriedade.codigo,
-            'analise_matricula': propriedade.analise_matricula
-        })
+        campos = _ler_campos(request.GET.get('fields'), CAMPOS_PROPRIEDADE)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    try:
+        return JsonResponse(Propriedade.objects.values(*campos).get(codigo=codigo))
     except Propriedade.DoesNotExist:
         return JsonResponse({'error': 'Propriedade não encontrada'}, status=404)
 
+def _resposta_imagem_cacheada(caminho, metadados):
+    response = FileResponse(open(caminho, 'rb'), content_type=metadados['content_type'])
+    response['Cache-Control'] = 'public, max-age=31536000'
+    return response
+
+def _imagem_padrao():
+    with open('propriedades/static/img/no-image.jpg', 'rb') as f:
+        return HttpResponse(f.read(), content_type='image/jpeg')
+
 @require_http_methods(["GET"])
 def proxy_imagem(request):
-    """View para servir como proxy de imagens do site da Caixa"""
+    """
+    View para servir como proxy de imagens do site da Caixa.
+    
+    Com w=320 ou w=800 devolve uma versão reduzida, em WebP quando o navegador
+    aceita (JPEG caso contrário), gerada uma única vez e guardada no cache.
+    """
     url = request.GET.get('url')
     if not url:
         return HttpResponse(status=400)
-        
+    if not url_permitida(url):
+        return JsonResponse({'error': 'url deve apontar para venda-imoveis.caixa.gov.br'}, status=400)
+    
+    largura = request.GET.get('w')
+    if largura is not None:
+        if not largura.isdigit() or int(largura) not in LARGURAS_VARIANTES:
+            return JsonResponse({'error': f"w deve ser um de: {', '.join(map(str, LARGURAS_VARIANTES))}"}, status=400)
+        largura = int(largura)
+    
     try:
-        # Lista de User-Agents para rotação
-        user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Edge/122.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) Gecko/20100101 Firefox/123.0',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
-        ]
-        
-        # Escolher um User-Agent aleatório
-        user_agent = random.choice(user_agents)
+        # Cache em disco primeiro; na falta, uma única busca na Caixa por URL, compartilhada
+        # pelas requisições simultâneas
+        caminho, metadados = buscar_imagem(url)
+        if largura is None:
+            return _resposta_imagem_cacheada(caminho, metadados)
         
-        # Headers mais completos para simular um navegador real
-        headers = {
-            'User-Agent': user_agent,
-            'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
-            'Accept-Language': 'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Referer': 'https://venda-imoveis.caixa.gov.br/',
-            'Origin': 'https://venda-imoveis.caixa.gov.br',
-            'Host': 'venda-imoveis.caixa.gov.br',
-            'Sec-Fetch-Dest': 'image',
-            'Sec-Fetch-Mode': 'no-cors',
-            'Sec-Fetch-Site': 'same-origin',
-            'Pragma': 'no-cache',
-            'Cache-Control': 'no-cache',
-            'DNT': '1',  # Do Not Track
-            'Sec-Ch-Ua': '"Chromium";v="122", "Not(A:Brand";v="24", "Google Chrome";v="122"',
-            'Sec-Ch-Ua-Mobile': '?0',
-            'Sec-Ch-Ua-Platform': '"Windows"',
-            'Upgrade-Insecure-Requests': '1',
-        }
-
-        # Primeira tentativa
-        try:
-            # Criar uma sessão para manter cookies
-            session = requests.Session()
-            
-            # Primeiro acessar a página principal para pegar cookies
-            session.get(
-                'https://venda-imoveis.caixa.gov.br/',
-                headers=headers,
-                verify=False,
-                timeout=15
-            )
-            
-            # Agora buscar a imagem
-            response = session.get(
-                url,
-                headers=headers,
-                verify=False,
-                stream=True,
-                timeout=15
-            )
-            response.raise_for_status()
-            
-            # Se conseguiu obter a imagem, retornar com cache
-            response_headers = {
-                'Cache-Control': 'public, max-age=31536000',
-            }
-            return HttpResponse(
-                response.content,
-                content_type=response.headers.get('content-type', 'image/jpeg'),
-                headers=response_headers
-            )
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Erro ao buscar imagem: {e}")
-            # Em caso de erro, tentar uma segunda vez com delay e outro User-Agent
-            time.sleep(2)
-            try:
-                # Usar outro User-Agent na segunda tentativa
-                headers['User-Agent'] = random.choice([ua for ua in user_agents if ua != headers['User-Agent']])
-                
-                session = requests.Session()
-                session.get(
-                    'https://venda-imoveis.caixa.gov.br/',
-                    headers=headers,
-                    verify=False,
-                    timeout=15
-                )
-                
-                response = session.get(
-                    url,
-                    headers=headers,
-                    verify=False,
-                    stream=True,
-                    timeout=15
-                )
-                response.raise_for_status()
-                
-                response_headers = {
-                    'Cache-Control': 'public, max-age=31536000',
-                }
-                return HttpResponse(
-                    response.content,
-                    content_type=response.headers.get('content-type', 'image/jpeg'),
-                    headers=response_headers
-                )
-            except:
-                # Se falhar novamente, retornar a imagem padrão
-                with open('propriedades/static/img/no-image.jpg', 'rb') as f:
-                    return HttpResponse(f.read(), content_type='image/jpeg')
-                    
+        formato = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+        response = _resposta_imagem_cacheada(*obter_variante(url, largura, formato, caminho, metadados))
+        patch_vary_headers(response, ['Accept'])
+        return response
+    except ImagemNaoEncontrada:
+        logger.debug(f"Imagem não encontrada na Caixa: {url}")
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Erro ao buscar imagem {url}: {str(e)}")
+        # A nova tentativa roda em segundo plano e deixa a imagem no cache para a próxima visita
+        agendar_nova_tentativa(url, sessao_caixa.sessao.headers.get('User-Agent'))
     except Exception as e:
-        print(f"Erro ao buscar imagem: {e}")
-        # Em caso de erro, retornar a imagem padrão
-        with open('propriedades/static/img/no-image.jpg', 'rb') as f:
-            return HttpResponse(f.read(), content_type='image/jpeg')
+        logger.error(f"Erro ao buscar imagem {url}: {str(e)}")
+    
+    # Em caso de erro, retornar a imagem padrão
+    return _imagem_padrao()
 
 @login_required
 def favoritos_view(request):
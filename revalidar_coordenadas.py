@@ -11,6 +11,9 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'imoveis_caixa.settings')
 django.setup()
 
 from propriedades.models import Propriedade
+from propriedades.geo import reconstruir_indice_quadkey
+from propriedades.tiles import invalidar_tiles
+from propriedades.cache_respostas import incrementar_geracao
 
 # Configuração de logging
 logging.basicConfig(
@@ -24,10 +27,15 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class RevalidadorCoordenadas:
-    def __init__(self):
-        """Inicializa o revalidador com o validador geográfico e importador."""
-        self.validador = ValidadorGeografico()
-        self.importador = ImportadorCaixa()
+    def __init__(self, semente=None):
+        """
+        Inicializa o revalidador com o validador geográfico e importador.
+        
+        Args:
+            semente (int): Semente dos pontos aleatórios; com a mesma semente a revalidação é reproduzível
+        """
+        self.validador = ValidadorGeografico(semente=semente)
+        self.importador = ImportadorCaixa(validador_geografico=self.validador)
         logger.info("Revalidador de Coordenadas inicializado")
 
     def validar_coordenadas_existentes(self):
@@ -41,9 +49,6 @@ class RevalidadorCoordenadas:
             longitude__isnull=True
         )
         
-        total_imoveis = imoveis_com_coordenadas.count()
-        logger.info(f"Total de imóveis com coordenadas: {total_imoveis}")
-        
         total = {
             'validos': 0,
             'invalidos': 0,
@@ -51,15 +56,36 @@ class RevalidadorCoordenadas:
             'atualizados_aleatorio': 0,
             'erros': 0
         }
+        total_imoveis = 0
         
         try:
-            for imovel in imoveis_com_coordenadas:
+            # Validar todas as coordenadas de uma vez, agrupadas por município
+            pks, lats, lons, cidades, ufs = [], [], [], [], []
+            for pk, latitude, longitude, cidade, estado in imoveis_com_coordenadas.values_list(
+                'pk', 'latitude', 'longitude', 'cidade', 'estado'
+            ).iterator(chunk_size=5000):
+                pks.append(pk)
+                lats.append(float(latitude))
+                lons.append(float(longitude))
+                cidades.append(cidade)
+                ufs.append(estado)
+            
+            total_imoveis = len(pks)
+            logger.info(f"Total de imóveis com coordenadas: {total_imoveis}")
+            
+            validos = self.validador.validar_lote(lats, lons, cidades, ufs)
+            total['validos'] = int(validos.sum())
+            pks_invalidos = [pk for pk, valido in zip(pks, validos) if not valido]
+            logger.info(f"Validação em lote concluída: {total['validos']} válidos, {len(pks_invalidos)} inválidos")
+            
+            # Apenas os imóveis inválidos passam pela correção individual
+            for imovel in Propriedade.objects.filter(pk__in=pks_invalidos).order_by('pk').iterator(chunk_size=1000):
                 try:
                     # Converter coordenadas para float
                     lat = float(imovel.latitude)
                     lon = float(imovel.longitude)
                     
-                    # Validar se as coordenadas estão dentro do município
+                    # Gerar coordenadas válidas dentro do município (usadas se a API falhar)
                     lat_validada, lon_validada = self.validador.validar_coordenadas(
                         lat=lat,
                         lon=lon,
@@ -67,54 +93,50 @@ class RevalidadorCoordenadas:
                         uf=imovel.estado
                     )
                     
-                    # Se as coordenadas mudaram, são inválidas
-                    if lat != lat_validada or lon != lon_validada:
-                        logger.info(f"\nImóvel {imovel.codigo} em {imovel.cidade}/{imovel.estado}")
-                        logger.info(f"Coordenadas atuais: {lat}, {lon}")
-                        
-                        # Tentar obter novas coordenadas da API
-                        lat_api, lon_api = self.importador._obter_coordenadas(
-                            endereco=imovel.endereco,
+                    logger.info(f"\nImóvel {imovel.codigo} em {imovel.cidade}/{imovel.estado}")
+                    logger.info(f"Coordenadas atuais: {lat}, {lon}")
+                    
+                    # Tentar obter novas coordenadas da API, com a mesma consulta (e chave de cache) da importação
+                    lat_api, lon_api = self.importador._obter_coordenadas(
+                        endereco=self.importador._endereco_geocodificacao(imovel.endereco, imovel.cidade, imovel.estado),
+                        cidade=imovel.cidade,
+                        estado=imovel.estado
+                    )
+                    
+                    if lat_api and lon_api:
+                        # Validar coordenadas da API
+                        lat_validada, lon_validada = self.validador.validar_coordenadas(
+                            lat=lat_api,
+                            lon=lon_api,
                             cidade=imovel.cidade,
-                            estado=imovel.estado
+                            uf=imovel.estado
                         )
                         
-                        if lat_api and lon_api:
-                            # Validar coordenadas da API
-                            lat_validada, lon_validada = self.validador.validar_coordenadas(
-                                lat=lat_api,
-                                lon=lon_api,
-                                cidade=imovel.cidade,
-                                uf=imovel.estado
-                            )
-                            
-                            if lat_api == lat_validada and lon_api == lon_validada:
-                                # Coordenadas da API são válidas
-                                logger.info(f"Coordenadas da API válidas: {lat_api}, {lon_api}")
-                                imovel.latitude = Decimal(str(lat_api))
-                                imovel.longitude = Decimal(str(lon_api))
-                                total['atualizados_api'] += 1
-                            else:
-                                # Coordenadas da API são inválidas, usar coordenadas aleatórias
-                                logger.info(f"Coordenadas da API inválidas, usando aleatórias: {lat_validada}, {lon_validada}")
-                                imovel.latitude = Decimal(str(lat_validada))
-                                imovel.longitude = Decimal(str(lon_validada))
-                                total['atualizados_aleatorio'] += 1
+                        if lat_api == lat_validada and lon_api == lon_validada:
+                            # Coordenadas da API são válidas
+                            logger.info(f"Coordenadas da API válidas: {lat_api}, {lon_api}")
+                            imovel.latitude = Decimal(str(lat_api))
+                            imovel.longitude = Decimal(str(lon_api))
+                            total['atualizados_api'] += 1
                         else:
-                            # API falhou, usar coordenadas aleatórias
-                            logger.info(f"API falhou, usando coordenadas aleatórias: {lat_validada}, {lon_validada}")
+                            # Coordenadas da API são inválidas, usar coordenadas aleatórias
+                            logger.info(f"Coordenadas da API inválidas, usando aleatórias: {lat_validada}, {lon_validada}")
                             imovel.latitude = Decimal(str(lat_validada))
                             imovel.longitude = Decimal(str(lon_validada))
                             total['atualizados_aleatorio'] += 1
-                        
-                        imovel.save()
-                        total['invalidos'] += 1
                     else:
-                        total['validos'] += 1
+                        # API falhou, usar coordenadas aleatórias
+                        logger.info(f"API falhou, usando coordenadas aleatórias: {lat_validada}, {lon_validada}")
+                        imovel.latitude = Decimal(str(lat_validada))
+                        imovel.longitude = Decimal(str(lon_validada))
+                        total['atualizados_aleatorio'] += 1
+                    
+                    imovel.save()
+                    total['invalidos'] += 1
                     
                     # Log de progresso a cada 100 imóveis
-                    if (total['validos'] + total['invalidos']) % 100 == 0:
-                        logger.info(f"Progresso: {total['validos'] + total['invalidos']}/{total_imoveis}")
+                    if total['invalidos'] % 100 == 0:
+                        logger.info(f"Progresso: {total['invalidos']}/{len(pks_invalidos)} inválidos corrigidos")
                         
                 except Exception as e:
                     logger.error(f"Erro ao validar imóvel {imovel.codigo}: {str(e)}")
@@ -122,6 +144,11 @@ class RevalidadorCoordenadas:
                     
         except Exception as e:
             logger.error(f"Erro durante a validação: {str(e)}")
+        
+        # Coordenadas corrigidas mudam de célula na grade de clusters do mapa
+        if total['invalidos']:
+            invalidar_tiles(reconstruir_indice_quadkey())
+            incrementar_geracao()
             
         # Relatório final
         logger.info("\n=== Relatório Final ===")
@@ -131,9 +158,11 @@ class RevalidadorCoordenadas:
         logger.info(f"Atualizados via API: {total['atualizados_api']}")
         logger.info(f"Atualizados com coordenadas aleatórias: {total['atualizados_aleatorio']}")
         logger.info(f"Erros: {total['erros']}")
+        self.importador._relatorio_geocodificacao()
 
 def main():
-    revalidador = RevalidadorCoordenadas()
+    semente = os.environ.get('REVALIDACAO_SEMENTE')
+    revalidador = RevalidadorCoordenadas(semente=int(semente) if semente else None)
     revalidador.validar_coordenadas_existentes()
 
 if __name__ == "__main__":
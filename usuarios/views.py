@@ -135,6 +135,7 @@ def get_favoritos(request):
                     'valor': float(f.propriedade.valor) if f.propriedade.valor else None,
                     'desconto': f.propriedade.desconto,
                     'imagem_url': f.propriedade.imagem_url,
+                    'imagem_disponivel': f.propriedade.imagem_disponivel,
                     'data_adicao': f.data_adicao.isoformat(),
                     'link': f.propriedade.link
                 }
@@ -1,11 +1,15 @@
+import os
 import json
 import logging
+import shapely
 from shapely.geometry import Point, Polygon, shape
-from shapely.ops import unary_union
+from shapely.ops import unary_union, triangulate
+from shapely.strtree import STRtree
 import numpy as np
 from difflib import get_close_matches
 import unidecode
 import re
+from propriedades.cache_disco import gravar_atomicamente
 
 # Configuração de logging
 logging.basicConfig(
@@ -19,10 +23,32 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class ValidadorGeografico:
-    def __init__(self, caminho_geojson='importador/data/municipios.geojson'):
-        """Inicializa o validador com o arquivo GeoJSON dos municípios."""
-        self.municipios = self._carregar_geojson(caminho_geojson)
+    # Versão do formato do cache binário; incrementar ao mudar a estrutura dos arquivos
+    VERSAO_CACHE = 2
+
+    def __init__(self, caminho_geojson='importador/data/municipios.geojson', caminho_cache=None, semente=None):
+        """
+        Inicializa o validador com o arquivo GeoJSON dos municípios.
+        
+        As geometrias são lidas de um cache binário (WKB por UF) gerado a partir do
+        GeoJSON e recriado sempre que o arquivo de origem muda. Apenas o índice de
+        nomes e retângulos envolventes é lido na inicialização; a geometria de cada
+        município é carregada sob demanda.
+        
+        Args:
+            semente (int): Semente do gerador de pontos aleatórios, para execuções reproduzíveis
+        """
+        self.caminho_geojson = caminho_geojson
+        self.caminho_cache = caminho_cache or f"{os.path.splitext(caminho_geojson)[0]}.cache"
+        self.geometrias_uf = {}  # UF -> {nome: geometria}, apenas se o cache binário não pôde ser gravado
+        self.indice_cache = self._carregar_indice_cache()
         self.cache_municipios = {}  # Cache para polígonos já processados
+        self.indice_municipios = self._construir_indice_municipios()
+        self.cache_busca_municipios = {}  # Cache de (nome normalizado, UF) -> município encontrado
+        self.arvore_municipios = None  # STRtree dos retângulos envolventes, construída no primeiro uso
+        self.municipios_arvore = []
+        self.cache_amostragem = {}  # Triangulação por município para gerar pontos aleatórios
+        self.rng = np.random.default_rng(semente)
         logger.info("Validador Geográfico inicializado com sucesso")
 
     def _carregar_geojson(self, caminho):
@@ -30,6 +56,77 @@ class ValidadorGeografico:
         with open(caminho, 'r', encoding='utf-8-sig') as f:
             return json.load(f)
 
+    def _assinatura_origem(self):
+        """Identifica a versão do GeoJSON de origem pelo tamanho e data de modificação."""
+        info = os.stat(self.caminho_geojson)
+        return {'versao': self.VERSAO_CACHE, 'tamanho': info.st_size, 'mtime_ns': info.st_mtime_ns}
+
+    def _carregar_indice_cache(self):
+        """Lê o índice do cache binário, recriando o cache se estiver ausente ou desatualizado."""
+        caminho_indice = os.path.join(self.caminho_cache, 'indice.json')
+        try:
+            with open(caminho_indice, 'r', encoding='utf-8') as f:
+                indice = json.load(f)
+            if indice.get('origem') == self._assinatura_origem():
+                return indice
+            logger.info("GeoJSON dos municípios foi alterado; recriando cache binário")
+        except (OSError, ValueError):
+            logger.info("Cache binário dos municípios não encontrado; criando a partir do GeoJSON")
+        return self._construir_cache()
+
+    def _construir_cache(self):
+        """
+        Converte o GeoJSON em um arquivo WKB por UF mais um índice JSON com, para cada
+        município, nome, offset, tamanho e retângulo envolvente.
+        """
+        municipios = self._carregar_geojson(self.caminho_geojson)
+        geometrias_uf = {}
+        for feature in municipios['features']:
+            geometria = shape(feature['geometry'])
+            if not isinstance(geometria, Polygon):  # MultiPolygon ou outro tipo
+                geometria = unary_union(geometria)
+            geometrias_uf.setdefault(feature['properties']['UF'], {}).setdefault(
+                feature['properties']['name'], geometria
+            )
+        
+        indice = {'origem': self._assinatura_origem(), 'ufs': {}}
+        try:
+            os.makedirs(self.caminho_cache, exist_ok=True)
+            for uf, geometrias in geometrias_uf.items():
+                nomes = list(geometrias)
+                blobs = shapely.to_wkb(list(geometrias.values()))
+                limites = shapely.bounds(list(geometrias.values())).tolist()
+                entradas, offset = [], 0
+                for nome, blob, retangulo in zip(nomes, blobs, limites):
+                    entradas.append([nome, offset, len(blob), retangulo])
+                    offset += len(blob)
+                gravar_atomicamente(os.path.join(self.caminho_cache, f'{uf}.wkb'), blobs)
+                indice['ufs'][uf] = entradas
+            gravar_atomicamente(
+                os.path.join(self.caminho_cache, 'indice.json'),
+                json.dumps(indice, ensure_ascii=False).encode('utf-8')
+            )
+            logger.info(f"Cache binário dos municípios criado em {self.caminho_cache}")
+        except OSError as e:
+            # Sem permissão de escrita: mantém as geometrias já convertidas em memória
+            logger.warning(f"Não foi possível gravar o cache binário dos municípios: {str(e)}")
+            indice['ufs'] = {
+                uf: [[nome, 0, 0, list(geometria.bounds)] for nome, geometria in geometrias.items()]
+                for uf, geometrias in geometrias_uf.items()
+            }
+            self.geometrias_uf = geometrias_uf
+        return indice
+
+    def _carregar_geometria(self, municipio):
+        """Lê do cache binário apenas a geometria do município (nome, UF)."""
+        nome, uf = municipio
+        if uf in self.geometrias_uf:
+            return self.geometrias_uf[uf][nome]
+        _, offset, tamanho, _ = self.entradas_municipios[municipio]
+        with open(os.path.join(self.caminho_cache, f'{uf}.wkb'), 'rb') as f:
+            f.seek(offset)
+            return shapely.from_wkb(f.read(tamanho))
+
     def _normalizar_texto(self, texto):
         """Normaliza o texto para comparação."""
         if not texto:
@@ -40,45 +137,180 @@ class ValidadorGeografico:
         texto = re.sub(r'[^A-Z0-9\s]', '', texto)
         return texto
 
+    def _construir_indice_municipios(self):
+        """Agrupa os municípios por UF, indexados pelo nome normalizado."""
+        indice = {}
+        self.entradas_municipios = {}  # (nome, UF) -> entrada do índice do cache binário
+        for uf, entradas in self.indice_cache['ufs'].items():
+            for entrada in entradas:
+                nome = entrada[0]
+                self.entradas_municipios.setdefault((nome, uf), entrada)
+                indice.setdefault(uf, {}).setdefault(self._normalizar_texto(nome), (nome, uf))
+        return indice
+
     def _encontrar_municipio_similar(self, nome_cidade, uf):
-        """Encontra o município mais similar dentro da UF especificada."""
-        nome_normalizado = self._normalizar_texto(nome_cidade)
+        """
+        Encontra o município mais similar dentro da UF especificada.
         
-        # Filtrar municípios da UF
-        municipios_uf = [
-            feature for feature in self.municipios['features']
-            if feature['properties']['UF'] == uf
-        ]
+        Returns:
+            tuple: (nome do município no GeoJSON, UF) ou None
+        """
+        nome_normalizado = self._normalizar_texto(nome_cidade)
+        chave = (nome_normalizado, uf)
+        if chave in self.cache_busca_municipios:
+            return self.cache_busca_municipios[chave]
         
-        # Criar lista de nomes normalizados para comparação
-        nomes_municipios = [self._normalizar_texto(m['properties']['name']) for m in municipios_uf]
+        municipios_uf = self.indice_municipios.get(uf, {})
         
-        # Encontrar o match mais próximo
-        matches = get_close_matches(nome_normalizado, nomes_municipios, n=1, cutoff=0.6)
+        # Caminho rápido: nome idêntico ao do GeoJSON
+        municipio = municipios_uf.get(nome_normalizado)
+        if municipio is None:
+            # Encontrar o match mais próximo
+            matches = get_close_matches(nome_normalizado, list(municipios_uf), n=1, cutoff=0.6)
+            if matches:
+                municipio = municipios_uf[matches[0]]
         
-        if matches:
-            # Encontrar o feature correspondente
-            idx = nomes_municipios.index(matches[0])
-            return municipios_uf[idx]
+        self.cache_busca_municipios[chave] = municipio
+        return municipio
+
+    def _obter_poligono(self, municipio):
+        """Retorna o polígono preparado do município (nome, UF), usando o cache."""
+        if municipio not in self.cache_municipios:
+            poligono = self._carregar_geometria(municipio)
+            shapely.prepare(poligono)  # Acelera contains e as funções vetorizadas (contains_xy)
+            self.cache_municipios[municipio] = poligono
+        return self.cache_municipios[municipio]
+
+    def _obter_arvore(self):
+        """
+        Constrói (uma vez) o índice espacial STRtree sobre os retângulos envolventes dos
+        municípios, lidos do índice do cache, sem carregar nenhum polígono.
+        """
+        if self.arvore_municipios is None:
+            self.municipios_arvore = list(self.entradas_municipios)
+            limites = np.array([self.entradas_municipios[municipio][3] for municipio in self.municipios_arvore])
+            self.arvore_municipios = STRtree(shapely.box(limites[:, 0], limites[:, 1], limites[:, 2], limites[:, 3]))
+            logger.info(f"Índice espacial construído com {len(self.municipios_arvore)} municípios")
+        return self.arvore_municipios
+
+    def municipio_do_ponto(self, lat, lon):
+        """
+        Identifica o município onde a coordenada realmente se encontra.
         
+        Returns:
+            tuple: (nome do município, UF) ou None se o ponto não cair em nenhum município
+        """
+        arvore = self._obter_arvore()
+        ponto = Point(lon, lat)  # GeoJSON usa (lon, lat)
+        # A árvore filtra pelos retângulos envolventes; só os candidatos têm o polígono carregado
+        for indice in arvore.query(ponto):
+            municipio = self.municipios_arvore[indice]
+            if self._obter_poligono(municipio).contains(ponto):
+                return municipio
         return None
 
     def _ponto_dentro_poligono(self, lat, lon, poligono):
-        """Verifica se um ponto está dentro de um polígono."""
+        """Verifica se um ponto está dentro de um polígono (simples ou preparado)."""
         ponto = Point(lon, lat)  # GeoJSON usa (lon, lat)
         return poligono.contains(ponto)
 
-    def _gerar_ponto_aleatorio_no_poligono(self, poligono):
-        """Gera um ponto aleatório dentro do polígono do município."""
-        minx, miny, maxx, maxy = poligono.bounds
+    def validar_lote(self, lats, lons, cidades, ufs):
+        """
+        Valida um lote de coordenadas de uma vez, agrupando os pontos por município.
         
-        while True:
-            lon = np.random.uniform(minx, maxx)
-            lat = np.random.uniform(miny, maxy)
-            ponto = Point(lon, lat)
+        Args:
+            lats (sequence): Latitudes
+            lons (sequence): Longitudes
+            cidades (sequence): Nome da cidade de cada ponto
+            ufs (sequence): UF de cada ponto
             
-            if poligono.contains(ponto):
-                return lat, lon
+        Returns:
+            numpy.ndarray: Máscara booleana, True onde o ponto está dentro do seu município
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        validos = np.zeros(len(lats), dtype=bool)
+        
+        grupos = {}
+        for indice, chave in enumerate(zip(cidades, ufs)):
+            grupos.setdefault(chave, []).append(indice)
+        
+        for (cidade, uf), indices in grupos.items():
+            municipio = self._encontrar_municipio_similar(cidade, uf)
+            if not municipio:
+                logger.error(f"Município não encontrado: {cidade}/{uf} ({len(indices)} pontos)")
+                continue
+            poligono = self._obter_poligono(municipio)
+            indices = np.asarray(indices)
+            validos[indices] = shapely.contains_xy(poligono, lons[indices], lats[indices])
+        
+        return validos
+
+    # Tentativas de rejeição dentro de um pedaço não triangular antes de usar o ponto representativo
+    MAX_TENTATIVAS_AMOSTRAGEM = 50
+
+    def _decompor_em_triangulos(self, poligono):
+        """
+        Decompõe o polígono em pedaços para amostragem uniforme ponderada por área.
+        
+        Returns:
+            list: tuplas (geometria, é_triângulo), cobrindo exatamente o polígono
+        """
+        if hasattr(shapely, 'constrained_delaunay_triangles'):  # Shapely >= 2.1
+            triangulos = shapely.constrained_delaunay_triangles(poligono).geoms
+            return [(triangulo, True) for triangulo in triangulos if triangulo.area > 0]
+        
+        # Delaunay simples cobre o fecho convexo: recortar os triângulos pelo polígono
+        pedacos = []
+        for triangulo in triangulate(poligono):
+            if poligono.covers(triangulo):  # Polígono já preparado em _obter_poligono
+                pedacos.append((triangulo, True))
+            else:
+                recorte = triangulo.intersection(poligono)
+                if recorte.area > 0:
+                    pedacos.append((recorte, False))
+        return pedacos
+
+    def _obter_amostragem(self, municipio):
+        """Retorna (pedaços, áreas acumuladas normalizadas) do município, usando o cache."""
+        if municipio not in self.cache_amostragem:
+            poligono = self._obter_poligono(municipio)
+            pedacos = self._decompor_em_triangulos(poligono)
+            areas = np.cumsum([pedaco.area for pedaco, _ in pedacos])
+            self.cache_amostragem[municipio] = (pedacos, areas / areas[-1])
+        return self.cache_amostragem[municipio]
+
+    def _gerar_ponto_aleatorio_no_municipio(self, municipio):
+        """
+        Gera um ponto aleatório uniforme dentro do polígono do município em tempo limitado.
+        
+        Sorteia um pedaço da triangulação com probabilidade proporcional à área e um
+        ponto uniforme dentro dele (coordenadas baricêntricas), sem depender da fração
+        do retângulo envolvente ocupada pelo município.
+        """
+        pedacos, areas_acumuladas = self._obter_amostragem(municipio)
+        indice = min(int(np.searchsorted(areas_acumuladas, self.rng.random(), side='right')), len(pedacos) - 1)
+        pedaco, eh_triangulo = pedacos[indice]
+        
+        if eh_triangulo:
+            (ax, ay), (bx, by), (cx, cy) = pedaco.exterior.coords[:3]
+            r1, r2 = self.rng.random(2)
+            if r1 + r2 > 1:
+                r1, r2 = 1 - r1, 1 - r2
+            lon = ax + r1 * (bx - ax) + r2 * (cx - ax)
+            lat = ay + r1 * (by - ay) + r2 * (cy - ay)
+            return float(lat), float(lon)
+        
+        # Pedaço recortado: rejeição limitada dentro do seu próprio retângulo envolvente
+        minx, miny, maxx, maxy = pedaco.bounds
+        for _ in range(self.MAX_TENTATIVAS_AMOSTRAGEM):
+            lon = self.rng.uniform(minx, maxx)
+            lat = self.rng.uniform(miny, maxy)
+            if pedaco.contains(Point(lon, lat)):
+                return float(lat), float(lon)
+        
+        ponto = pedaco.representative_point()
+        return ponto.y, ponto.x
 
     def validar_coordenadas(self, lat, lon, cidade, uf):
         """
@@ -100,20 +332,7 @@ class ValidadorGeografico:
                 logger.error(f"Município não encontrado: {cidade}/{uf}")
                 return None, None
 
-            # Criar chave para cache
-            cache_key = f"{cidade}_{uf}"
-            
-            # Verificar se o polígono já está em cache
-            if cache_key not in self.cache_municipios:
-                # Converter geometria para objeto Shapely
-                geometria = shape(municipio['geometry'])
-                if isinstance(geometria, Polygon):
-                    poligono = geometria
-                else:  # MultiPolygon ou outro tipo
-                    poligono = unary_union(geometria)
-                self.cache_municipios[cache_key] = poligono
-            else:
-                poligono = self.cache_municipios[cache_key]
+            poligono = self._obter_poligono(municipio)
 
             # Verificar se as coordenadas estão dentro do município
             if lat is not None and lon is not None:
@@ -121,10 +340,12 @@ class ValidadorGeografico:
                     logger.info(f"Coordenadas {lat}, {lon} válidas para {cidade}/{uf}")
                     return lat, lon
                 else:
-                    logger.warning(f"Coordenadas {lat}, {lon} fora do município {cidade}/{uf}")
+                    encontrado = self.municipio_do_ponto(lat, lon)
+                    local = f"{encontrado[0]}/{encontrado[1]}" if encontrado else "nenhum município"
+                    logger.warning(f"Coordenadas {lat}, {lon} fora do município {cidade}/{uf} (ponto em {local})")
 
             # Gerar novas coordenadas dentro do município
-            nova_lat, nova_lon = self._gerar_ponto_aleatorio_no_poligono(poligono)
+            nova_lat, nova_lon = self._gerar_ponto_aleatorio_no_municipio(municipio)
             logger.info(f"Novas coordenadas geradas para {cidade}/{uf}: {nova_lat}, {nova_lon}")
             return nova_lat, nova_lon
 